@@ -1,4 +1,5 @@
 import os
+import threading
 from flask import Flask
 from dotenv import load_dotenv
 
@@ -31,4 +32,9 @@ def create_app():
         app.register_blueprint(api_bp)
         app.register_blueprint(admin_bp)
 
+        # Build the in-memory search index in the background so the first search is fast
+        if os.environ.get('SEARCH_INDEX_WARMUP', 'true').lower() == 'true':
+            from .datasets.search_index import search_index
+            threading.Thread(target=search_index.refresh, daemon=True).start()
+
         return app
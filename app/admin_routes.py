@@ -4,7 +4,9 @@ import os
 from datetime import datetime
 import uuid
 import functools
-from .cosmos_client import users_container, activities_container
+from .cosmos_client import users_container, users_repository, activities_container
+from .cache import cache_stats
+from . import queries
 
 # Blueprint for admin routes
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -31,8 +33,7 @@ def manage_users():
 @admin_required
 def get_users():
     """API endpoint to get all users for admin"""
-    query = "SELECT c.id, c.username, c.email, c.role, c.status, c._ts FROM c ORDER BY c._ts DESC"
-    users = list(users_container.query_items(query=query, enable_cross_partition_query=True))
+    users = queries.USERS_ALL.items(users_container)
     
     return jsonify({'users': users})
 
@@ -48,21 +49,17 @@ def update_user_status(user_id):
         return jsonify({'error': 'Invalid status'}), 400
     
     # Get the user from users container
-    query = f"SELECT * FROM c WHERE c.id = '{user_id}'"
-    items = list(users_container.query_items(query=query, enable_cross_partition_query=True))
-    
-    if not items:
+    user = users_repository.get(user_id)
+    if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    user = items[0]
-    
     # Don't allow changing admin user status
     if user.get('role') == 'admin':
         return jsonify({'error': 'Cannot change admin user status'}), 403
     
     # Update user status
     user['status'] = new_status
-    users_container.replace_item(item=user['id'], body=user)
+    users_repository.replace(user)
     
     # Log this activity in activities container
     try:
@@ -88,8 +85,7 @@ def get_pending_users():
     """API endpoint to get users pending verification"""
     print(f"get_pending_users called by user: {current_user.username}, role: {current_user.role}")
     
-    query = "SELECT c.id, c.username, c.email, c._ts FROM c WHERE c.status = 'unverified' ORDER BY c._ts DESC"
-    users = list(users_container.query_items(query=query, enable_cross_partition_query=True))
+    users = queries.USERS_BY_STATUS.items(users_container, status='unverified')
     
     print(f"Found {len(users)} pending users")
     
@@ -101,17 +97,13 @@ def get_pending_users():
 def approve_user(user_id):
     """API endpoint to approve a user (set status to active)"""
     # Get the user
-    query = f"SELECT * FROM c WHERE c.id = '{user_id}'"
-    items = list(users_container.query_items(query=query, enable_cross_partition_query=True))
-    
-    if not items:
+    user = users_repository.get(user_id)
+    if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    user = items[0]
-    
     # Update user status to active
     user['status'] = 'active'
-    users_container.replace_item(item=user['id'], body=user)
+    users_repository.replace(user)
     
     # Log this activity in activities container
     try:
@@ -144,14 +136,10 @@ def change_user_password(user_id):
         return jsonify({'success': False, 'error': 'Password must be at least 6 characters long'}), 400
     
     # Get the user
-    query = f"SELECT * FROM c WHERE c.id = '{user_id}'"
-    items = list(users_container.query_items(query=query, enable_cross_partition_query=True))
-    
-    if not items:
+    user = users_repository.get(user_id)
+    if not user:
         return jsonify({'success': False, 'error': 'User not found'}), 404
     
-    user = items[0]
-    
     # Check if user has role 'user' (not admin)
     if user.get('role') != 'user':
         return jsonify({'success': False, 'error': 'Can only change password for users with role "user"'}), 400
@@ -162,7 +150,7 @@ def change_user_password(user_id):
     
     # Update user password
     user['password'] = hashed_password
-    users_container.replace_item(item=user['id'], body=user)
+    users_repository.replace(user)
     
     # Log this activity in activities container
     try:
@@ -183,3 +171,10 @@ def change_user_password(user_id):
         'success': True, 
         'message': f'Password successfully changed for user {user.get("username")}'
     })
+
+@admin_bp.route('/api/cache_stats')
+@login_required
+@admin_required
+def get_cache_stats():
+    """API endpoint to inspect in-process cache hit/miss counters"""
+    return jsonify({'caches': cache_stats()})
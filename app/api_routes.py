@@ -6,9 +6,15 @@ import pytz
 from .api_auth import api_key_required, get_current_api_user
 from .cosmos_client import metadata_container, activities_container
 from .datasets.models import DatasetModel
-from .datasets.files import FileManager
+from .datasets.files import FileManager, tar_files
+from .datasets.upload_sessions import UploadSessionManager
 from .datasets.search import DatasetSearch
+from .datasets.tags import tag_index
+from .datasets import rollups
+from .jobs import JobModel
 from .utils import log_user_activity, validate_dataset_name
+from .pagination import parse_page_size
+from . import queries
 
 # Blueprint for API routes
 api_bp = Blueprint('api', __name__, url_prefix='/api')
@@ -19,8 +25,7 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 @login_required
 def get_recent_datasets():
     """Get the most recently created datasets"""
-    query = "SELECT TOP 5 c.id, c.name, c.description, c.version, c.tags, c.created_at FROM c ORDER BY c._ts DESC"
-    datasets = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
+    datasets = queries.DATASETS_RECENT.items(metadata_container, limit=5)
     
     return jsonify({'datasets': datasets})
 
@@ -29,8 +34,7 @@ def get_recent_datasets():
 def get_activities():
     """Get the most recent activities across all users"""
     browser_timezone = request.args.get('timezone', 'Asia/Calcutta')
-    query = "SELECT TOP 10 c.id, c.timestamp, c.username, c.message, c.activity_type FROM c ORDER BY c._ts DESC"
-    activities = list(activities_container.query_items(query=query, enable_cross_partition_query=True))
+    activities = queries.ACTIVITIES_RECENT.items(activities_container, limit=10)
     
     # Convert timestamp to local timezone
     for activity in activities:
@@ -48,8 +52,7 @@ def get_activities():
 @login_required
 def get_my_datasets():
     """Get the current user's datasets"""
-    query = f"SELECT c.id, c.name, c.version, c.files, c.created_at FROM c WHERE c.created_by = '{current_user.username}' ORDER BY c._ts DESC"
-    datasets = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
+    datasets = queries.DATASETS_BY_CREATOR.items(metadata_container, created_by=current_user.username)
     
     return jsonify({'datasets': datasets})
 
@@ -57,8 +60,7 @@ def get_my_datasets():
 @login_required
 def get_my_activity():
     """Get the current user's activity"""
-    query = f"SELECT TOP 20 c.id, c.timestamp, c.message, c.activity_type FROM c WHERE c.username = '{current_user.username}' ORDER BY c._ts DESC"
-    activities = list(activities_container.query_items(query=query, enable_cross_partition_query=True))
+    activities = queries.ACTIVITIES_BY_USER.items(activities_container, limit=20, username=current_user.username)
     
     return jsonify({'activities': activities})
 
@@ -66,34 +68,16 @@ def get_my_activity():
 @login_required
 def get_tags():
     """Get all tags and their frequency"""
-    query = "SELECT c.tags FROM c"
-    results = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
-    
-    # Count tag frequency
-    tag_counts = {}
-    for result in results:
-        tags = result.get('tags', [])
-        for tag in tags:
-            tag_counts[tag] = tag_counts.get(tag, 0) + 1
-    
-    return jsonify({'tags': tag_counts})
+    return jsonify({'tags': tag_index.counts()})
 
 @api_bp.route('/dataset_stats')
 @login_required
 def get_dataset_stats():
     """Get dataset creation statistics by month"""
-    # Get datasets created in the last 6 months
+    # Served from the monthly rollups covering the last 6 months
     six_months_ago = (datetime.utcnow() - timedelta(days=180)).isoformat()
-    query = f"SELECT c.id, c.created_at FROM c WHERE c.created_at >= '{six_months_ago}'"
-    datasets = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
-    
-    # Group by month
-    months = {}
-    for dataset in datasets:
-        created_at = dataset.get('created_at', '')
-        if created_at:
-            month = created_at[:7]  # Format: YYYY-MM
-            months[month] = months.get(month, 0) + 1
+    months = {bucket['bucket']: bucket['datasets_created']
+              for bucket in rollups.buckets('month', six_months_ago) if bucket.get('datasets_created')}
     
     # Sort by month
     sorted_months = sorted(months.items())
@@ -102,6 +86,26 @@ def get_dataset_stats():
     
     return jsonify({'labels': labels, 'values': values})
 
+@api_bp.route('/lineage')
+@login_required
+def get_lineage():
+    """Get the lineage graph of all datasets"""
+    show_deleted = request.args.get('show_deleted', '').lower() == 'true'
+    nodes, links = DatasetSearch.get_lineage_data(show_deleted)
+    
+    return jsonify({'nodes': nodes, 'links': links})
+
+@api_bp.route('/lineage/<dataset_id>')
+@login_required
+def get_dataset_lineage(dataset_id):
+    """Get the lineage tree of a dataset's version family"""
+    from .utils import get_dataset_lineage_tree
+    tree = get_dataset_lineage_tree(dataset_id)
+    if not tree['nodes']:
+        return jsonify({'error': 'Dataset not found'}), 404
+    
+    return jsonify(tree)
+
 @api_bp.route('/track_activity', methods=['POST'])
 @login_required
 def track_activity():
@@ -128,22 +132,10 @@ def track_activity():
 @login_required
 def get_file_direct_link_api(dataset_id, file_id):
     """Get a direct link to a file with a 5-hour SAS token"""
-    # Get dataset information
-    query = f"SELECT * FROM c WHERE c.id = '{dataset_id}'"
-    items = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
-    
-    if not items:
+    dataset, file_info = FileManager.get_from_dataset(dataset_id, file_id)
+    if not dataset:
         return jsonify({'error': 'Dataset not found'}), 404
     
-    dataset = items[0]
-    
-    # Find the file
-    file_info = None
-    for file in dataset['files']:
-        if file['id'] == file_id:
-            file_info = file
-            break
-    
     if not file_info:
         return jsonify({'error': 'File not found'}), 404
     
@@ -173,15 +165,25 @@ def get_file_direct_link_api(dataset_id, file_id):
 @api_bp.route('/datasets', methods=['GET'])
 @api_key_required
 def api_get_datasets():
-    """API endpoint to get datasets (API key authenticated)"""
+    """API endpoint to get datasets (API key authenticated)
+
+    Results are paged: pass page_size (default 50) and the continuation
+    token returned by the previous call to fetch the next page. Repeat
+    tag=<tag> to only list datasets carrying all of the given tags.
+    """
     user = get_current_api_user()
     
-    query = "SELECT c.id, c.name, c.description, c.version, c.tags, c.created_at, c.created_by FROM c WHERE NOT IS_DEFINED(c.is_deleted) ORDER BY c._ts DESC"
-    datasets = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
+    try:
+        page_size = parse_page_size(request.args.get('page_size'))
+        datasets, continuation = DatasetModel.listing_page(
+            'api', page_size=page_size, continuation=request.args.get('continuation'),
+            tags=request.args.getlist('tag'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     log_user_activity(user.username, 'api_datasets_list', "Listed datasets via API")
     
-    return jsonify({'datasets': datasets, 'count': len(datasets)})
+    return jsonify({'datasets': datasets, 'count': len(datasets), 'continuation': continuation})
 
 @api_bp.route('/datasets', methods=['POST'])
 @api_key_required
@@ -223,7 +225,7 @@ def api_create_dataset():
                 parent_dataset = DatasetModel.get_by_id(data['parent_id'])
                 if parent_dataset:
                     dataset['name'] = f"{dataset['base_name']} v{dataset['version']}"
-                    metadata_container.replace_item(item=dataset['id'], body=dataset)
+                    DatasetModel.update(dataset)
         else:
             dataset_id, dataset = DatasetModel.create(
                 name=data['name'].strip(),
@@ -284,7 +286,12 @@ def api_search_datasets():
     user = get_current_api_user()
     query_text = request.args.get('q', '')
     
-    datasets = DatasetSearch.search(query_text, show_deleted=False)
+    try:
+        page_size = parse_page_size(request.args.get('page_size'))
+        datasets, continuation, total = DatasetSearch.search_page(
+            query_text, show_deleted=False, page_size=page_size, continuation=request.args.get('continuation'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     log_user_activity(
         username=user.username,
@@ -295,7 +302,9 @@ def api_search_datasets():
     return jsonify({
         'datasets': datasets, 
         'count': len(datasets), 
-        'query': query_text
+        'total': total,
+        'query': query_text,
+        'continuation': continuation
     })
 
 @api_bp.route('/datasets/<dataset_id>/files', methods=['POST'])
@@ -325,7 +334,8 @@ def api_upload_file(dataset_id):
             file=file,
             uploaded_by=user.username,
             description=description,
-            tags=tags
+            tags=tags,
+            sha256=request.form.get('sha256')
         )
         
         log_user_activity(
@@ -342,6 +352,8 @@ def api_upload_file(dataset_id):
             'file_id': file_id,
             'filename': file_info['filename'],
             'size': file_info['size_bytes'],
+            'deduplicated': file_info['deduplicated'],
+            'job_id': file_info.get('job_id'),
             'dataset_id': dataset_id
         }), 201
         
@@ -350,17 +362,213 @@ def api_upload_file(dataset_id):
     except Exception as e:
         return jsonify({'error': f'Failed to upload file: {str(e)}'}), 500
 
+@api_bp.route('/datasets/<dataset_id>/files/batch', methods=['POST'])
+@api_key_required
+def api_upload_files(dataset_id):
+    """API endpoint to upload many files to a dataset at once (API key authenticated)
+
+    Send the files as multipart fields named 'files' (or 'file'), or send a
+    tar archive (optionally compressed) as the request body with
+    Content-Type application/x-tar. description and tags apply to every
+    file and may be form fields or query parameters.
+    """
+    user = get_current_api_user()
+    dataset, error = _owned_dataset(dataset_id, user)
+    if error:
+        return error
+    
+    description = request.values.get('description', '')
+    tags = [tag.strip() for tag in request.values.get('tags', '').split(',') if tag.strip()]
+    
+    if request.mimetype in ('application/x-tar', 'application/tar', 'application/gzip', 'application/x-gzip'):
+        files = tar_files(request.stream)
+    else:
+        uploads = request.files.getlist('files') + request.files.getlist('file')
+        if not uploads:
+            return jsonify({'error': 'No files provided'}), 400
+        files = ((upload.filename, upload, upload.content_type) for upload in uploads)
+    
+    try:
+        uploaded, failed = FileManager.upload_many(dataset_id, files, user.username, description, tags)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Failed to upload files: {str(e)}'}), 500
+    
+    if uploaded:
+        message = f"Uploaded {len(uploaded)} files to dataset '{dataset['name']}' via API"
+        if failed:
+            message += f" ({len(failed)} failed)"
+        log_user_activity(
+            username=user.username,
+            activity_type='api_files_uploaded',
+            message=message,
+            dataset_id=dataset_id
+        )
+    
+    results = [{'filename': file_info['filename'], 'success': True, 'file_id': file_info['id'],
+                'size': file_info['size_bytes'], 'deduplicated': file_info['deduplicated'],
+                'job_id': file_info.get('job_id')} for file_info in uploaded]
+    results += [{'filename': failure['filename'], 'success': False, 'error': failure['error']} for failure in failed]
+    status = 201 if not failed else 207 if uploaded else 400
+    
+    return jsonify({
+        'success': not failed,
+        'dataset_id': dataset_id,
+        'uploaded': len(uploaded),
+        'failed': len(failed),
+        'files': results
+    }), status
+
+def _owned_dataset(dataset_id, user):
+    """The dataset an API user may upload to, or an error response"""
+    dataset = DatasetModel.get_by_id(dataset_id)
+    if not dataset:
+        return None, (jsonify({'error': 'Dataset not found'}), 404)
+    
+    if dataset['created_by'] != user.username:
+        return None, (jsonify({'error': 'Permission denied. You can only upload files to your own datasets.'}), 403)
+    
+    return dataset, None
+
+def _upload_session(dataset_id, upload_id, user):
+    """The caller's upload session for a dataset, or an error response"""
+    session = UploadSessionManager.get(upload_id)
+    if not session or session['dataset_id'] != dataset_id or session['created_by'] != user.username:
+        return None, (jsonify({'error': 'Upload not found'}), 404)
+    return session, None
+
+@api_bp.route('/datasets/<dataset_id>/uploads', methods=['POST'])
+@api_key_required
+def api_create_upload(dataset_id):
+    """Start a resumable upload (API key authenticated)
+
+    Send JSON with filename and optionally size_bytes, chunk_size, sha256,
+    content_type, description and tags. Then PUT each chunk's bytes to
+    /chunks/<index> (0-based, in any order and in parallel), check progress
+    with GET, and POST /commit once every chunk is received. When sha256 and
+    size_bytes match a file already uploaded to the dataset's family, the
+    session is returned committed and no chunks need to be sent.
+    """
+    user = get_current_api_user()
+    dataset, error = _owned_dataset(dataset_id, user)
+    if error:
+        return error
+    
+    data = request.get_json(silent=True) or {}
+    tags = data.get('tags') or []
+    tags = [tag.strip() for tag in (tags if isinstance(tags, list) else str(tags).split(',')) if tag.strip()]
+    
+    try:
+        session = UploadSessionManager.create(
+            dataset, data.get('filename', '').strip(), user.username,
+            size_bytes=data.get('size_bytes'), chunk_size=data.get('chunk_size'),
+            content_type=data.get('content_type'), description=data.get('description', ''), tags=tags,
+            sha256=data.get('sha256'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(UploadSessionManager.status(session)), 201
+
+@api_bp.route('/datasets/<dataset_id>/uploads/<upload_id>', methods=['GET'])
+@api_key_required
+def api_get_upload(dataset_id, upload_id):
+    """Progress of a resumable upload: received and missing chunks (API key authenticated)"""
+    session, error = _upload_session(dataset_id, upload_id, get_current_api_user())
+    if error:
+        return error
+    
+    return jsonify(UploadSessionManager.status(session))
+
+@api_bp.route('/datasets/<dataset_id>/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@api_key_required
+def api_put_upload_chunk(dataset_id, upload_id, index):
+    """Upload one chunk of a resumable upload as the raw request body (API key authenticated)"""
+    session, error = _upload_session(dataset_id, upload_id, get_current_api_user())
+    if error:
+        return error
+    
+    try:
+        chunk = UploadSessionManager.put_chunk(session, index, request.stream)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Failed to store chunk: {str(e)}'}), 500
+    
+    return jsonify({'upload_id': upload_id, 'index': index, 'size': chunk['size'], 'sha256': chunk['sha256']})
+
+@api_bp.route('/datasets/<dataset_id>/uploads/<upload_id>/commit', methods=['POST'])
+@api_key_required
+def api_commit_upload(dataset_id, upload_id):
+    """Assemble the chunks of a resumable upload into a dataset file (API key authenticated)"""
+    user = get_current_api_user()
+    dataset, error = _owned_dataset(dataset_id, user)
+    if error:
+        return error
+    session, error = _upload_session(dataset_id, upload_id, user)
+    if error:
+        return error
+    
+    try:
+        file_info = UploadSessionManager.commit(session, dataset)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': f'Failed to commit upload: {str(e)}'}), 500
+    
+    log_user_activity(
+        username=user.username,
+        activity_type='api_file_uploaded',
+        message=f"Uploaded file '{file_info['filename']}' to dataset '{dataset['name']}' via API",
+        dataset_id=dataset_id,
+        file_id=file_info['id']
+    )
+    
+    return jsonify({
+        'success': True,
+        'message': 'File uploaded successfully',
+        'file_id': file_info['id'],
+        'filename': file_info['filename'],
+        'size': file_info['size_bytes'],
+        'deduplicated': file_info['deduplicated'],
+        'job_id': file_info.get('job_id'),
+        'dataset_id': dataset_id
+    }), 201
+
+@api_bp.route('/datasets/<dataset_id>/uploads/<upload_id>', methods=['DELETE'])
+@api_key_required
+def api_abort_upload(dataset_id, upload_id):
+    """Abandon a resumable upload (API key authenticated)"""
+    session, error = _upload_session(dataset_id, upload_id, get_current_api_user())
+    if error:
+        return error
+    
+    try:
+        UploadSessionManager.abort(session)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    
+    return jsonify({'success': True, 'upload_id': upload_id})
+
 @api_bp.route('/datasets/<dataset_id>/files', methods=['GET'])
 @api_key_required
 def api_list_files(dataset_id):
-    """API endpoint to list files in a dataset (API key authenticated)"""
+    """API endpoint to list files in a dataset (API key authenticated)
+
+    Results are paged like /api/datasets: pass page_size and the
+    continuation token returned by the previous call.
+    """
     user = get_current_api_user()
     
     dataset = DatasetModel.get_by_id(dataset_id)
     if not dataset:
         return jsonify({'error': 'Dataset not found'}), 404
     
-    files = dataset.get('files', [])
+    try:
+        page_size = parse_page_size(request.args.get('page_size'))
+        files, continuation = FileManager.list_page(dataset, page_size, request.args.get('continuation'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     log_user_activity(
         username=user.username,
@@ -373,7 +581,9 @@ def api_list_files(dataset_id):
         'dataset_id': dataset_id,
         'dataset_name': dataset['name'],
         'files': files,
-        'file_count': len(files)
+        'count': len(files),
+        'file_count': dataset.get('file_count', len(dataset.get('files') or [])),
+        'continuation': continuation
     })
 
 @api_bp.route('/datasets/<dataset_id>/files/<file_id>/download', methods=['GET'])
@@ -409,3 +619,37 @@ def api_download_file(dataset_id, file_id):
         'valid_hours': 1,
         'expires_at': (datetime.utcnow() + timedelta(hours=1)).isoformat()
     })
+
+@api_bp.route('/jobs', methods=['GET'])
+@api_key_required
+def api_list_jobs():
+    """API endpoint to list the caller's background jobs, newest first (API key authenticated)
+
+    Filter with status (queued, running, succeeded, failed) and dataset_id;
+    results are paged like /api/datasets.
+    """
+    user = get_current_api_user()
+    
+    try:
+        page_size = parse_page_size(request.args.get('page_size'))
+        jobs, continuation = JobModel.list_page(
+            user.username, status=request.args.get('status'), dataset_id=request.args.get('dataset_id'),
+            page_size=page_size, continuation=request.args.get('continuation'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'jobs': [JobModel.status(job) for job in jobs],
+        'count': len(jobs),
+        'continuation': continuation
+    })
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+@api_key_required
+def api_get_job(job_id):
+    """API endpoint to get the status of a background job (API key authenticated)"""
+    job = JobModel.get(job_id)
+    if not job or job.get('created_by') != get_current_api_user().username:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(JobModel.status(job))
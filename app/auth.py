@@ -3,7 +3,8 @@ from flask_login import LoginManager, UserMixin, login_user, logout_user, login_
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
 import os
-from .cosmos_client import users_container
+from .cosmos_client import users_container, users_repository
+from . import queries
 
 # Initialize login manager
 login_manager = LoginManager()
@@ -25,13 +26,10 @@ class User(UserMixin):
 @login_manager.user_loader
 def load_user(user_id):
     # Query the user from users container (no type filter needed)
-    query = f"SELECT * FROM c WHERE c.id = '{user_id}'"
-    items = list(users_container.query_items(query=query, enable_cross_partition_query=True))
-    
-    if not items:
+    user_data = users_repository.get(user_id)
+    if not user_data:
         return None
     
-    user_data = items[0]
     return User(
         id=user_data['id'],
         username=user_data['username'],
@@ -44,8 +42,7 @@ def load_user(user_id):
 
 def get_user_by_api_key(api_key):
     """Get user by API key"""
-    query = f"SELECT * FROM c WHERE c.api_key = '{api_key}'"
-    items = list(users_container.query_items(query=query, enable_cross_partition_query=True))
+    items = queries.USER_BY_API_KEY.items(users_container, api_key=api_key)
     
     if not items:
         return None
@@ -67,15 +64,12 @@ def generate_new_api_key(user_id):
     new_api_key = str(uuid.uuid4())
     
     # Get the user
-    query = f"SELECT * FROM c WHERE c.id = '{user_id}'"
-    items = list(users_container.query_items(query=query, enable_cross_partition_query=True))
-    
-    if not items:
+    user = users_repository.get(user_id)
+    if not user:
         return None
     
-    user = items[0]
     user['api_key'] = new_api_key
-    users_container.replace_item(item=user['id'], body=user)
+    users_repository.replace(user)
     
     return new_api_key
 
@@ -87,8 +81,7 @@ def login():
         password = request.form.get('password')
         
         # Query the user from users container
-        query = f"SELECT * FROM c WHERE c.username = '{username}'"
-        items = list(users_container.query_items(query=query, enable_cross_partition_query=True))
+        items = queries.USER_BY_USERNAME.items(users_container, username=username)
         
         if not items or not check_password_hash(items[0]['password'], password):
             flash('Please check your login details and try again.')
@@ -134,8 +127,7 @@ def signup():
         password = request.form.get('password')
         
         # Check if user already exists in users container
-        query = f"SELECT * FROM c WHERE c.username = '{username}' OR c.email = '{email}'"
-        items = list(users_container.query_items(query=query, enable_cross_partition_query=True))
+        items = queries.USER_BY_USERNAME_OR_EMAIL.items(users_container, username=username, email=email)
         
         if items:
             flash('Username or Email already exists')
@@ -1,6 +1,6 @@
 from flask import render_template, current_app as app, request, jsonify, redirect, url_for, flash
 from flask_login import current_user, login_required, logout_user, login_user
-from .cosmos_client import users_container, activities_container
+from .cosmos_client import users_repository, activities_container
 import uuid
 from datetime import datetime
 
@@ -26,13 +26,10 @@ def change_password():
         return jsonify({'success': False, 'error': 'New password must be at least 6 characters long'}), 400
     
     # Get the current user from users container
-    query = f"SELECT * FROM c WHERE c.id = '{current_user.id}'"
-    items = list(users_container.query_items(query=query, enable_cross_partition_query=True))
-    
-    if not items:
+    user = users_repository.get(current_user.id)
+    if not user:
         return jsonify({'success': False, 'error': 'User not found'}), 404
     
-    user = items[0]
     
     # Verify current password
     from werkzeug.security import check_password_hash, generate_password_hash
@@ -44,7 +41,7 @@ def change_password():
     
     # Update user password
     user['password'] = hashed_password
-    users_container.replace_item(item=user['id'], body=user)
+    users_repository.replace(user)
     
     # Log this activity in activities container
     try:
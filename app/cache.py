@@ -0,0 +1,99 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+# Named caches, exposed through cache_stats()
+_registry = {}
+
+
+class TTLCache:
+    """Thread-safe in-process cache with a size limit, per-entry TTL and LRU eviction.
+
+    Values are deep-copied on the way in and out so callers can mutate what
+    they get back (routes routinely edit dataset documents in place).
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=30, copy_values=True):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.copy_values = copy_values
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # End-to-end lookup timings reported by callers through observe()
+        self._timings = {'hit': [0, 0.0], 'miss': [0, 0.0]}
+        _registry[name] = self
+
+    def _copy(self, value):
+        return copy.deepcopy(value) if self.copy_values else value
+
+    def get(self, key, default=None):
+        """Return a cached value, or default when missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if self.ttl is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return self._copy(value)
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries when full"""
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        value = self._copy(value)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Drop a single entry"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._data.clear()
+
+    def observe(self, hit, seconds):
+        """Record how long a request served from (or missing) this cache took"""
+        with self._lock:
+            timing = self._timings['hit' if hit else 'miss']
+            timing[0] += 1
+            timing[1] += seconds
+
+    def stats(self):
+        """Size, hit/miss counters and average observed latencies"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            latency = {f'avg_{kind}_ms': round(total * 1000 / count, 3)
+                       for kind, (count, total) in self._timings.items() if count}
+            return {
+                'name': self.name,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                **latency
+            }
+
+
+def cache_stats():
+    """Statistics for every named cache in this process"""
+    return [cache.stats() for cache in _registry.values()]
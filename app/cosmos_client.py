@@ -1,19 +1,46 @@
 import os
-from azure.cosmos import CosmosClient
+from .repository import ContainerRepository
+from .storage import is_local_backend, local_database_path
 
 # Azure Configuration
 ENDPOINT = os.environ.get("COSMOSDB_ENDPOINT")
 KEY = os.environ.get("COSMOSDB_KEY")
-DATABASE_NAME = os.environ.get("COSMOSDB_DATABASE")
-USERS_CONTAINER_NAME = os.environ.get("COSMOSDB_USERS_CONTAINER")
-METADATA_CONTAINER_NAME = os.environ.get("COSMOSDB_METADATA_CONTAINER")
-ACTIVITIES_CONTAINER_NAME = os.environ.get("COSMOSDB_ACTIVITIES_CONTAINER")
+DATABASE_NAME = os.environ.get("COSMOSDB_DATABASE", "datacatalog")
+USERS_CONTAINER_NAME = os.environ.get("COSMOSDB_USERS_CONTAINER", "users")
+METADATA_CONTAINER_NAME = os.environ.get("COSMOSDB_METADATA_CONTAINER", "metadata")
+ACTIVITIES_CONTAINER_NAME = os.environ.get("COSMOSDB_ACTIVITIES_CONTAINER", "activities")
+# Small bookkeeping documents (counters, indexes), partitioned on /id
+STATE_CONTAINER_NAME = os.environ.get("COSMOSDB_STATE_CONTAINER", "catalog_state")
+# Background jobs run by worker.py, partitioned on /id
+JOBS_CONTAINER_NAME = os.environ.get("COSMOSDB_JOBS_CONTAINER", "jobs")
 
-# Initialize CosmosDB client
-client = CosmosClient(ENDPOINT, credential=KEY)
+# Partition key paths (read from the container properties when not set)
+USERS_PARTITION_KEY = os.environ.get("COSMOSDB_USERS_PARTITION_KEY")
+METADATA_PARTITION_KEY = os.environ.get("COSMOSDB_METADATA_PARTITION_KEY")
+
+# Initialize CosmosDB client (or the local SQLite stand-in)
+if is_local_backend():
+    from .storage.local_cosmos import LocalCosmosClient
+    client = LocalCosmosClient(local_database_path(), partition_keys={
+        USERS_CONTAINER_NAME: USERS_PARTITION_KEY or '/id',
+        # Same partitioning as init_db.py provisions, so local runs take the production paths
+        METADATA_CONTAINER_NAME: METADATA_PARTITION_KEY or '/type',
+        ACTIVITIES_CONTAINER_NAME: '/id',
+        STATE_CONTAINER_NAME: '/id',
+        JOBS_CONTAINER_NAME: '/id',
+    })
+else:
+    from azure.cosmos import CosmosClient
+    client = CosmosClient(ENDPOINT, credential=KEY)
 database = client.get_database_client(DATABASE_NAME)
 
 # Container clients
 users_container = database.get_container_client(USERS_CONTAINER_NAME)
 metadata_container = database.get_container_client(METADATA_CONTAINER_NAME)
 activities_container = database.get_container_client(ACTIVITIES_CONTAINER_NAME)
+state_container = database.get_container_client(STATE_CONTAINER_NAME)
+jobs_container = database.get_container_client(JOBS_CONTAINER_NAME)
+
+# Partition-aware repositories for id lookups
+users_repository = ContainerRepository(users_container, USERS_PARTITION_KEY)
+metadata_repository = ContainerRepository(metadata_container, METADATA_PARTITION_KEY)
@@ -0,0 +1,63 @@
+from azure.cosmos import exceptions
+from .cosmos_client import state_container
+
+
+def next_value(counter_id, seed=None, **fields):
+    """Atomically increment a counter document and return the new value
+
+    The increment is a single server-side patch, so concurrent callers never
+    get the same number. A missing counter is created starting after seed()
+    (0 when no seed is given); if another caller creates it first we retry
+    the increment.
+    """
+    while True:
+        try:
+            counter = state_container.patch_item(
+                item=counter_id,
+                partition_key=counter_id,
+                patch_operations=[{'op': 'incr', 'path': '/current', 'value': 1}]
+            )
+            return counter['current']
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+
+        value = (seed() if seed else 0) + 1
+        try:
+            state_container.create_item({'id': counter_id, 'doc_type': 'counter', 'current': value, **fields})
+            return value
+        except exceptions.CosmosResourceExistsError:
+            continue
+
+
+def advance(counter_id, value, **fields):
+    """Move a counter forward to at least value (for explicitly chosen numbers)"""
+    value = int(value)
+    try:
+        state_container.create_item({'id': counter_id, 'doc_type': 'counter', 'current': value, **fields})
+        return
+    except exceptions.CosmosResourceExistsError:
+        pass
+    try:
+        state_container.patch_item(
+            item=counter_id,
+            partition_key=counter_id,
+            patch_operations=[{'op': 'set', 'path': '/current', 'value': value}],
+            filter_predicate=f"FROM c WHERE c.current < {value}"
+        )
+    except exceptions.CosmosAccessConditionFailedError:
+        # Already at or past value
+        pass
+
+
+def increment(doc_id, amounts, **fields):
+    """Atomically add amounts ({field: delta}) to a counter document, creating it if needed"""
+    operations = [{'op': 'incr', 'path': f'/{field}', 'value': amount} for field, amount in amounts.items()]
+    while True:
+        try:
+            return state_container.patch_item(item=doc_id, partition_key=doc_id, patch_operations=operations)
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+        try:
+            return state_container.create_item({'id': doc_id, **fields, **amounts})
+        except exceptions.CosmosResourceExistsError:
+            continue
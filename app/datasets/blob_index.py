@@ -0,0 +1,109 @@
+"""
+Content hash -> blob index for upload deduplication.
+
+Each distinct file content (by SHA-256) is stored in one blob. A 'blob'
+document in the state container maps the hash to that blob and counts the
+file records referencing it, so an upload of content already in the catalog
+only adds a reference instead of a second copy.
+"""
+from datetime import datetime
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+from ..cosmos_client import state_container
+from .. import queries
+from ..utils import blob_service_client, AZURE_BLOB_CONTAINER
+
+
+def _doc_id(sha256):
+    return f"blob:{sha256}"
+
+
+def _add_reference(sha256, size_bytes=None):
+    """Take one more reference on an indexed blob; None when it is not indexed (or being released)"""
+    doc_id = _doc_id(sha256)
+    predicate = queries.PREDICATE_BLOB_REFERENCED
+    if size_bytes is not None:
+        predicate += f" AND c.size_bytes = {int(size_bytes)}"
+    try:
+        return state_container.patch_item(
+            item=doc_id, partition_key=doc_id,
+            patch_operations=[{'op': 'incr', 'path': '/refcount', 'value': 1}],
+            filter_predicate=predicate)
+    except (exceptions.CosmosResourceNotFoundError, exceptions.CosmosAccessConditionFailedError):
+        return None
+
+
+def reuse(sha256, size_bytes=None):
+    """Reference stored content by hash alone (no bytes transferred); returns the blob document or None"""
+    if not sha256:
+        return None
+    return _add_reference(sha256.lower(), size_bytes)
+
+
+def acquire(sha256, size_bytes, blob_path):
+    """Index a freshly uploaded blob, or reference the copy already stored
+
+    Returns the blob path the file should point to. When the content was
+    already stored the fresh upload is deleted.
+    """
+    document = _add_reference(sha256, size_bytes)
+    if document is None:
+        try:
+            state_container.create_item({
+                'id': _doc_id(sha256), 'doc_type': 'blob', 'sha256': sha256, 'size_bytes': size_bytes,
+                'blob_path': blob_path, 'refcount': 1, 'created_at': datetime.utcnow().isoformat()})
+            return blob_path
+        except exceptions.CosmosResourceExistsError:
+            # Indexed concurrently (or being released): reference it if we still can
+            document = _add_reference(sha256, size_bytes)
+            if document is None:
+                return blob_path
+
+    if document['blob_path'] != blob_path:
+        try:
+            blob_service_client.get_blob_client(container=AZURE_BLOB_CONTAINER, blob=blob_path).delete_blob()
+        except Exception:
+            # An orphaned duplicate only costs storage
+            pass
+    return document['blob_path']
+
+
+def profile(sha256):
+    """The profile kept for indexed content, or None"""
+    doc_id = _doc_id(sha256)
+    try:
+        return state_container.read_item(item=doc_id, partition_key=doc_id).get('profile')
+    except exceptions.CosmosResourceNotFoundError:
+        return None
+
+
+def set_profile(sha256, profile):
+    """Keep a content profile on the index so later copies of the content get it without re-parsing"""
+    doc_id = _doc_id(sha256)
+    try:
+        state_container.patch_item(item=doc_id, partition_key=doc_id,
+                                   patch_operations=[{'op': 'set', 'path': '/profile', 'value': profile}])
+    except exceptions.CosmosResourceNotFoundError:
+        pass
+
+
+def release(sha256):
+    """Drop one reference; the blob and its index entry are deleted with the last one"""
+    doc_id = _doc_id(sha256)
+    try:
+        document = state_container.patch_item(
+            item=doc_id, partition_key=doc_id,
+            patch_operations=[{'op': 'incr', 'path': '/refcount', 'value': -1}])
+    except exceptions.CosmosResourceNotFoundError:
+        return
+    if document['refcount'] > 0:
+        return
+    try:
+        state_container.delete_item(item=doc_id, partition_key=doc_id, etag=document['_etag'],
+                                    match_condition=MatchConditions.IfNotModified)
+    except (exceptions.CosmosResourceNotFoundError, exceptions.CosmosAccessConditionFailedError):
+        return
+    try:
+        blob_service_client.get_blob_client(container=AZURE_BLOB_CONTAINER, blob=document['blob_path']).delete_blob()
+    except Exception:
+        pass
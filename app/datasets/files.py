@@ -3,16 +3,76 @@ from datetime import datetime
 from azure.storage.blob import BlobServiceClient
 import os
 import io
-from ..cosmos_client import metadata_container
+import mimetypes
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ..cosmos_client import metadata_container, metadata_repository
+from ..pagination import DEFAULT_PAGE_SIZE
+from .. import queries
 from ..utils import blob_service_client, AZURE_BLOB_CONTAINER
 from .models import DatasetModel
+from . import rollups
+from . import blob_index
+from .uploads import BlockUploader, stream_sha256
+from .profiling import profile_format
+from ..jobs import JobModel
+
+# Parallel blob uploads per bulk upload request, and the most files one request may carry
+UPLOAD_BATCH_CONCURRENCY = int(os.environ.get("UPLOAD_BATCH_CONCURRENCY", "4"))
+UPLOAD_BATCH_MAX_FILES = int(os.environ.get("UPLOAD_BATCH_MAX_FILES", "1000"))
+# Tar members larger than this are spooled to disk rather than memory
+TAR_SPOOL_SIZE = 8 * 1024 * 1024
+
+# Bookkeeping fields of a file record that are not part of the file metadata
+RECORD_FIELDS = ('doc_type', 'dataset_id', 'base_name')
+
+class TarArchiveError(ValueError):
+    """A tar stream that could not be read to the end
+
+    filename is the member that was being read when it broke, if any.
+    """
+
+    def __init__(self, message, filename=None):
+        super().__init__(message)
+        self.filename = filename
+
+def tar_files(stream):
+    """Yield (filename, stream, content_type) for the regular files of a (possibly compressed) tar stream
+
+    The archive is read front to back; each member is spooled to a temporary
+    file (in memory while small) so it can be uploaded while the next is read.
+    A damaged archive raises TarArchiveError after the members read before it.
+    """
+    name = None
+    try:
+        with tarfile.open(fileobj=stream, mode='r|*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                name = posixpath.normpath(member.name).lstrip('/')
+                spooled = tempfile.SpooledTemporaryFile(max_size=TAR_SPOOL_SIZE)
+                shutil.copyfileobj(archive.extractfile(member), spooled)
+                spooled.seek(0)
+                yield name, spooled, mimetypes.guess_type(name)[0]
+                name = None
+    except tarfile.TarError as e:
+        raise TarArchiveError(f'Invalid tar archive: {e}', name)
 
 class FileManager:
     """Handle file operations for datasets"""
     
     @staticmethod
-    def upload_to_dataset(dataset_id, file, uploaded_by, description='', tags=None):
-        """Upload file to dataset"""
+    def upload_to_dataset(dataset_id, file, uploaded_by, description='', tags=None, sha256=None):
+        """Upload file to dataset
+
+        When the caller gives the file's sha256, the upload is checked against
+        it (a mismatch is rejected), and content that is already stored is
+        recorded without storing the upload again.
+        """
         dataset = DatasetModel.get_by_id(dataset_id)
         if not dataset:
             raise ValueError('Dataset not found')
@@ -20,47 +80,221 @@ class FileManager:
         if not file or file.filename == '':
             raise ValueError('No file provided')
         
-        # Generate file paths
-        filename = file.filename
+        content_type = getattr(file, 'content_type', None)
+        sha256 = sha256.strip().lower() if sha256 else None
+        stored = FileManager._reuse_upload(file, sha256, content_type) if sha256 else None
+        if stored is None:
+            stored = FileManager._store(dataset, file.filename, file, content_type)
+            if sha256 and stored['sha256'] != sha256:
+                blob_index.release(stored['sha256'])
+                raise ValueError('Uploaded content does not match the declared sha256')
+        
+        file_info = FileManager.register(dataset, stored, uploaded_by, description, tags)
+        return file_info['id'], file_info
+    
+    @staticmethod
+    def _reuse_upload(file, sha256, content_type=None):
+        """The stored blob for an upload whose content is already in the catalog, or None
+
+        The upload is hashed first, so only content the caller actually sent
+        is reused; a stream that cannot be rewound is left to _store.
+        """
+        stream = getattr(file, 'stream', file)
+        if not getattr(stream, 'seekable', lambda: False)():
+            return None
+        start = stream.tell()
+        size_bytes, actual = stream_sha256(stream)
+        stream.seek(start)
+        if actual != sha256:
+            raise ValueError('Uploaded content does not match the declared sha256')
+        document = blob_index.reuse(actual, size_bytes)
+        return FileManager._reference(file.filename, document, content_type) if document else None
+    
+    @staticmethod
+    def upload_many(dataset_id, files, uploaded_by, description='', tags=None):
+        """Upload several files to a dataset in parallel and record them together
+
+        files yields (filename, stream, content_type). Blobs are uploaded on a
+        pool of UPLOAD_BATCH_CONCURRENCY threads; the files that made it are
+        then recorded on the dataset in one write. A tar archive that breaks
+        partway is reported as one more failure after the files read before
+        it. Returns (file infos of the uploaded files, [{'filename', 'error'}]
+        for the ones that failed).
+        """
+        dataset = DatasetModel.get_by_id(dataset_id)
+        if not dataset:
+            raise ValueError('Dataset not found')
+        
+        # Bound the streams waiting for a worker (tar members are spooled while they wait)
+        slots = threading.BoundedSemaphore(UPLOAD_BATCH_CONCURRENCY * 2)
+        
+        def upload(filename, stream, content_type):
+            try:
+                return FileManager._store(dataset, filename, stream, content_type)
+            finally:
+                slots.release()
+        
+        pending = []
+        failed = []
+        with ThreadPoolExecutor(max_workers=UPLOAD_BATCH_CONCURRENCY) as pool:
+            try:
+                for filename, stream, content_type in files:
+                    if len(pending) >= UPLOAD_BATCH_MAX_FILES:
+                        failed.append({'filename': filename, 'error': f'At most {UPLOAD_BATCH_MAX_FILES} files per request'})
+                        continue
+                    slots.acquire()
+                    pending.append((filename, pool.submit(upload, filename, stream, content_type)))
+            except TarArchiveError as e:
+                # Blobs already stored hold blob index references, so record them anyway
+                failed.append({'filename': e.filename or 'archive', 'error': str(e)})
+        
+        stored_files = []
+        for filename, future in pending:
+            try:
+                stored_files.append(future.result())
+            except Exception as e:
+                failed.append({'filename': filename, 'error': str(e)})
+        
+        if not stored_files:
+            return [], failed
+        file_infos = FileManager._record(dataset, stored_files, uploaded_by, description, tags)
+        return file_infos, failed
+    
+    @staticmethod
+    def _store(dataset, filename, stream, content_type=None):
+        """Stream a new file's content to blob storage, deduplicated by content hash
+
+        Returns the stored blob as {'id', 'filename', 'blob_path', 'size_bytes',
+        'content_type', 'sha256', 'deduplicated'}.
+        """
+        if not filename:
+            raise ValueError('No file provided')
         file_id = str(uuid.uuid4())
-        blob_path = f"{dataset['base_name']}/{dataset['version']}/{file_id}_{filename}"
+        blob_path = FileManager.blob_path(dataset, file_id, filename)
+        content_type = content_type or 'application/octet-stream'
         
-        # Upload to blob storage
+        # Stream to blob storage in blocks, measuring size and checksum on the way
         blob_client = blob_service_client.get_blob_client(container=AZURE_BLOB_CONTAINER, blob=blob_path)
-        file.seek(0)
-        blob_client.upload_blob(file.read(), overwrite=True)
+        size_bytes, sha256 = BlockUploader(blob_client).upload(stream, content_type)
         
-        # Calculate file size
-        file.seek(0, io.SEEK_END)
-        size_bytes = file.tell()
-        file.seek(0)
-        size_kb = size_bytes / 1024
-        
-        # Create file metadata
+        stored_path = blob_index.acquire(sha256, size_bytes, blob_path)
+        return {'id': file_id, 'filename': filename, 'blob_path': stored_path, 'size_bytes': size_bytes,
+                'content_type': content_type, 'sha256': sha256, 'deduplicated': stored_path != blob_path}
+    
+    @staticmethod
+    def reuse(dataset, filename, sha256, size_bytes, content_type=None):
+        """A stored blob for a new file known only by its hash and size, or None
+
+        Without the bytes the hash cannot be checked, so it is only honoured
+        for content already uploaded to the same dataset family (with the same
+        size); anything else has to be sent.
+        """
+        if not filename or not sha256 or size_bytes is None:
+            return None
+        if not queries.FAMILY_FILE_WITH_CONTENT.items(
+                metadata_container, partition_key=DatasetModel._partition_hint(dataset['base_name']),
+                base_name=dataset['base_name'], sha256=sha256, size_bytes=size_bytes):
+            return None
+        document = blob_index.reuse(sha256, size_bytes)
+        return FileManager._reference(filename, document, content_type) if document else None
+    
+    @staticmethod
+    def _reference(filename, document, content_type=None):
+        """A new file pointing at the blob of a blob index document"""
+        return {'id': str(uuid.uuid4()), 'filename': filename, 'blob_path': document['blob_path'],
+                'size_bytes': document['size_bytes'], 'content_type': content_type or 'application/octet-stream',
+                'sha256': document['sha256'], 'deduplicated': True, 'profile': document.get('profile')}
+    
+    @staticmethod
+    def blob_path(dataset, file_id, filename):
+        """Blob path of a new file in a dataset version"""
+        return f"{dataset['base_name']}/{dataset['version']}/{file_id}_{filename}"
+    
+    @staticmethod
+    def _describe(stored, uploaded_by, description='', tags=None):
+        """File metadata for a stored blob"""
         file_info = {
-            'id': file_id,
-            'filename': filename,
-            'blob_path': blob_path,
+            'id': stored['id'],
+            'filename': stored['filename'],
+            'blob_path': stored['blob_path'],
             'uploaded_by': uploaded_by,
             'uploaded_at': datetime.utcnow().isoformat(),
-            'size_bytes': size_bytes,
-            'size_kb': round(size_kb, 2),
-            'content_type': getattr(file, 'content_type', 'application/octet-stream'),
+            'size_bytes': stored['size_bytes'],
+            'size_kb': round(stored['size_bytes'] / 1024, 2),
+            'content_type': stored['content_type'],
             'description': description,
             'tags': tags or []
         }
+        if stored.get('sha256'):
+            file_info['sha256'] = stored['sha256']
+        if stored.get('profile'):
+            file_info['profile'] = stored['profile']
+        return file_info
+    
+    @staticmethod
+    def _record(dataset, stored_files, uploaded_by, description='', tags=None):
+        """Record stored blobs as files of the dataset; returns their file infos"""
+        file_infos = [FileManager._describe(stored, uploaded_by, description, tags) for stored in stored_files]
+        try:
+            records = DatasetModel.add_files(dataset, file_infos)
+        except Exception:
+            for stored in stored_files:
+                if stored.get('sha256'):
+                    blob_index.release(stored['sha256'])
+            raise
+        rollups.record(file_infos[-1]['uploaded_at'], uploaded_by, files_uploaded=len(file_infos),
+                       bytes_uploaded=sum(file_info['size_bytes'] for file_info in file_infos))
         
-        # Update dataset
-        if 'files' not in dataset:
-            dataset['files'] = []
-        
-        dataset['files'].append(file_info)
-        dataset['updated_at'] = datetime.utcnow().isoformat()
-        dataset['updated_by'] = uploaded_by
-        
-        DatasetModel.update(dataset)
-        
-        return file_id, file_info
+        results = []
+        for record, stored in zip(records, stored_files):
+            file_info = dict(FileManager._file_info(record), deduplicated=stored['deduplicated'])
+            job_id = FileManager._queue_profile(dataset, file_info)
+            if job_id:
+                file_info['job_id'] = job_id
+            results.append(file_info)
+        return results
+    
+    @staticmethod
+    def _queue_profile(dataset, file_info):
+        """Queue the profiling of a new tabular file; returns the job id, if one was queued"""
+        if file_info.get('profile') or not profile_format(file_info['filename']):
+            return None
+        try:
+            job = JobModel.enqueue('profile_file', {'dataset_id': dataset['id'], 'file_id': file_info['id']},
+                                   created_by=file_info['uploaded_by'], dataset_id=dataset['id'])
+        except Exception:
+            # The file is stored either way; it just goes without a profile
+            return None
+        return job['id']
+    
+    @staticmethod
+    def set_profile(dataset, file_id, profile):
+        """Store a profile on a file record"""
+        return metadata_repository.patch({'id': file_id, 'base_name': dataset['base_name']},
+                                         [{'op': 'set', 'path': '/profile', 'value': profile}])
+    
+    @staticmethod
+    def register(dataset, stored, uploaded_by, description='', tags=None):
+        """Record a stored blob as a file of the dataset; returns the file info"""
+        return FileManager._record(dataset, [stored], uploaded_by, description, tags)[0]
+    
+    @staticmethod
+    def _file_info(record):
+        """The file metadata of a stored file record"""
+        return {key: value for key, value in record.items()
+                if key not in RECORD_FIELDS and not key.startswith('_')}
+    
+    @staticmethod
+    def list_page(dataset, page_size=DEFAULT_PAGE_SIZE, continuation=None):
+        """One page of a dataset's files, oldest first, as (files, continuation)"""
+        records, next_continuation = queries.DATASET_FILES.page(
+            metadata_container, page_size, continuation,
+            partition_key=DatasetModel._partition_hint(dataset.get('base_name')), dataset_id=dataset['id'])
+        files = [FileManager._file_info(record) for record in records]
+        if not continuation and dataset.get('files'):
+            # Files embedded in the dataset before migrate_files.py was run
+            files = [dict(file_info) for file_info in dataset['files']] + files
+        return files, next_continuation
     
     @staticmethod
     def get_from_dataset(dataset_id, file_id):
@@ -69,8 +303,12 @@ class FileManager:
         if not dataset:
             return None, None
         
-        for file_info in dataset.get('files', []):
+        for file_info in dataset.get('files') or []:
             if file_info['id'] == file_id:
                 return dataset, file_info
         
+        record = metadata_repository.get(file_id, partition_key=DatasetModel._partition_hint(dataset['base_name']))
+        if record and record.get('doc_type') == 'file' and record.get('dataset_id') == dataset_id:
+            return dataset, FileManager._file_info(record)
+        
         return dataset, None
@@ -0,0 +1,192 @@
+import json
+import os
+import threading
+import time
+from ..cosmos_client import metadata_container, DATABASE_NAME, METADATA_CONTAINER_NAME
+from ..storage import STORAGE_BACKEND
+from .. import queries
+
+LINEAGE_SNAPSHOT_PATH = os.environ.get("LINEAGE_SNAPSHOT_PATH", os.path.join('.cache', 'lineage_snapshot.json'))
+# How often to pick up changes written by other workers, and to persist the snapshot
+LINEAGE_REFRESH_SECONDS = float(os.environ.get("LINEAGE_REFRESH_SECONDS", "10"))
+LINEAGE_SNAPSHOT_SECONDS = float(os.environ.get("LINEAGE_SNAPSHOT_SECONDS", "60"))
+
+NODE_FIELDS = ('id', 'name', 'version', 'base_name', 'parent_id', 'tags', 'is_deleted')
+
+
+class LineageGraph:
+    """Materialized version graph of every dataset
+
+    Holds one node per dataset plus parent -> children adjacency lists and
+    base_name -> member sets. The graph is loaded once (from the persisted
+    snapshot when available), updated incrementally by DatasetModel writes,
+    and caught up with writes from other processes by an inexpensive
+    ``c._ts >= watermark`` delta query at most every LINEAGE_REFRESH_SECONDS.
+    """
+
+    def __init__(self, container, snapshot_path=LINEAGE_SNAPSHOT_PATH):
+        self.container = container
+        self.snapshot_path = snapshot_path
+        self.source = f"{STORAGE_BACKEND}:{DATABASE_NAME}/{METADATA_CONTAINER_NAME}"
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._nodes = {}
+        self._children = {}
+        self._families = {}
+        self._watermark = 0
+        self._generation = 0
+        self._views = {}
+        self._last_refresh = 0
+        self._last_snapshot = 0
+        self._snapshot_generation = 0
+
+    # -- maintenance --
+
+    def _add(self, document):
+        """Insert or update a node; returns False if it was already current"""
+        node = {field: document[field] for field in NODE_FIELDS if document.get(field) is not None}
+        node.setdefault('tags', [])
+        if not node.get('is_deleted'):
+            node.pop('is_deleted', None)
+
+        previous = self._nodes.get(node['id'])
+        if previous == node:
+            return False
+        if previous:
+            self._remove_edges(previous)
+
+        self._nodes[node['id']] = node
+        if node.get('parent_id'):
+            self._children.setdefault(node['parent_id'], set()).add(node['id'])
+        self._families.setdefault(node.get('base_name', node['name']), set()).add(node['id'])
+
+        self._generation += 1
+        self._views.clear()
+        return True
+
+    def _remove_edges(self, node):
+        if node.get('parent_id') in self._children:
+            self._children[node['parent_id']].discard(node['id'])
+        family = self._families.get(node.get('base_name', node['name']))
+        if family is not None:
+            family.discard(node['id'])
+
+    def apply(self, dataset):
+        """Record a created, updated, deleted or restored dataset"""
+        with self._lock:
+            if self._loaded:
+                self._add(dataset)
+
+    def _query(self, since):
+        return queries.DATASET_LINEAGE_CHANGED_SINCE.iterate(self.container, since=since)
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as handle:
+                snapshot = json.load(handle)
+        except (OSError, ValueError):
+            return False
+        if snapshot.get('source') != self.source:
+            return False
+        for node in snapshot.get('nodes', []):
+            self._add(node)
+        self._watermark = snapshot.get('watermark', 0)
+        self._snapshot_generation = self._generation
+        return True
+
+    def save_snapshot(self):
+        """Persist the graph so the next process start skips the full scan"""
+        with self._lock:
+            snapshot = {
+                'source': self.source,
+                'watermark': self._watermark,
+                'nodes': list(self._nodes.values())
+            }
+            generation = self._generation
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as handle:
+            json.dump(snapshot, handle)
+        os.replace(temp_path, self.snapshot_path)
+        with self._lock:
+            self._snapshot_generation = generation
+            self._last_snapshot = time.monotonic()
+
+    def refresh(self, force=False):
+        """Load the graph on first use, then apply changes made since the watermark"""
+        now = time.monotonic()
+        with self._lock:
+            if self._loaded and not force and now - self._last_refresh < LINEAGE_REFRESH_SECONDS:
+                return
+            if not self._loaded:
+                self._load_snapshot()
+            since = self._watermark
+            self._last_refresh = now
+
+        # _ts has one-second resolution, so re-read the watermark second itself.
+        # Only the delta query moves the watermark: a local write (apply) can be
+        # newer than writes other workers made since the last refresh.
+        changes = list(self._query(since))
+        with self._lock:
+            for document in changes:
+                self._add(document)
+                self._watermark = max(self._watermark, document.get('_ts', 0))
+            self._loaded = True
+            dirty = self._generation != self._snapshot_generation
+            due = time.monotonic() - self._last_snapshot >= LINEAGE_SNAPSHOT_SECONDS
+
+        if dirty and (due or since == 0):
+            try:
+                self.save_snapshot()
+            except OSError:
+                # The snapshot is only an optimization
+                pass
+
+    # -- queries --
+
+    def nodes_and_links(self, show_deleted=False):
+        """All nodes and parent -> child links, built once per graph generation"""
+        self.refresh()
+        with self._lock:
+            key = ('all', show_deleted)
+            if key not in self._views:
+                nodes = [dict(node) for node in self._nodes.values()
+                         if show_deleted or not node.get('is_deleted')]
+                visible = {node['id'] for node in nodes}
+                links = [{'source': node['parent_id'], 'target': node['id']}
+                         for node in nodes if node.get('parent_id') in visible]
+                for node in nodes:
+                    node.pop('parent_id', None)
+                self._views[key] = (nodes, links)
+            return self._views[key]
+
+    def family(self, base_name):
+        """Nodes and links for one dataset family"""
+        self.refresh()
+        with self._lock:
+            key = ('family', base_name)
+            if key not in self._views:
+                members = [self._nodes[node_id] for node_id in self._families.get(base_name, ())]
+                nodes = [{'id': node['id'], 'name': node['name'], 'version': node.get('version'),
+                          'tags': node.get('tags', [])} for node in members]
+                links = [{'source': node['parent_id'], 'target': node['id'], 'type': 'version'}
+                         for node in members if node.get('parent_id')]
+                self._views[key] = {'nodes': nodes, 'links': links}
+            return self._views[key]
+
+    def children(self, dataset_id):
+        """Ids of the direct descendants of a dataset"""
+        self.refresh()
+        with self._lock:
+            return sorted(self._children.get(dataset_id, ()))
+
+    def get(self, dataset_id):
+        """The lineage node for a dataset id, if known"""
+        self.refresh()
+        with self._lock:
+            node = self._nodes.get(dataset_id)
+            return dict(node) if node else None
+
+
+lineage_graph = LineageGraph(metadata_container)
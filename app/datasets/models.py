@@ -1,17 +1,72 @@
+import os
 import uuid
 from datetime import datetime
-from ..cosmos_client import metadata_container
+from azure.cosmos import exceptions
+from ..cache import TTLCache
+from .. import counters
+from ..cosmos_client import metadata_container, metadata_repository
+from ..pagination import DEFAULT_PAGE_SIZE
+from .. import queries
+from .lineage import lineage_graph
+from .tags import tag_index
+from .search_index import search_index
+from . import rollups
 from ..utils import validate_dataset_name, sanitize_dataset_name
 
+# Read-through caches for dataset documents and version lists, invalidated on writes
+METADATA_CACHE_SIZE = int(os.environ.get("METADATA_CACHE_SIZE", "2048"))
+METADATA_CACHE_TTL = float(os.environ.get("METADATA_CACHE_TTL", "30"))
+
+_dataset_cache = TTLCache('datasets', maxsize=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL)
+_versions_cache = TTLCache('dataset_versions', maxsize=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL)
+
+# Most operations Cosmos accepts in one transactional batch
+TRANSACTIONAL_BATCH_LIMIT = 100
+
 class DatasetModel:
     """Dataset data access and business logic"""
+
+    # Fields rendered by list/search views (see queries.DATASET_SUMMARY_FIELDS)
+    SUMMARY_PROJECTION = queries.DATASET_SUMMARY_FIELDS
     
     @staticmethod
-    def get_by_id(dataset_id):
-        """Get dataset by ID"""
-        query = f"SELECT * FROM c WHERE c.id = '{dataset_id}'"
-        items = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
-        return items[0] if items else None
+    def get_by_id(dataset_id, base_name=None, use_cache=True):
+        """Get dataset by ID (base_name is an optional partition key hint)
+
+        Pass use_cache=False before a read-modify-write so the write starts
+        from the current document.
+        """
+        dataset = _dataset_cache.get(dataset_id) if use_cache else None
+        if dataset is None:
+            dataset = metadata_repository.get(dataset_id, partition_key=DatasetModel._partition_hint(base_name))
+            if dataset and dataset.get('doc_type'):
+                # A file record, not a dataset
+                return None
+            if dataset:
+                _dataset_cache.set(dataset_id, dataset)
+        return dataset
+
+    @staticmethod
+    def _partition_hint(base_name):
+        """Use base_name as a point-read hint when the container is partitioned on it"""
+        if base_name and metadata_repository.partition_key_path == '/base_name':
+            return base_name
+        return None
+
+    @staticmethod
+    def _invalidate(dataset):
+        """Drop cached copies of a dataset and its family's version list"""
+        _dataset_cache.delete(dataset['id'])
+        if dataset.get('base_name'):
+            _versions_cache.delete(dataset['base_name'])
+
+    @staticmethod
+    def _after_write(dataset):
+        """Keep caches and derived structures in step with a written dataset"""
+        DatasetModel._invalidate(dataset)
+        lineage_graph.apply(dataset)
+        tag_index.apply(dataset)
+        search_index.apply(dataset)
     
     @staticmethod
     def create(name, description, tags, created_by, version=None, parent_id=None, base_name=None):
@@ -23,8 +78,7 @@ class DatasetModel:
                 raise ValueError(f"Invalid dataset name: {error_message}")
             
             # Check for name conflicts when creating brand new datasets
-            query = f"SELECT * FROM c WHERE c.name = '{name}' AND NOT IS_DEFINED(c.is_deleted)"
-            existing_datasets = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
+            existing_datasets = queries.DATASETS_ACTIVE_BY_NAME.items(metadata_container, name=name)
             
             if existing_datasets:
                 raise ValueError(f"A dataset with the name '{name}' already exists")
@@ -39,13 +93,11 @@ class DatasetModel:
                     raise ValueError('Parent dataset not found')
                 base_name = parent_dataset['base_name']
             
-            # Auto-generate version number
+            # Allocate the version number from the family's counter
             if version is None:
-                query = f"SELECT c.version FROM c WHERE c.base_name = '{base_name}'"
-                version_items = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
-                versions = [item['version'] for item in version_items if 'version' in item]
-                max_version = max(versions) if versions else 0
-                version = max_version + 1
+                version = DatasetModel.next_version(base_name)
+            else:
+                counters.advance(DatasetModel._version_counter_id(base_name), version, base_name=base_name)
             
             # For versioned datasets, construct the name with version
             name = f"{base_name} v{version}"
@@ -58,72 +110,186 @@ class DatasetModel:
             'base_name': base_name,
             'description': description,
             'tags': tags,
+            'tags_norm': DatasetModel.normalize_tags(tags),
             'version': version,
             'is_production': False,
             'created_by': created_by,
             'created_at': datetime.utcnow().isoformat(),
-            'files': [],
+            'file_count': 0,
+            'total_size_bytes': 0,
             'parent_id': parent_id
         }
         
-        metadata_container.create_item(body=dataset)
+        metadata_repository.create(dataset)
+        DatasetModel._after_write(dataset)
+        rollups.record(dataset['created_at'], created_by, datasets_created=1)
         return dataset_id, dataset
     
+    @staticmethod
+    def _version_counter_id(base_name):
+        return f"version:{base_name}"
+
+    @staticmethod
+    def _max_version(base_name):
+        """Highest stored version of a family (seeds counters for existing data)"""
+        result = [value for value in queries.DATASET_FAMILY_MAX_VERSION.items(
+            metadata_container, partition_key=DatasetModel._partition_hint(base_name), base_name=base_name)
+            if value is not None]
+        return max(result) if result else 0
+
+    @staticmethod
+    def next_version(base_name):
+        """Reserve the next version number of a dataset family"""
+        return counters.next_value(
+            DatasetModel._version_counter_id(base_name),
+            seed=lambda: DatasetModel._max_version(base_name),
+            base_name=base_name
+        )
+    
     @staticmethod
     def list_all(show_deleted=False):
         """List all datasets"""
-        if show_deleted:
-            query = "SELECT * FROM c ORDER BY c._ts DESC"
-        else:
-            query = "SELECT * FROM c WHERE NOT IS_DEFINED(c.is_deleted) ORDER BY c._ts DESC"
-        
-        return list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
+        return queries.dataset_listing('full', show_deleted).items(metadata_container)
+
+    @staticmethod
+    def normalize_tags(tags):
+        """Lowercase, de-duplicated tags stored as tags_norm for indexed tag filters"""
+        return sorted({tag.strip().lower() for tag in tags or [] if isinstance(tag, str) and tag.strip()})
+    
+    @staticmethod
+    def list_page(show_deleted=False, page_size=DEFAULT_PAGE_SIZE, continuation=None, summary=False, tags=None):
+        """List one page of datasets, newest first
+
+        Returns (datasets, continuation) where continuation is the opaque
+        token for the next page, or None on the last page. With summary=True
+        only SUMMARY_PROJECTION fields are returned; tags restricts the page
+        to datasets carrying all of them.
+        """
+        return DatasetModel.listing_page('summary' if summary else 'full', show_deleted, page_size, continuation, tags)
+    
+    @staticmethod
+    def listing_page(projection, show_deleted=False, page_size=DEFAULT_PAGE_SIZE, continuation=None, tags=None):
+        """One page of a queries.dataset_listing query; tags match case-insensitively via tags_norm"""
+        tags = DatasetModel.normalize_tags(tags)
+        template = queries.dataset_listing(projection, show_deleted, len(tags))
+        return template.page(metadata_container, page_size, continuation, **queries.tag_values(tags))
     
     @staticmethod
     def get_versions(base_name):
         """Get all versions of a dataset"""
-        query = f"SELECT * FROM c WHERE c.base_name = '{base_name}' ORDER BY c.version DESC"
-        return list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
+        versions = _versions_cache.get(base_name)
+        if versions is not None:
+            return versions
+        
+        versions = queries.DATASET_FAMILY.items(
+            metadata_container, partition_key=DatasetModel._partition_hint(base_name), base_name=base_name)
+        for version in versions:
+            metadata_repository.remember(version)
+        _versions_cache.set(base_name, versions)
+        return versions
     
     @staticmethod
     def get_lineage(dataset):
-        """Get lineage information for a dataset"""
+        """Get lineage information for a dataset
+
+        Every ancestor shares the dataset's base_name, so the whole family is
+        fetched in one query and the parent chain is walked in memory.
+        """
+        family = {version['id']: version for version in DatasetModel.get_versions(dataset['base_name'])}
+        
         lineage = []
+        seen = {dataset['id']}
         current = dataset
-        while current.get('parent_id'):
-            query = f"SELECT * FROM c WHERE c.id = '{current['parent_id']}'"
-            parent_items = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
-            if parent_items:
-                parent = parent_items[0]
-                lineage.append(parent)
-                current = parent
-            else:
+        while current.get('parent_id') and current['parent_id'] not in seen:
+            parent = family.get(current['parent_id'])
+            if parent is None:
+                # Parent outside the family (legacy data): fall back to a point read
+                parent = DatasetModel.get_by_id(current['parent_id'], current.get('base_name'))
+            if not parent:
                 break
+            lineage.append(parent)
+            seen.add(parent['id'])
+            current = parent
         return lineage
     
     @staticmethod
     def update(dataset):
-        """Update a dataset"""
-        metadata_container.replace_item(item=dataset['id'], body=dataset)
-    
+        """Update a dataset, refusing to overwrite a newer version of the document"""
+        dataset['tags_norm'] = DatasetModel.normalize_tags(dataset.get('tags'))
+        try:
+            metadata_repository.replace(dataset, etag=dataset.get('_etag'))
+        except exceptions.CosmosAccessConditionFailedError:
+            DatasetModel._invalidate(dataset)
+            raise ValueError('Dataset was modified by someone else, please try again')
+        DatasetModel._after_write(dataset)
+
+    @staticmethod
+    def add_file(dataset, file_info):
+        """Store a file record next to its dataset and bump the dataset's file totals"""
+        return DatasetModel.add_files(dataset, [file_info])[0]
+
+    @staticmethod
+    def add_files(dataset, file_infos):
+        """Store file records next to their dataset and bump the dataset's file totals
+
+        Each file is its own record, so an upload writes the same small documents
+        however many files the dataset already has. Returns the stored records.
+        """
+        records = [dict(file_info, doc_type='file', dataset_id=dataset['id'], base_name=dataset['base_name'])
+                   for file_info in file_infos]
+        if not records:
+            return []
+
+        def totals(group):
+            return [
+                {'op': 'incr', 'path': '/file_count', 'value': len(group)},
+                {'op': 'incr', 'path': '/total_size_bytes', 'value': sum(record['size_bytes'] for record in group)},
+                {'op': 'set', 'path': '/updated_at', 'value': group[-1]['uploaded_at']},
+                {'op': 'set', 'path': '/updated_by', 'value': group[-1]['uploaded_by']}
+            ]
+
+        written = []
+        if metadata_repository.partition_key_path == '/base_name':
+            # Records and totals live in the family's partition: each group of records
+            # is written with its share of the totals in one transactional batch
+            size = TRANSACTIONAL_BATCH_LIMIT - 1
+            for start in range(0, len(records), size):
+                group = records[start:start + size]
+                operations = [('create', (record,)) for record in group]
+                operations.append(('patch', (dataset['id'], totals(group))))
+                try:
+                    result = metadata_repository.batch(dataset['base_name'], operations)
+                except exceptions.CosmosBatchOperationError:
+                    DatasetModel._invalidate(dataset)
+                    raise ValueError('Dataset not found')
+                written.extend(result[:-1])
+                dataset = result[-1]
+        else:
+            written = [metadata_repository.create(record) for record in records]
+            dataset = metadata_repository.patch(dataset, totals(records))
+        DatasetModel._after_write(dataset)
+        return written
+
     @staticmethod
     def soft_delete(dataset_id, deleted_by):
         """Soft delete a dataset"""
-        dataset = DatasetModel.get_by_id(dataset_id)
+        dataset = DatasetModel.get_by_id(dataset_id, use_cache=False)
         if not dataset:
             raise ValueError('Dataset not found')
         
-        dataset['is_deleted'] = True
-        dataset['deleted_by'] = deleted_by
-        dataset['deleted_at'] = datetime.utcnow().isoformat()
-        
-        metadata_container.upsert_item(dataset)
+        # Patch only the deletion fields, so counters updated by a concurrent upload are kept
+        dataset = metadata_repository.patch(dataset, [
+            {'op': 'set', 'path': '/is_deleted', 'value': True},
+            {'op': 'set', 'path': '/deleted_by', 'value': deleted_by},
+            {'op': 'set', 'path': '/deleted_at', 'value': datetime.utcnow().isoformat()}
+        ])
+        DatasetModel._after_write(dataset)
         return dataset
     
     @staticmethod
     def restore(dataset_id):
         """Restore a soft-deleted dataset"""
-        dataset = DatasetModel.get_by_id(dataset_id)
+        dataset = DatasetModel.get_by_id(dataset_id, use_cache=False)
         if not dataset:
             raise ValueError('Dataset not found')
         
@@ -131,63 +297,82 @@ class DatasetModel:
             raise ValueError('Dataset is not deleted')
         
         # Remove deletion fields
-        del dataset['is_deleted']
-        if 'deleted_by' in dataset:
-            del dataset['deleted_by']
-        if 'deleted_at' in dataset:
-            del dataset['deleted_at']
-        
-        metadata_container.upsert_item(dataset)
+        operations = [{'op': 'remove', 'path': f'/{field}'}
+                      for field in ('is_deleted', 'deleted_by', 'deleted_at') if field in dataset]
+        try:
+            dataset = metadata_repository.patch(dataset, operations, filter_predicate=queries.PREDICATE_IS_DELETED)
+        except exceptions.CosmosAccessConditionFailedError:
+            DatasetModel._invalidate(dataset)
+            raise ValueError('Dataset is not deleted')
+        DatasetModel._after_write(dataset)
         return dataset
     
     @staticmethod
     def set_production(dataset_id, is_production, user):
         """Set or unset production status"""
-        dataset = DatasetModel.get_by_id(dataset_id)
+        dataset = DatasetModel.get_by_id(dataset_id, use_cache=False)
         if not dataset:
             raise ValueError('Dataset not found')
         
         if dataset.get('is_deleted', False):
             raise ValueError('Cannot set production status on deleted datasets')
         
-        if is_production:
-            # Remove production status from other versions
-            query = f"SELECT * FROM c WHERE c.base_name = '{dataset['base_name']}' AND c.is_production = true"
-            production_datasets = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
-            
-            for prod_dataset in production_datasets:
-                if prod_dataset['id'] != dataset_id:
-                    prod_dataset['is_production'] = False
-                    if 'production_set_by' in prod_dataset:
-                        del prod_dataset['production_set_by']
-                    if 'production_set_at' in prod_dataset:
-                        del prod_dataset['production_set_at']
-                    metadata_container.upsert_item(prod_dataset)
-            
-            # Set current dataset as production
-            dataset['is_production'] = True
-            dataset['production_set_by'] = user
-            dataset['production_set_at'] = datetime.utcnow().isoformat()
+        if not is_production:
+            dataset = metadata_repository.patch(dataset, DatasetModel._production_patch(dataset, False))
+            DatasetModel._after_write(dataset)
+            return dataset
+
+        # Demote the family's current production versions and promote this one together
+        base_name = dataset['base_name']
+        partition_key = DatasetModel._partition_hint(base_name)
+        demoted = queries.DATASET_FAMILY_OTHER_PRODUCTION.items(
+            metadata_container, partition_key=partition_key, base_name=base_name, id=dataset_id)
+
+        changes = [(document, DatasetModel._production_patch(document, False), queries.PREDICATE_IS_PRODUCTION)
+                   for document in demoted]
+        changes.append((dataset, DatasetModel._production_patch(dataset, True, user), queries.PREDICATE_NOT_DELETED))
+
+        if partition_key is not None:
+            # The whole family shares a partition: one all-or-nothing transactional batch
+            operations = [('patch', (document['id'], patch), {'filter_predicate': condition})
+                          for document, patch, condition in changes]
+            try:
+                written = metadata_repository.batch(partition_key, operations)
+            except exceptions.CosmosBatchOperationError:
+                for document, _, _ in changes:
+                    DatasetModel._invalidate(document)
+                raise ValueError('Dataset was modified by someone else, please try again')
         else:
-            dataset['is_production'] = False
-            if 'production_set_by' in dataset:
-                del dataset['production_set_by']
-            if 'production_set_at' in dataset:
-                del dataset['production_set_at']
-        
-        metadata_container.upsert_item(dataset)
-        return dataset
+            # Versions may live in different partitions, so patch them one at a time;
+            # demotions go first so a failure never leaves two production versions
+            written = []
+            for document, patch, condition in changes:
+                try:
+                    written.append(metadata_repository.patch(document, patch, filter_predicate=condition))
+                except exceptions.CosmosAccessConditionFailedError:
+                    DatasetModel._invalidate(document)
+                    raise ValueError('Dataset was modified by someone else, please try again')
+
+        for document in written:
+            DatasetModel._after_write(document)
+        return written[-1]
+
+    @staticmethod
+    def _production_patch(dataset, is_production, user=None):
+        """Patch operations that set or clear a dataset's production flag"""
+        if is_production:
+            return [
+                {'op': 'set', 'path': '/is_production', 'value': True},
+                {'op': 'set', 'path': '/production_set_by', 'value': user},
+                {'op': 'set', 'path': '/production_set_at', 'value': datetime.utcnow().isoformat()}
+            ]
+        operations = [{'op': 'set', 'path': '/is_production', 'value': False}]
+        for field in ('production_set_by', 'production_set_at'):
+            if field in dataset:
+                operations.append({'op': 'remove', 'path': f'/{field}'})
+        return operations
     
     @staticmethod
     def get_all_tags():
         """Get all unique tags used in datasets"""
-        query = "SELECT c.tags FROM c WHERE NOT IS_DEFINED(c.is_deleted)"
-        datasets = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
-        
-        all_tags = set()
-        for dataset in datasets:
-            tags = dataset.get('tags', [])
-            for tag in tags:
-                all_tags.add(tag.strip())
-        
-        return sorted(list(all_tags))
+        return tag_index.tags()
@@ -0,0 +1,265 @@
+"""
+Streaming profiles of tabular files (CSV/TSV, JSON lines, Excel, Parquet).
+
+The file is read in chunks of PROFILE_CHUNK_ROWS rows and each chunk is
+folded into per-column accumulators with vectorized pandas/NumPy operations,
+so memory stays bounded by the chunk size whatever the file size. The result
+is a small JSON-serializable dict stored on the file record:
+
+    {'format', 'row_count', 'column_count', 'columns': [{'name', 'type',
+     'null_count', 'min', 'max', 'distinct_approx'}], 'profiled_at'}
+"""
+import os
+import tempfile
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Rows per parsed chunk, and the most columns profiled per file
+PROFILE_CHUNK_ROWS = int(os.environ.get("PROFILE_CHUNK_ROWS", "50000"))
+PROFILE_MAX_COLUMNS = int(os.environ.get("PROFILE_MAX_COLUMNS", "200"))
+# Longest string kept for a min/max value
+MAX_VALUE_LENGTH = 100
+
+FORMATS = {
+    '.csv': 'csv',
+    '.tsv': 'tsv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.xlsx': 'excel',
+    '.xlsm': 'excel',
+    '.parquet': 'parquet',
+}
+
+
+def profile_format(filename):
+    """Profile format for a file name, or None when the type is not profiled"""
+    return FORMATS.get(os.path.splitext(filename or '')[1].lower())
+
+
+class HyperLogLog:
+    """Approximate distinct counter (2**precision registers, ~1.04/sqrt(2**precision) error)"""
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        """Fold an array of uint64 hashes into the registers"""
+        if not len(hashes):
+            return
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.int64)
+        rest = hashes & np.uint64((1 << width) - 1)
+        # rank = leading zeros in the remaining bits + 1; frexp is exact below 2**53
+        _, bit_length = np.frexp(rest.astype(np.float64))
+        rank = np.where(rest == 0, width + 1, width - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def add(self, series):
+        """Fold the non-null values of a pandas Series"""
+        self.add_hashes(pd.util.hash_pandas_object(series, index=False).to_numpy())
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+def _kind(series):
+    if pd.api.types.is_bool_dtype(series):
+        return 'boolean'
+    if pd.api.types.is_integer_dtype(series):
+        return 'integer'
+    if pd.api.types.is_float_dtype(series):
+        return 'float'
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'datetime'
+    return 'string'
+
+
+def _plain(value):
+    """A JSON-friendly version of a min/max value"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, (np.bool_, bool)):
+        return bool(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat()
+    return str(value)[:MAX_VALUE_LENGTH]
+
+
+class ColumnProfile:
+    """Running statistics of one column"""
+
+    # When chunks disagree on a column's type, the wider one wins
+    WIDENING = {('integer', 'float'): 'float', ('float', 'integer'): 'float'}
+
+    def __init__(self, name):
+        self.name = name
+        self.kind = None
+        self.null_count = 0
+        self.minimum = None
+        self.maximum = None
+        self.distinct = HyperLogLog()
+
+    def update(self, series):
+        kind = _kind(series)
+        if self.kind is None:
+            self.kind = kind
+        elif kind != self.kind:
+            self.kind = self.WIDENING.get((self.kind, kind), 'string')
+
+        values = series.dropna()
+        self.null_count += len(series) - len(values)
+        if values.empty:
+            return
+        self.distinct.add(values)
+
+        if kind == 'string':
+            values = values.astype(str)
+        low, high = values.min(), values.max()
+        if self.kind == 'string':
+            low, high = str(low), str(high)
+            if self.minimum is not None:
+                low, high = min(low, str(self.minimum)), max(high, str(self.maximum))
+        elif self.minimum is not None:
+            low, high = min(low, self.minimum), max(high, self.maximum)
+        self.minimum, self.maximum = low, high
+
+    def result(self):
+        return {
+            'name': str(self.name),
+            'type': self.kind or 'string',
+            'null_count': int(self.null_count),
+            'min': _plain(self.minimum),
+            'max': _plain(self.maximum),
+            'distinct_approx': self.distinct.count()
+        }
+
+
+class Profiler:
+    """Fold DataFrame chunks into a file profile"""
+
+    def __init__(self, file_format):
+        self.file_format = file_format
+        self.row_count = 0
+        self.columns = {}
+        self.column_count = 0
+
+    def update(self, chunk):
+        self.row_count += len(chunk)
+        self.column_count = max(self.column_count, len(chunk.columns))
+        for name in list(chunk.columns)[:PROFILE_MAX_COLUMNS]:
+            if name not in self.columns:
+                self.columns[name] = ColumnProfile(name)
+            self.columns[name].update(chunk[name])
+
+    def result(self):
+        return {
+            'format': self.file_format,
+            'row_count': int(self.row_count),
+            'column_count': int(self.column_count),
+            'columns': [column.result() for column in self.columns.values()],
+            'profiled_at': datetime.utcnow().isoformat()
+        }
+
+
+def _excel_chunks(stream):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        names = [str(name) if name is not None else f'column_{index + 1}' for index, name in enumerate(header)]
+        batch = []
+        for row in rows:
+            batch.append(row[:len(names)])
+            if len(batch) >= PROFILE_CHUNK_ROWS:
+                yield pd.DataFrame.from_records(batch, columns=names).infer_objects()
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=names).infer_objects()
+    finally:
+        workbook.close()
+
+
+def _parquet_chunks(stream):
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(stream).iter_batches(batch_size=PROFILE_CHUNK_ROWS):
+        yield batch.to_pandas()
+
+
+def _chunks(stream, file_format):
+    if file_format in ('csv', 'tsv'):
+        return pd.read_csv(stream, sep='\t' if file_format == 'tsv' else ',', chunksize=PROFILE_CHUNK_ROWS,
+                           low_memory=True)
+    if file_format == 'jsonl':
+        return pd.read_json(stream, lines=True, chunksize=PROFILE_CHUNK_ROWS)
+    if file_format == 'excel':
+        return _excel_chunks(stream)
+    return _parquet_chunks(stream)
+
+
+def profile_stream(stream, filename):
+    """Profile a readable binary stream (seekable for Excel/Parquet); None when the type is not profiled"""
+    file_format = profile_format(filename)
+    if file_format is None:
+        return None
+    profiler = Profiler(file_format)
+    for chunk in _chunks(stream, file_format):
+        profiler.update(chunk)
+    return profiler.result()
+
+
+class _ChunkReader:
+    """Minimal read-only file object over an iterator of byte chunks"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+        self._offset = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) - self._offset < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer = self._buffer[self._offset:] + chunk
+            self._offset = 0
+        end = len(self._buffer) if size < 0 else self._offset + size
+        data = self._buffer[self._offset:end]
+        self._offset = min(end, len(self._buffer))
+        return data
+
+
+def profile_blob(blob_client, filename):
+    """Profile a stored blob, streaming it (Excel/Parquet are spooled to a temporary file first)"""
+    file_format = profile_format(filename)
+    if file_format is None:
+        return None
+    downloader = blob_client.download_blob()
+    if file_format in ('excel', 'parquet'):
+        with tempfile.TemporaryFile() as spooled:
+            downloader.readinto(spooled)
+            spooled.seek(0)
+            return profile_stream(spooled, filename)
+    return profile_stream(_ChunkReader(downloader.chunks()), filename)
+
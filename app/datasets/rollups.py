@@ -0,0 +1,86 @@
+import hashlib
+from ..cosmos_client import metadata_container, state_container
+from .. import counters
+from .. import queries
+
+# Counters kept per bucket
+METRICS = ('datasets_created', 'files_uploaded', 'bytes_uploaded')
+# Bucket granularity -> length of the ISO timestamp prefix that names the bucket
+PERIODS = {'day': 10, 'month': 7}
+
+
+def _scopes(user):
+    return ('all', f'user:{user}') if user else ('all',)
+
+
+def _doc_id(period, bucket, scope):
+    # Usernames may contain characters Cosmos does not allow in ids
+    key = scope if scope == 'all' else hashlib.sha1(scope.encode('utf-8')).hexdigest()
+    return f"rollup:{period}:{bucket}:{key}"
+
+
+def _document(period, bucket, scope, totals):
+    document = {'id': _doc_id(period, bucket, scope), 'doc_type': 'rollup',
+                'period': period, 'bucket': bucket, 'scope': scope}
+    document.update({metric: totals.get(metric, 0) for metric in METRICS})
+    return document
+
+
+def record(timestamp, user=None, **amounts):
+    """Add metric amounts to the day and month buckets of an ISO timestamp
+
+    Each bucket is kept for the whole catalog and for the user. Updates are
+    single patch increments; a failed update is skipped rather than failing
+    the write it describes (run backfill_rollups.py to repair drift).
+    """
+    for period, length in PERIODS.items():
+        bucket = timestamp[:length]
+        for scope in _scopes(user):
+            try:
+                counters.increment(_doc_id(period, bucket, scope), amounts,
+                                   **_document(period, bucket, scope, {}))
+            except Exception:
+                pass
+
+
+def buckets(period, since, until=None, scope='all'):
+    """Rollup documents of a period whose bucket is within [since, until], oldest first"""
+    length = PERIODS[period]
+    if until:
+        return queries.ROLLUP_BUCKETS_BETWEEN.items(
+            state_container, period=period, scope=scope, since=since[:length], until=until[:length])
+    return queries.ROLLUP_BUCKETS_SINCE.items(state_container, period=period, scope=scope, since=since[:length])
+
+
+def backfill():
+    """Recompute every rollup from the stored datasets and files; returns the number of buckets"""
+    totals = {}
+
+    def add(timestamp, user, metric, amount):
+        if not timestamp:
+            return
+        for period, length in PERIODS.items():
+            for scope in _scopes(user):
+                key = (period, timestamp[:length], scope)
+                bucket = totals.setdefault(key, {})
+                bucket[metric] = bucket.get(metric, 0) + amount
+
+    for document in queries.DATASET_ACTIVITY.iterate(metadata_container):
+        if document.get('doc_type') == 'file':
+            add(document.get('uploaded_at'), document.get('uploaded_by'), 'files_uploaded', 1)
+            add(document.get('uploaded_at'), document.get('uploaded_by'), 'bytes_uploaded',
+                document.get('size_bytes') or 0)
+            continue
+        add(document.get('created_at'), document.get('created_by'), 'datasets_created', 1)
+        # Files embedded in datasets not yet migrated by migrate_files.py
+        for file_info in document.get('files') or []:
+            add(file_info.get('uploaded_at'), file_info.get('uploaded_by'), 'files_uploaded', 1)
+            add(file_info.get('uploaded_at'), file_info.get('uploaded_by'), 'bytes_uploaded',
+                file_info.get('size_bytes') or 0)
+
+    for document in queries.ROLLUP_KEYS.iterate(state_container):
+        totals.setdefault((document['period'], document['bucket'], document['scope']), {})
+
+    for (period, bucket, scope), values in totals.items():
+        state_container.upsert_item(_document(period, bucket, scope, values))
+    return len(totals)
@@ -6,6 +6,8 @@ from .files import FileManager
 from .search import DatasetSearch
 from ..utils import convert_to_local_time, group_datasets_by_base_name, log_user_activity, validate_dataset_name, sanitize_dataset_name
 from ..cosmos_client import metadata_container
+from ..pagination import parse_page_size
+from .. import queries
 
 # Blueprint for dataset routes
 datasets_bp = Blueprint('datasets', __name__, url_prefix='/datasets')
@@ -16,12 +18,20 @@ def list_datasets():
     """List all datasets"""
     show_deleted = request.args.get('show_deleted', '').lower() == 'true'
     browser_timezone = request.args.get('timezone', 'Asia/Calcutta')
+    continuation = request.args.get('continuation')
+    
+    try:
+        page_size = parse_page_size(request.args.get('page_size'))
+        datasets, next_continuation = DatasetModel.list_page(show_deleted, page_size, continuation, summary=True)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('datasets.list_datasets', show_deleted=show_deleted))
     
-    datasets = DatasetModel.list_all(show_deleted)
     convert_to_local_time(datasets, browser_timezone)
     dataset_groups = group_datasets_by_base_name(datasets)
     
-    return render_template('datasets/list.html', dataset_groups=dataset_groups, show_deleted=show_deleted)
+    return render_template('datasets/list.html', dataset_groups=dataset_groups, show_deleted=show_deleted,
+                           page_size=page_size, continuation=continuation, next_continuation=next_continuation)
 
 @datasets_bp.route('/register', methods=['GET', 'POST'])
 @login_required
@@ -71,11 +81,19 @@ def view_dataset(dataset_id):
         flash('Dataset not found', 'error')
         return redirect(url_for('datasets.list_datasets'))
     
-    convert_to_local_time([dataset], browser_timezone)
+    files_continuation = request.args.get('files_continuation')
+    try:
+        files, next_files_continuation = FileManager.list_page(dataset, continuation=files_continuation)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('datasets.view_dataset', dataset_id=dataset_id))
+    
+    convert_to_local_time([dataset, {'files': files}], browser_timezone)
     versions = DatasetModel.get_versions(dataset['base_name'])
     lineage = DatasetModel.get_lineage(dataset)
     
-    return render_template('datasets/view.html', dataset=dataset, versions=versions, lineage=lineage)
+    return render_template('datasets/view.html', dataset=dataset, versions=versions, lineage=lineage, files=files,
+                           files_continuation=files_continuation, next_files_continuation=next_files_continuation)
 
 @datasets_bp.route('/<dataset_id>/upload', methods=['GET', 'POST'])
 @login_required
@@ -158,11 +176,20 @@ def search_datasets():
     """Search for datasets"""
     query_term = request.args.get('query', '')
     show_deleted = request.args.get('show_deleted', '').lower() == 'true'
+    continuation = request.args.get('continuation')
     
-    datasets = DatasetSearch.search(query_term, show_deleted)
+    try:
+        page_size = parse_page_size(request.args.get('page_size'))
+        datasets, next_continuation, total = DatasetSearch.search_page(
+            query_term, show_deleted, page_size, continuation, summary=True)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('datasets.search_datasets', query=query_term, show_deleted=show_deleted))
     convert_to_local_time(datasets, 'Asia/Calcutta')
     
-    return render_template('datasets/search.html', datasets=datasets, query=query_term, show_deleted=show_deleted)
+    return render_template('datasets/search.html', datasets=datasets, query=query_term, show_deleted=show_deleted,
+                           total=total, page_size=page_size, continuation=continuation,
+                           next_continuation=next_continuation)
 
 @datasets_bp.route('/lineage')
 @login_required
@@ -248,7 +275,20 @@ def preview_file(dataset_id, file_id):
     
     # Get file preview
     from ..utils import get_dataset_file_preview
-    preview_data = get_dataset_file_preview(file_info['blob_path'])
+    preview_data = get_dataset_file_preview(file_info['blob_path'], file_info['filename'],
+                                            sheet=request.args.get('sheet'))
+    
+    # The upload-time profile covers the whole file (the first sheet of a workbook),
+    # not just the parsed preview
+    profile = file_info.get('profile')
+    sheets = preview_data.get('sheets')
+    first_sheet = not sheets or preview_data.get('sheet') == sheets[0]['name']
+    if profile and preview_data.get('type') in ('csv', 'excel') and first_sheet:
+        preview_data['row_count'] = profile['row_count']
+        preview_data['column_info'] = {
+            'count': profile['column_count'],
+            'names': [column['name'] for column in profile['columns']]
+        }
     
     # Add file metadata
     preview_data['file_info'] = {
@@ -412,8 +452,7 @@ def validate_name():
     
     if is_valid:
         # Also check for duplicates
-        query = f"SELECT * FROM c WHERE c.name = '{name}' AND NOT IS_DEFINED(c.is_deleted)"
-        existing = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
+        existing = queries.DATASETS_ACTIVE_BY_NAME.items(metadata_container, name=name)
         if existing:
             return jsonify({'valid': False, 'message': 'A dataset with this name already exists'})
     
@@ -1,22 +1,29 @@
-from ..cosmos_client import metadata_container
+import os
+import time
+from .models import DatasetModel
+from .lineage import lineage_graph
+from .search_index import search_index, tokenize
+from ..cache import TTLCache
+from ..pagination import DEFAULT_PAGE_SIZE, encode_continuation, decode_continuation
+
+# Ranked result ids per canonical query; entries are keyed by the index generation
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "300"))
+
+_results_cache = TTLCache('search_results', maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL, copy_values=False)
 
 class DatasetSearch:
     """Handle dataset search operations"""
     
     @staticmethod
-    def search(query_term='', show_deleted=False):
-        """Search datasets with advanced filtering"""
-        if not query_term:
-            return []
-        
-        # Parse search query
-        search_parts = query_term.split()
+    def _parse(query_term):
+        """Split a query into text terms, tag/uploader filters and a status filter"""
         tag_filters = []
         uploader_filters = []
         name_filters = []
         status_filter = None
         
-        for part in search_parts:
+        for part in query_term.split():
             if part.startswith('tag:'):
                 tag_filters.append(part[4:].lower())
             elif part.startswith('by:'):
@@ -30,92 +37,92 @@ class DatasetSearch:
             else:
                 name_filters.append(part)
         
-        # Build CosmosDB query
-        filters = []
-        
-        # Status filtering
+        return name_filters, tag_filters, uploader_filters, status_filter
+    
+    @staticmethod
+    def _status_predicate(status_filter, show_deleted):
         if status_filter == 'deleted':
-            filters.append("IS_DEFINED(c.is_deleted)")
-        elif status_filter == 'production':
-            filters.append("NOT IS_DEFINED(c.is_deleted) AND c.is_production = true")
-        elif status_filter == 'active':
-            filters.append("NOT IS_DEFINED(c.is_deleted) AND (NOT IS_DEFINED(c.is_production) OR c.is_production = false)")
-        elif not show_deleted:
-            filters.append("NOT IS_DEFINED(c.is_deleted)")
-        
-        # Name/description filtering
-        if name_filters:
-            name_query = ' OR '.join([f"CONTAINS(LOWER(c.name), '{name.lower()}')" for name in name_filters])
-            desc_query = ' OR '.join([f"CONTAINS(LOWER(c.description), '{name.lower()}')" for name in name_filters])
-            filters.append(f"({name_query} OR {desc_query})")
-        
-        # Uploader filtering
-        if uploader_filters:
-            uploader_conditions = []
-            for uploader in uploader_filters:
-                uploader_conditions.append(f"LOWER(c.created_by) = '{uploader.lower()}'")
-            filters.append(f"({' OR '.join(uploader_conditions)})")
-        
-        # Tag filtering (pre-filter for datasets with tags)
-        has_tag_filter = bool(tag_filters)
-        if has_tag_filter:
-            filters.append("(ARRAY_LENGTH(c.tags) > 0)")
-        
-        # Execute query
-        main_query = "SELECT * FROM c"
-        if filters:
-            main_query += " WHERE " + " AND ".join(filters)
-        
-        all_datasets = list(metadata_container.query_items(query=main_query, enable_cross_partition_query=True))
-        
-        # Post-process tag filtering
-        if has_tag_filter:
-            filtered_datasets = []
-            for dataset in all_datasets:
-                dataset_tags = []
-                if 'tags' in dataset and dataset['tags']:
-                    dataset_tags = [tag.lower() for tag in dataset['tags']]
-                
-                if all(tag_filter in dataset_tags for tag_filter in tag_filters):
-                    filtered_datasets.append(dataset)
-            
-            return filtered_datasets
+            return lambda dataset: 'is_deleted' in dataset
+        if status_filter == 'production':
+            return lambda dataset: 'is_deleted' not in dataset and dataset.get('is_production') is True
+        if status_filter == 'active':
+            return lambda dataset: 'is_deleted' not in dataset and not dataset.get('is_production')
+        if not show_deleted:
+            return lambda dataset: 'is_deleted' not in dataset
+        return None
+    
+    @staticmethod
+    def _cache_key(query_term, show_deleted):
+        """Canonical form of a query: equivalent queries share one cache entry"""
+        name_filters, tag_filters, uploader_filters, status_filter = DatasetSearch._parse(query_term)
+        terms = tuple(sorted({token for name in name_filters for token in tokenize(name)}))
+        tags = tuple(sorted({tag.strip() for tag in tag_filters}))
+        uploaders = tuple(sorted(set(uploader_filters)))
+        return terms, tags, uploaders, status_filter, show_deleted and status_filter is None
+    
+    @staticmethod
+    def _matching_ids(query_term, show_deleted):
+        """Ranked ids for a query, cached per canonical query and catalog generation"""
+        started = time.perf_counter()
+        terms, tags, uploaders, status_filter, show_deleted = DatasetSearch._cache_key(query_term, show_deleted)
+        # Any dataset write bumps the generation, so older entries are never served
+        key = (search_index.generation(), terms, tags, uploaders, status_filter, show_deleted)
         
-        return all_datasets
+        dataset_ids = _results_cache.get(key)
+        hit = dataset_ids is not None
+        if not hit:
+            dataset_ids = tuple(search_index.search(
+                text_terms=terms,
+                tags=tags,
+                creators=uploaders,
+                predicate=DatasetSearch._status_predicate(status_filter, show_deleted)
+            ))
+            _results_cache.set(key, dataset_ids)
+        _results_cache.observe(hit, time.perf_counter() - started)
+        return dataset_ids
     
     @staticmethod
-    def get_lineage_data(show_deleted=False):
-        """Get data for lineage visualization"""
-        if show_deleted:
-            query = "SELECT c.id, c.name, c.version, c.base_name, c.parent_id, c.tags, c.is_deleted FROM c"
+    def _load(dataset_ids, summary):
+        if summary:
+            datasets = [search_index.summary(dataset_id) for dataset_id in dataset_ids]
         else:
-            query = "SELECT c.id, c.name, c.version, c.base_name, c.parent_id, c.tags FROM c WHERE NOT IS_DEFINED(c.is_deleted)"
-        
-        datasets = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
-        
-        # Format data for visualization
-        nodes = []
-        links = []
+            datasets = [DatasetModel.get_by_id(dataset_id) for dataset_id in dataset_ids]
+        return [dataset for dataset in datasets if dataset]
+    
+    @staticmethod
+    def search(query_term='', show_deleted=False, summary=False):
+        """Search datasets with advanced filtering, best matches first
+
+        Free-text terms must all match a word (or word prefix) of the name,
+        description, tags or creator. With summary=True only
+        DatasetModel.SUMMARY_PROJECTION fields are returned.
+        """
+        if not query_term:
+            return []
+        return DatasetSearch._load(DatasetSearch._matching_ids(query_term, show_deleted), summary)
+    
+    @staticmethod
+    def search_page(query_term='', show_deleted=False, page_size=DEFAULT_PAGE_SIZE, continuation=None, summary=False):
+        """One page of search results
+
+        Returns (datasets, continuation, total) where continuation is the
+        opaque token for the next page, or None on the last page.
+        """
+        if not query_term:
+            return [], None, 0
         
-        for dataset in datasets:
-            node_data = {
-                'id': dataset['id'],
-                'name': dataset['name'],
-                'version': dataset['version'],
-                'base_name': dataset['base_name'],
-                'tags': dataset.get('tags', [])
-            }
-            
-            if dataset.get('is_deleted'):
-                node_data['is_deleted'] = True
-            
-            nodes.append(node_data)
-            
-            # Create links between versions
-            if dataset.get('parent_id'):
-                links.append({
-                    'source': dataset['parent_id'],
-                    'target': dataset['id']
-                })
+        offset = decode_continuation(continuation) or '0'
+        if not offset.isdigit():
+            raise ValueError('Invalid continuation token')
+        offset = int(offset)
         
-        return nodes, links
+        dataset_ids = DatasetSearch._matching_ids(query_term, show_deleted)
+        page = dataset_ids[offset:offset + page_size]
+        next_offset = offset + page_size
+        next_continuation = encode_continuation(str(next_offset)) if next_offset < len(dataset_ids) else None
+        return DatasetSearch._load(page, summary), next_continuation, len(dataset_ids)
+    
+    @staticmethod
+    def get_lineage_data(show_deleted=False):
+        """Get data for lineage visualization, served from the materialized lineage graph"""
+        return lineage_graph.nodes_and_links(show_deleted)
@@ -0,0 +1,290 @@
+import bisect
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from ..cosmos_client import metadata_container
+from .. import queries
+
+# How often to pick up datasets written by other workers
+SEARCH_INDEX_REFRESH_SECONDS = float(os.environ.get("SEARCH_INDEX_REFRESH_SECONDS", "10"))
+
+# Field -> weight of its tokens in the ranking
+FIELD_WEIGHTS = {'name': 3, 'tags': 2, 'description': 1, 'created_by': 1}
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Most indexed terms one query word expands to as a prefix (the word itself and the most common others)
+SEARCH_MAX_PREFIX_TERMS = int(os.environ.get("SEARCH_MAX_PREFIX_TERMS", "64"))
+
+SUMMARY_FIELDS = ('id', 'name', 'base_name', 'description', 'version', 'tags', 'created_by', 'created_at',
+                  'is_production', 'is_deleted', 'deleted_by', 'deleted_at', 'parent_id')
+
+_TOKEN = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+    """Lowercase word tokens of a string (underscores and punctuation separate words)"""
+    return _TOKEN.findall(text.lower()) if isinstance(text, str) else []
+
+
+def summarize(dataset):
+    """The DatasetModel.SUMMARY_PROJECTION view of a full dataset document"""
+    summary = {field: dataset[field] for field in SUMMARY_FIELDS if field in dataset}
+    if 'files' in dataset:
+        files = dataset.get('files') or []
+        summary['file_count'] = len(files)
+        summary['total_size_bytes'] = sum(file_info.get('size_bytes', 0) for file_info in files)
+    else:
+        for field in ('file_count', 'total_size_bytes'):
+            if field in dataset:
+                summary[field] = dataset[field]
+    return summary
+
+
+class SearchIndex:
+    """In-memory inverted index over dataset name, description, tags and creator
+
+    Postings map each token to {dataset id: weighted term frequency}. Free-text
+    terms are ANDed (posting-list intersection, with prefix matching on each
+    term) and ranked with BM25; tag: and by: filters use exact-match sets.
+    The index is built from the container on first use, updated by
+    DatasetModel writes, and caught up with other workers through a
+    ``c._ts >= watermark`` delta query at most every SEARCH_INDEX_REFRESH_SECONDS.
+    """
+
+    def __init__(self, container):
+        self.container = container
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._loaded = False
+        self._pending = None
+        self._docs = {}
+        self._terms = {}
+        self._postings = {}
+        self._vocabulary = None
+        self._lengths = {}
+        self._total_length = 0
+        self._sort_keys = {}
+        self._tags = {}
+        self._creators = {}
+        self._watermark = 0
+        self._last_refresh = 0
+        self._generation = 0
+
+    # -- maintenance --
+
+    def _remove(self, dataset_id):
+        summary = self._docs.pop(dataset_id, None)
+        if summary is None:
+            return
+        for term in self._terms.pop(dataset_id, {}):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(dataset_id, None)
+                if not postings:
+                    del self._postings[term]
+                    self._vocabulary = None
+        self._total_length -= self._lengths.pop(dataset_id, 0)
+        self._sort_keys.pop(dataset_id, None)
+        for tag in summary.get('tags') or []:
+            self._discard(self._tags, str(tag).strip().lower(), dataset_id)
+        self._discard(self._creators, str(summary.get('created_by', '')).lower(), dataset_id)
+
+    @staticmethod
+    def _discard(index, key, dataset_id):
+        members = index.get(key)
+        if members is not None:
+            members.discard(dataset_id)
+            if not members:
+                del index[key]
+
+    def _add(self, document):
+        """Index a dataset; a document identical to the indexed one (such as a
+        re-read of the watermark second) leaves the index and its generation alone"""
+        summary = summarize(document)
+        dataset_id = summary['id']
+        if self._docs.get(dataset_id) == summary:
+            return
+        self._remove(dataset_id)
+
+        terms = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            value = summary.get(field)
+            values = value if isinstance(value, list) else [value]
+            for text in values:
+                for token in tokenize(text):
+                    terms[token] += weight
+
+        self._docs[dataset_id] = summary
+        self._terms[dataset_id] = terms
+        for term, frequency in terms.items():
+            if term not in self._postings:
+                self._postings[term] = {}
+                self._vocabulary = None
+            self._postings[term][dataset_id] = frequency
+        self._lengths[dataset_id] = sum(terms.values())
+        self._total_length += self._lengths[dataset_id]
+        # Ties in score are ordered by name, then version
+        self._sort_keys[dataset_id] = (str(summary.get('name', '')), summary.get('version') or 0)
+        for tag in summary.get('tags') or []:
+            self._tags.setdefault(str(tag).strip().lower(), set()).add(dataset_id)
+        self._creators.setdefault(str(summary.get('created_by', '')).lower(), set()).add(dataset_id)
+        self._generation += 1
+
+    def apply(self, dataset):
+        """Record a created, updated, deleted or restored dataset"""
+        with self._lock:
+            if self._pending is not None:
+                # A refresh is reading the container; replay this write over what it reads
+                self._pending.append(dataset)
+            if self._loaded:
+                self._add(dataset)
+
+    def _query(self, since):
+        return queries.DATASETS_CHANGED_SINCE.iterate(self.container, since=since)
+
+    def refresh(self, force=False):
+        """Build the index on first use, then apply changes made since the watermark
+
+        One refresh reads the container at a time. Callers wait for the first
+        build (and forced refreshes for the one running); otherwise a refresh
+        already running is not repeated and the current state is served.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._loaded and not force and now - self._last_refresh < SEARCH_INDEX_REFRESH_SECONDS:
+                return
+            wait = force or not self._loaded
+        if not self._refresh_lock.acquire(blocking=wait):
+            return
+        try:
+            with self._lock:
+                # The refresh waited for may have done this one's work
+                if self._loaded and not force and now - self._last_refresh < SEARCH_INDEX_REFRESH_SECONDS:
+                    return
+                since = self._watermark
+                self._last_refresh = now
+                self._pending = []
+
+            # _ts has one-second resolution, so re-read the watermark second itself.
+            # Only this query moves the watermark: a local write (apply) can be newer
+            # than writes other workers made since the last refresh.
+            try:
+                changes = list(self._query(since))
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                for document in changes:
+                    self._add(document)
+                    self._watermark = max(self._watermark, document.get('_ts', 0))
+                # Writes made while the query ran may be newer than what it read
+                for dataset in self._pending:
+                    self._add(dataset)
+                self._pending = None
+                self._loaded = True
+        finally:
+            self._refresh_lock.release()
+
+    # -- queries --
+
+    def generation(self):
+        """Counter bumped by every dataset change the index has seen (local or from other workers)"""
+        self.refresh()
+        with self._lock:
+            return self._generation
+
+    def _expand(self, token):
+        """Postings of the indexed terms starting with token: the token itself
+        and the most common others, at most SEARCH_MAX_PREFIX_TERMS"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        start = bisect.bisect_left(self._vocabulary, token)
+        matches = {}
+        for term in self._vocabulary[start:]:
+            if not term.startswith(token):
+                break
+            matches[term] = self._postings[term]
+        if len(matches) > SEARCH_MAX_PREFIX_TERMS:
+            kept = sorted(matches, key=lambda term: (term != token, -len(matches[term])))[:SEARCH_MAX_PREFIX_TERMS]
+            matches = {term: matches[term] for term in kept}
+        return matches
+
+    def _matches(self, candidates, expansions):
+        """(document frequency, [(id, frequency, length), ...] over the candidates)
+        for each expanded term, walking the smaller of its postings and the candidates"""
+        matched = []
+        for matches in expansions:
+            for postings in matches.values():
+                if len(postings) <= len(candidates):
+                    hits = [(dataset_id, frequency, self._lengths[dataset_id])
+                            for dataset_id, frequency in postings.items() if dataset_id in candidates]
+                else:
+                    hits = [(dataset_id, postings[dataset_id], self._lengths[dataset_id])
+                            for dataset_id in candidates if dataset_id in postings]
+                matched.append((len(postings), hits))
+        return matched
+
+    @staticmethod
+    def _score(candidates, matched, count, average):
+        """BM25 score of each candidate over the expanded query terms"""
+        scores = dict.fromkeys(candidates, 0.0)
+        for document_frequency, hits in matched:
+            idf = math.log(1 + (count - document_frequency + 0.5) / (document_frequency + 0.5))
+            for dataset_id, frequency, length in hits:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average)
+                scores[dataset_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return scores
+
+    def search(self, text_terms=(), tags=(), creators=(), predicate=None):
+        """Ids of matching datasets, best match first
+
+        All text terms must match (as a word or word prefix) and all tags must
+        be present; creators are alternatives. predicate filters summaries.
+        """
+        self.refresh()
+        with self._lock:
+            filters = [self._tags.get(tag.lower(), set()) for tag in tags]
+            if creators:
+                filters.append(set().union(*(self._creators.get(creator.lower(), set()) for creator in creators)))
+
+            expansions = [self._expand(token) for token in {token for term in text_terms for token in tokenize(term)}]
+            for matches in expansions:
+                filters.append(set().union(*matches.values()) if len(matches) != 1 else next(iter(matches.values())).keys())
+
+            # Intersect the posting lists, smallest first
+            candidates = None
+            for ids in sorted(filters, key=len):
+                candidates = set(ids) if candidates is None else candidates.intersection(ids)
+                if not candidates:
+                    return []
+            if candidates is None:
+                candidates = set(self._docs)
+            if predicate is not None:
+                candidates = {dataset_id for dataset_id in candidates if predicate(self._docs[dataset_id])}
+
+            # Gather what scoring needs, then score and sort without holding up writers
+            matched = self._matches(candidates, expansions)
+            sort_keys = {dataset_id: self._sort_keys[dataset_id] for dataset_id in candidates}
+            count = len(self._docs)
+            average = self._total_length / count if count else 1
+
+        scores = self._score(candidates, matched, count, average)
+        ranked = sorted(candidates, key=sort_keys.__getitem__)
+        ranked.sort(key=scores.__getitem__, reverse=True)
+        return ranked
+
+    def summary(self, dataset_id):
+        """The indexed summary of a dataset"""
+        with self._lock:
+            summary = self._docs.get(dataset_id)
+            return dict(summary) if summary else None
+
+
+search_index = SearchIndex(metadata_container)
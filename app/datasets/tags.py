@@ -0,0 +1,280 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+from ..cosmos_client import metadata_container, state_container
+from .. import queries
+
+# How often to pick up tag changes written by other workers
+TAG_INDEX_REFRESH_SECONDS = float(os.environ.get("TAG_INDEX_REFRESH_SECONDS", "30"))
+# Documents each tag's dataset ids are spread over (changing it rebuilds the index)
+TAG_INDEX_SHARDS = int(os.environ.get("TAG_INDEX_SHARDS", "16"))
+
+MARKER_ID = 'tag-index'
+
+
+def normalize_tags(tags):
+    """The distinct, stripped, non-empty tags of a dataset"""
+    return {tag.strip() for tag in tags or [] if isinstance(tag, str) and tag.strip()}
+
+
+class TagIndex:
+    """Tag -> dataset ids index stored as TAG_INDEX_SHARDS documents per tag
+
+    Documents live in the state container (``doc_type: 'tag'``). Each holds
+    the ids of the live (not deleted) datasets carrying the tag whose id
+    hashes to its shard, plus their count, so no document grows with the
+    whole tag and concurrent writers of one popular tag mostly update
+    different documents. DatasetModel writes update only the tags that
+    changed, and readers serve tag lists and counts from memory, catching up
+    with other workers through a ``c._ts >= watermark`` delta query. The index
+    is built from a one-off scan of the metadata container the first time it
+    is used.
+    """
+
+    def __init__(self, container, source_container):
+        self.container = container
+        self.source_container = source_container
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._loaded = False
+        self._datasets = {}
+        self._shards = {}
+        self._tags_by_dataset = {}
+        self._watermark = 0
+        self._last_refresh = 0
+
+    @staticmethod
+    def _shard(dataset_id):
+        return int(hashlib.sha1(dataset_id.encode('utf-8')).hexdigest()[:8], 16) % TAG_INDEX_SHARDS
+
+    @staticmethod
+    def _doc_id(tag, shard):
+        # Tags may contain characters Cosmos does not allow in ids
+        return f"tag:{hashlib.sha1(tag.encode('utf-8')).hexdigest()}:{shard}"
+
+    # -- in-memory state --
+
+    def _add(self, document):
+        """Apply one tag shard document to the in-memory index"""
+        tag = document['tag']
+        with self._lock:
+            _, previous, previous_ts = self._shards.get(document['id'], (tag, set(), 0))
+            # Writers and refreshes apply documents outside one lock, so a slower
+            # one can bring an older version of a document
+            if document.get('_ts', 0) < previous_ts:
+                return
+            current = set(document.get('dataset_ids', []))
+            members = self._datasets.setdefault(tag, set())
+            for dataset_id in previous - current:
+                members.discard(dataset_id)
+                self._tags_by_dataset.get(dataset_id, set()).discard(tag)
+            for dataset_id in current - previous:
+                members.add(dataset_id)
+                self._tags_by_dataset.setdefault(dataset_id, set()).add(tag)
+            if not members:
+                del self._datasets[tag]
+            if current:
+                self._shards[document['id']] = (tag, current, document.get('_ts', 0))
+            else:
+                self._shards.pop(document['id'], None)
+
+    def _query(self, since):
+        return queries.TAG_DOCS_CHANGED_SINCE.iterate(self.container, since=since)
+
+    def refresh(self, force=False):
+        """Load the index on first use, then apply tag documents changed since the watermark
+
+        Queries run outside the lock that guards the in-memory state, so reads
+        keep being served from it meanwhile. The first load (or rebuild) runs
+        once, and callers arriving during it wait for it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded and not force and now - self._last_refresh < TAG_INDEX_REFRESH_SECONDS:
+                return
+            loaded = self._loaded
+            # Claimed up front, so concurrent callers keep serving the current state
+            self._last_refresh = now
+        if loaded:
+            self._catch_up()
+            return
+        with self._build_lock:
+            if self._loaded:
+                return
+            if not self._is_built():
+                self.rebuild()
+                return
+            self._catch_up()
+
+    def _catch_up(self):
+        # _ts has one-second resolution, so re-read the watermark second itself.
+        # Only this query moves the watermark: our own writes can be newer
+        # than writes other workers made since the last refresh.
+        with self._lock:
+            since = self._watermark
+        documents = list(self._query(since))
+        with self._lock:
+            for document in documents:
+                self._add(document)
+                self._watermark = max(self._watermark, document.get('_ts', 0))
+            self._loaded = True
+
+    def _is_built(self):
+        try:
+            marker = self.container.read_item(item=MARKER_ID, partition_key=MARKER_ID)
+        except exceptions.CosmosResourceNotFoundError:
+            return False
+        return marker.get('shards') == TAG_INDEX_SHARDS
+
+    def _scan(self, tag=None):
+        """Shard document id -> (tag, dataset ids) from the datasets, for one tag or all of them"""
+        if tag is None:
+            datasets = queries.DATASET_TAGS_ACTIVE.iterate(self.source_container)
+        else:
+            datasets = queries.DATASET_TAGS_ACTIVE_WITH_TAG.iterate(self.source_container, tag=tag.lower())
+        shards = {}
+        for dataset in datasets:
+            for dataset_tag in normalize_tags(dataset.get('tags')):
+                if tag is None or dataset_tag == tag:
+                    doc_id = self._doc_id(dataset_tag, self._shard(dataset['id']))
+                    shards.setdefault(doc_id, (dataset_tag, set()))[1].add(dataset['id'])
+        return shards
+
+    def rebuild(self):
+        """Recompute every tag document from the datasets (one full scan)"""
+        # Read before the scan: a document changed after this read fails its
+        # conditional write below, even when the scan already saw the change
+        existing = {document['id']: document for document in self._query(0)}
+        shards = self._scan()
+        # Empty out documents that no longer hold anything (including ones
+        # from a different shard count), so other workers drop them too
+        with self._lock:
+            stale = {doc_id: tag for doc_id, (tag, _, _) in self._shards.items()}
+        for doc_id, document in existing.items():
+            if document.get('dataset_ids'):
+                stale[doc_id] = document['tag']
+        for doc_id, tag in stale.items():
+            if doc_id not in shards:
+                self._write(doc_id, tag, set(), existing.get(doc_id))
+        for doc_id, (tag, dataset_ids) in shards.items():
+            self._write(doc_id, tag, dataset_ids, existing.get(doc_id))
+        self.container.upsert_item({'id': MARKER_ID, 'doc_type': 'tag_index', 'shards': TAG_INDEX_SHARDS,
+                                    'built_at': datetime.utcnow().isoformat()})
+        # Pick up documents other workers changed while this ran
+        self._catch_up()
+
+    # -- maintenance --
+
+    def _read(self, doc_id):
+        try:
+            return self.container.read_item(item=doc_id, partition_key=doc_id)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+    def _write(self, doc_id, tag, dataset_ids, document):
+        """Store a rebuilt shard document over the version the rebuild read
+
+        Writes are create-only or conditioned on that version's ETag, so a
+        dataset write that updated the document since (see _update) is not
+        overwritten: the document is re-read and the shard re-scanned instead.
+        """
+        while True:
+            if document is None:
+                if not dataset_ids:
+                    return
+                try:
+                    document = self.container.create_item({
+                        'id': doc_id, 'doc_type': 'tag', 'tag': tag,
+                        'count': len(dataset_ids), 'dataset_ids': sorted(dataset_ids)})
+                except exceptions.CosmosResourceExistsError:
+                    document = self._read(doc_id)
+                else:
+                    break
+            elif set(document.get('dataset_ids', [])) == dataset_ids:
+                break
+            else:
+                document = dict(document, count=len(dataset_ids), dataset_ids=sorted(dataset_ids))
+                try:
+                    document = self.container.replace_item(
+                        item=doc_id, body=document, etag=document['_etag'],
+                        match_condition=MatchConditions.IfNotModified)
+                except (exceptions.CosmosAccessConditionFailedError, exceptions.CosmosResourceNotFoundError):
+                    document = self._read(doc_id)
+                else:
+                    break
+            _, dataset_ids = self._scan(tag).get(doc_id, (tag, set()))
+        if document is not None:
+            self._add(document)
+
+    def _update(self, tag, dataset_id, present):
+        """Add or remove one dataset id on its tag shard document, retrying on concurrent writes"""
+        doc_id = self._doc_id(tag, self._shard(dataset_id))
+        while True:
+            document = self._read(doc_id)
+            if document is None:
+                if not present:
+                    return
+                try:
+                    document = self.container.create_item({
+                        'id': doc_id, 'doc_type': 'tag', 'tag': tag, 'count': 1, 'dataset_ids': [dataset_id]})
+                except exceptions.CosmosResourceExistsError:
+                    continue
+                self._add(document)
+                return
+
+            dataset_ids = set(document.get('dataset_ids', []))
+            if (dataset_id in dataset_ids) == present:
+                self._add(document)
+                return
+            if present:
+                dataset_ids.add(dataset_id)
+            else:
+                dataset_ids.discard(dataset_id)
+            document['dataset_ids'] = sorted(dataset_ids)
+            document['count'] = len(dataset_ids)
+            try:
+                document = self.container.replace_item(
+                    item=doc_id, body=document, etag=document['_etag'],
+                    match_condition=MatchConditions.IfNotModified)
+            except (exceptions.CosmosAccessConditionFailedError, exceptions.CosmosResourceNotFoundError):
+                continue
+            self._add(document)
+            return
+
+    def apply(self, dataset):
+        """Record a created, edited, deleted or restored dataset"""
+        self.refresh()
+        tags = set() if dataset.get('is_deleted') else normalize_tags(dataset.get('tags'))
+        with self._lock:
+            previous = set(self._tags_by_dataset.get(dataset['id'], ()))
+        for tag in tags - previous:
+            self._update(tag, dataset['id'], True)
+        for tag in previous - tags:
+            self._update(tag, dataset['id'], False)
+
+    # -- queries --
+
+    def counts(self):
+        """Tag -> number of live datasets carrying it"""
+        self.refresh()
+        with self._lock:
+            return {tag: len(dataset_ids) for tag, dataset_ids in self._datasets.items()}
+
+    def tags(self):
+        """All tags in use, sorted"""
+        self.refresh()
+        with self._lock:
+            return sorted(self._datasets)
+
+    def datasets(self, tag):
+        """Ids of the live datasets carrying a tag"""
+        self.refresh()
+        with self._lock:
+            return sorted(self._datasets.get(tag.strip(), ()))
+
+
+tag_index = TagIndex(state_container, metadata_container)
@@ -0,0 +1,284 @@
+import hashlib
+import os
+import re
+import uuid
+from datetime import datetime, timedelta
+from azure.cosmos import exceptions
+from azure.storage.blob import BlobBlock, ContentSettings
+from ..cosmos_client import state_container
+from .. import queries
+from ..utils import blob_service_client, AZURE_BLOB_CONTAINER
+from .files import FileManager
+from . import blob_index
+from .uploads import UPLOAD_BLOCK_SIZE, block_id, blob_sha256, read_block
+
+# Chunk size handed out when the client does not ask for one, and the largest accepted
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(UPLOAD_BLOCK_SIZE)))
+UPLOAD_MAX_CHUNK_SIZE = int(os.environ.get("UPLOAD_MAX_CHUNK_SIZE", str(100 * 1024 * 1024)))
+# Sessions not committed within this many hours can no longer receive chunks
+UPLOAD_SESSION_HOURS = float(os.environ.get("UPLOAD_SESSION_HOURS", "24"))
+# Session documents expire (Cosmos TTL) this many hours after the session does,
+# so clients can still read the outcome for a while
+UPLOAD_SESSION_RETENTION_HOURS = float(os.environ.get("UPLOAD_SESSION_RETENTION_HOURS", "24"))
+
+# Every chunk receipt (about 95 bytes) lives on the session document, which must
+# stay under the 2 MB Cosmos item limit
+MAX_CHUNKS = 10000
+# Blocks a block blob holds; a chunk is staged as blocks of at most UPLOAD_BLOCK_SIZE
+MAX_BLOCKS = 50000
+
+
+class UploadSessionManager:
+    """Resumable uploads: chunks are staged as blob blocks and recorded on a session document
+
+    Session documents live in the state container (``doc_type: 'upload_session'``).
+    Each received chunk is recorded with its own patch operation, so chunks can
+    be sent in any order and in parallel; commit assembles the staged blocks
+    and registers the file with FileManager.
+    """
+
+    @staticmethod
+    def _doc_id(upload_id):
+        return f"upload:{upload_id}"
+
+    @staticmethod
+    def _blocks_per_chunk(session):
+        # Sessions created before chunks were split into blocks stage each as one block
+        return -(-session['chunk_size'] // session.get('block_size', session['chunk_size']))
+
+    @staticmethod
+    def max_chunks(session):
+        """Most chunks a session can take"""
+        return min(MAX_CHUNKS, MAX_BLOCKS // UploadSessionManager._blocks_per_chunk(session))
+
+    @staticmethod
+    def _block_ids(session, index, size):
+        """Ids of the blocks a chunk of size bytes was staged as"""
+        first = index * UploadSessionManager._blocks_per_chunk(session)
+        count = max(1, -(-size // session.get('block_size', session['chunk_size'])))
+        return [block_id(first + part) for part in range(count)]
+
+    @staticmethod
+    def create(dataset, filename, created_by, size_bytes=None, chunk_size=None, content_type=None,
+               description='', tags=None, sha256=None):
+        """Start an upload session for a file of the dataset
+
+        With the file's sha256 and size_bytes, content already uploaded to the
+        dataset's family is recorded right away and the session starts out
+        committed; otherwise the hash is checked against the assembled blob on
+        commit. Undeclared hashes are computed on commit, so the file is
+        deduplicated either way.
+        """
+        if not filename:
+            raise ValueError('No filename provided')
+        chunk_size = int(chunk_size or UPLOAD_CHUNK_SIZE)
+        if not 0 < chunk_size <= UPLOAD_MAX_CHUNK_SIZE:
+            raise ValueError(f'chunk_size must be between 1 and {UPLOAD_MAX_CHUNK_SIZE} bytes')
+        block_size = min(chunk_size, UPLOAD_BLOCK_SIZE)
+        max_chunks = UploadSessionManager.max_chunks({'chunk_size': chunk_size, 'block_size': block_size})
+        if size_bytes is not None:
+            size_bytes = int(size_bytes)
+            if size_bytes < 0:
+                raise ValueError('size_bytes must not be negative')
+            if -(-size_bytes // chunk_size) > max_chunks:
+                raise ValueError(f'A file takes at most {max_chunks} chunks of this size; use a larger chunk_size')
+        sha256 = sha256.strip().lower() if sha256 else None
+        if sha256 and not re.fullmatch(r'[0-9a-f]{64}', sha256):
+            raise ValueError('sha256 must be 64 hexadecimal digits')
+
+        upload_id = str(uuid.uuid4())
+        file_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        session = {
+            'id': UploadSessionManager._doc_id(upload_id),
+            'doc_type': 'upload_session',
+            'upload_id': upload_id,
+            'dataset_id': dataset['id'],
+            'file_id': file_id,
+            'filename': filename,
+            'blob_path': FileManager.blob_path(dataset, file_id, filename),
+            'content_type': content_type or 'application/octet-stream',
+            'description': description,
+            'tags': tags or [],
+            'size_bytes': size_bytes,
+            'chunk_size': chunk_size,
+            'block_size': block_size,
+            'chunks': {},
+            'status': 'open',
+            'created_by': created_by,
+            'created_at': now.isoformat(),
+            'expires_at': (now + timedelta(hours=UPLOAD_SESSION_HOURS)).isoformat(),
+            # Expired and abandoned sessions are removed by Cosmos DB
+            'ttl': int((UPLOAD_SESSION_HOURS + UPLOAD_SESSION_RETENTION_HOURS) * 3600)
+        }
+        if sha256:
+            session['sha256'] = sha256
+            stored = FileManager.reuse(dataset, filename, sha256, size_bytes, content_type)
+            if stored is not None:
+                file_info = FileManager.register(dataset, stored, created_by, description, tags)
+                session.update(file_id=file_info['id'], blob_path=file_info['blob_path'],
+                               size_bytes=file_info['size_bytes'], status='committed', deduplicated=True)
+        return state_container.create_item(body=session)
+
+    @staticmethod
+    def get(upload_id):
+        """Get a session by upload id"""
+        doc_id = UploadSessionManager._doc_id(upload_id)
+        try:
+            return state_container.read_item(item=doc_id, partition_key=doc_id)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+    @staticmethod
+    def total_chunks(session):
+        """Number of chunks the file takes, when its size was declared"""
+        if session.get('size_bytes') is None:
+            return None
+        return max(1, -(-session['size_bytes'] // session['chunk_size']))
+
+    @staticmethod
+    def status(session):
+        """Progress of a session: received chunk indexes and, when known, the missing ones"""
+        received = sorted(int(index) for index in session.get('chunks', {}))
+        result = {
+            'upload_id': session['upload_id'],
+            'dataset_id': session['dataset_id'],
+            'filename': session['filename'],
+            'status': session['status'],
+            'chunk_size': session['chunk_size'],
+            'size_bytes': session.get('size_bytes'),
+            'received': received,
+            'received_bytes': sum(chunk['size'] for chunk in session.get('chunks', {}).values()),
+            'expires_at': session['expires_at']
+        }
+        total = UploadSessionManager.total_chunks(session)
+        if total is not None:
+            result['total_chunks'] = total
+            result['missing'] = sorted(set(range(total)) - set(received))
+        if session.get('file_id') and session['status'] == 'committed':
+            result['file_id'] = session['file_id']
+            result['deduplicated'] = session.get('deduplicated', False)
+        return result
+
+    @staticmethod
+    def _require_open(session):
+        if session['status'] != 'open':
+            raise ValueError(f"Upload is {session['status']}")
+        if session['expires_at'] < datetime.utcnow().isoformat():
+            raise ValueError('Upload session has expired')
+
+    @staticmethod
+    def put_chunk(session, index, stream):
+        """Stage one chunk as blob blocks and record it; re-sending a chunk replaces it
+
+        The chunk is read and staged a block (at most UPLOAD_BLOCK_SIZE bytes)
+        at a time, so large chunks are not held in memory.
+        """
+        UploadSessionManager._require_open(session)
+        total = UploadSessionManager.total_chunks(session)
+        if not 0 <= index < (total if total is not None else UploadSessionManager.max_chunks(session)):
+            raise ValueError(f'Chunk index {index} is out of range')
+
+        blob_client = blob_service_client.get_blob_client(container=AZURE_BLOB_CONTAINER, blob=session['blob_path'])
+        block_size = session.get('block_size', session['chunk_size'])
+        digest = hashlib.sha256()
+        size = 0
+        for block in UploadSessionManager._block_ids(session, index, session['chunk_size']):
+            data = read_block(stream, min(block_size, session['chunk_size'] - size))
+            if size and not data:
+                break
+            blob_client.stage_block(block_id=block, data=data, length=len(data))
+            digest.update(data)
+            size += len(data)
+            if not data:
+                break
+        if not size and session.get('size_bytes') != 0:
+            raise ValueError('Empty chunk')
+        if size == session['chunk_size'] and stream.read(1):
+            raise ValueError(f"Chunks are at most {session['chunk_size']} bytes")
+
+        chunk = {'size': size, 'sha256': digest.hexdigest()}
+        try:
+            state_container.patch_item(
+                item=session['id'], partition_key=session['id'],
+                patch_operations=[{'op': 'set', 'path': f'/chunks/{index}', 'value': chunk}],
+                filter_predicate=queries.PREDICATE_UPLOAD_OPEN)
+        except exceptions.CosmosAccessConditionFailedError:
+            raise ValueError('Upload is no longer open')
+        return chunk
+
+    @staticmethod
+    def _set_status(session, status, expected=queries.PREDICATE_UPLOAD_OPEN):
+        return state_container.patch_item(
+            item=session['id'], partition_key=session['id'],
+            patch_operations=[{'op': 'set', 'path': '/status', 'value': status}],
+            filter_predicate=expected)
+
+    @staticmethod
+    def commit(session, dataset):
+        """Assemble the received chunks into the blob and register the file; returns the file info"""
+        UploadSessionManager._require_open(session)
+        chunks = session.get('chunks', {})
+        total = UploadSessionManager.total_chunks(session) or len(chunks)
+        missing = [index for index in range(total) if str(index) not in chunks]
+        if missing or not chunks or len(chunks) != total:
+            raise ValueError(f"Missing chunks: {missing[:20] or 'none received'}")
+        size_bytes = sum(chunk['size'] for chunk in chunks.values())
+        if session.get('size_bytes') is not None and size_bytes != session['size_bytes']:
+            raise ValueError(f"Received {size_bytes} bytes, expected {session['size_bytes']}")
+
+        # Claim the session so concurrent commits do not register the file twice
+        try:
+            session = UploadSessionManager._set_status(session, 'committing')
+        except exceptions.CosmosAccessConditionFailedError:
+            raise ValueError('Upload is already being committed')
+
+        try:
+            blob_client = blob_service_client.get_blob_client(
+                container=AZURE_BLOB_CONTAINER, blob=session['blob_path'])
+            blob_client.commit_block_list(
+                [BlobBlock(block_id=block) for index in range(total)
+                 for block in UploadSessionManager._block_ids(session, index, chunks[str(index)]['size'])],
+                content_settings=ContentSettings(content_type=session['content_type']))
+        except Exception:
+            UploadSessionManager._set_status(session, 'open', queries.PREDICATE_UPLOAD_COMMITTING)
+            raise
+
+        # Only a verified hash may enter the dedup index; chunks arrive out of order
+        # (and SHA-256 digests of chunks do not combine), so it is computed from
+        # the assembled blob
+        try:
+            sha256 = blob_sha256(blob_client)
+        except Exception:
+            UploadSessionManager._set_status(session, 'open', queries.PREDICATE_UPLOAD_COMMITTING)
+            raise
+        if session.get('sha256') and sha256 != session['sha256']:
+            blob_client.delete_blob()
+            UploadSessionManager._set_status(session, 'failed', queries.PREDICATE_UPLOAD_COMMITTING)
+            raise ValueError('Uploaded content does not match the declared sha256')
+        blob_path = blob_index.acquire(sha256, size_bytes, session['blob_path'])
+
+        stored = {'id': session['file_id'], 'filename': session['filename'], 'blob_path': blob_path,
+                  'size_bytes': size_bytes, 'content_type': session['content_type'], 'sha256': sha256,
+                  'deduplicated': blob_path != session['blob_path']}
+        try:
+            file_info = FileManager.register(dataset, stored, session['created_by'],
+                                             session.get('description', ''), session.get('tags'))
+        except Exception:
+            UploadSessionManager._set_status(session, 'failed', queries.PREDICATE_UPLOAD_COMMITTING)
+            raise
+
+        state_container.patch_item(
+            item=session['id'], partition_key=session['id'],
+            patch_operations=[{'op': 'set', 'path': '/status', 'value': 'committed'},
+                              {'op': 'set', 'path': '/deduplicated', 'value': stored['deduplicated']}],
+            filter_predicate=queries.PREDICATE_UPLOAD_COMMITTING)
+        return file_info
+
+    @staticmethod
+    def abort(session):
+        """Abandon an open session (staged blocks are discarded by Blob storage)"""
+        try:
+            UploadSessionManager._set_status(session, 'aborted')
+        except exceptions.CosmosAccessConditionFailedError:
+            raise ValueError('Upload is no longer open')
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from azure.storage.blob import BlobBlock, ContentSettings
+
+# Size of each staged block, and how many blocks of one upload are in flight at once;
+# an upload holds at most UPLOAD_BLOCK_SIZE * UPLOAD_MAX_CONCURRENCY bytes in memory
+UPLOAD_BLOCK_SIZE = int(os.environ.get("UPLOAD_BLOCK_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_MAX_CONCURRENCY = int(os.environ.get("UPLOAD_MAX_CONCURRENCY", "4"))
+
+
+def block_id(index):
+    """Block id of the index-th block (Azure requires equal-length ids within a blob)"""
+    return f"block-{index:08d}"
+
+
+def read_block(stream, size):
+    """Read up to size bytes, stopping early only at the end of the stream (reads may be short)"""
+    parts = []
+    remaining = size
+    while remaining > 0:
+        data = stream.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b''.join(parts)
+
+
+def blob_sha256(blob_client):
+    """SHA-256 hex digest of a stored blob, streamed without holding it in memory"""
+    digest = hashlib.sha256()
+    for chunk in blob_client.download_blob().chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stream_sha256(stream, block_size=UPLOAD_BLOCK_SIZE):
+    """(size_bytes, SHA-256 hex digest) of everything left in a stream"""
+    digest = hashlib.sha256()
+    size_bytes = 0
+    while True:
+        data = read_block(stream, block_size)
+        if not data:
+            return size_bytes, digest.hexdigest()
+        digest.update(data)
+        size_bytes += len(data)
+
+
+class BlockUploader:
+    """Stream a file-like object to a block blob in fixed-size blocks
+
+    Blocks are read sequentially, hashed and counted as they go, and staged
+    with stage_block on a small thread pool; commit_block_list then assembles
+    the blob. Uploads that fit in a single block are written with one
+    upload_blob call instead.
+    """
+
+    def __init__(self, blob_client, block_size=UPLOAD_BLOCK_SIZE, max_concurrency=UPLOAD_MAX_CONCURRENCY):
+        self.blob_client = blob_client
+        self.block_size = max(1, block_size)
+        self.max_concurrency = max(1, max_concurrency)
+
+    def upload(self, stream, content_type=None):
+        """Upload everything left in stream; returns (size_bytes, sha256 hex digest)"""
+        content_settings = ContentSettings(content_type=content_type) if content_type else None
+        digest = hashlib.sha256()
+        # A block holds one of max_concurrency slots from before it is read until it is staged
+        slots = threading.BoundedSemaphore(self.max_concurrency)
+        errors = []
+
+        slots.acquire()
+        data = read_block(stream, self.block_size)
+        digest.update(data)
+        size = len(data)
+        if size < self.block_size:
+            self.blob_client.upload_blob(data, overwrite=True, content_settings=content_settings)
+            return size, digest.hexdigest()
+
+        def stage(block, payload):
+            try:
+                self.blob_client.stage_block(block_id=block, data=payload, length=len(payload))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                slots.release()
+
+        blocks = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            while data and not errors:
+                block = block_id(len(blocks))
+                blocks.append(BlobBlock(block_id=block))
+                pool.submit(stage, block, data)
+                slots.acquire()
+                data = read_block(stream, self.block_size)
+                digest.update(data)
+                size += len(data)
+        if errors:
+            raise errors[0]
+
+        self.blob_client.commit_block_list(blocks, content_settings=content_settings)
+        return size, digest.hexdigest()
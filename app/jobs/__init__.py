@@ -0,0 +1,7 @@
+"""
+Background jobs: the web app queues them with JobModel.enqueue and worker.py
+runs them on a process pool (see app/jobs/worker.py).
+"""
+from .models import JobModel
+
+__all__ = ['JobModel']
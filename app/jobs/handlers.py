@@ -0,0 +1,51 @@
+"""
+Job handlers, by job kind.
+
+A handler is called in a worker process with the job payload as keyword
+arguments and returns a small JSON-serializable result. Raising JobFailed
+fails the job for good; any other exception is retried.
+"""
+import zipfile
+
+HANDLERS = {}
+
+
+class JobFailed(Exception):
+    """A job error that retrying will not fix"""
+
+
+def handler(kind):
+    """Register a function as the handler of a job kind"""
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+@handler('profile_file')
+def profile_file(dataset_id, file_id):
+    """Profile an uploaded tabular file and store the profile on its file record"""
+    from ..datasets.files import FileManager
+    from ..datasets import blob_index
+    from ..datasets.profiling import profile_blob
+    from ..utils import blob_service_client, AZURE_BLOB_CONTAINER
+
+    dataset, file_info = FileManager.get_from_dataset(dataset_id, file_id)
+    if not file_info:
+        raise JobFailed('File not found')
+
+    sha256 = file_info.get('sha256')
+    profile = file_info.get('profile') or (blob_index.profile(sha256) if sha256 else None)
+    if profile is None:
+        blob_client = blob_service_client.get_blob_client(container=AZURE_BLOB_CONTAINER, blob=file_info['blob_path'])
+        try:
+            profile = profile_blob(blob_client, file_info['filename'])
+        except (ValueError, ImportError, zipfile.BadZipFile) as e:
+            raise JobFailed(f'Could not profile {file_info["filename"]}: {e}')
+        if profile is None:
+            return {'profiled': False}
+        if sha256:
+            blob_index.set_profile(sha256, profile)
+
+    FileManager.set_profile(dataset, file_id, profile)
+    return {'profiled': True, 'row_count': profile['row_count'], 'column_count': profile['column_count']}
@@ -0,0 +1,151 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+from ..cosmos_client import jobs_container
+from ..pagination import DEFAULT_PAGE_SIZE
+from .. import queries
+
+# Attempts per job, seconds a job may run, and the base of the retry backoff
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_TIMEOUT_SECONDS = int(os.environ.get("JOB_TIMEOUT_SECONDS", "600"))
+JOB_RETRY_SECONDS = int(os.environ.get("JOB_RETRY_SECONDS", "30"))
+# A running job whose worker has not finished it this long after its timeout is
+# presumed lost (the worker died) and may be claimed again
+JOB_LEASE_GRACE_SECONDS = 60
+
+STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+
+class JobModel:
+    """Durable background jobs, one document per job in the jobs container
+
+    The web app enqueues jobs; worker.py claims the due ones, highest
+    priority first, and runs them. Every state change is a patch guarded by
+    the ETag of the job as claimed, so two workers never both finish (or
+    retry) the same attempt.
+    """
+
+    @staticmethod
+    def enqueue(kind, payload, created_by=None, dataset_id=None, priority=0, timeout_seconds=None,
+                max_attempts=None):
+        """Queue a job; payload is passed to the handler as keyword arguments"""
+        now = datetime.utcnow().isoformat()
+        job = {
+            'id': str(uuid.uuid4()),
+            'doc_type': 'job',
+            'kind': kind,
+            'payload': payload,
+            'priority': int(priority),
+            'status': 'queued',
+            'attempts': 0,
+            'max_attempts': int(max_attempts or JOB_MAX_ATTEMPTS),
+            'timeout_seconds': int(timeout_seconds or JOB_TIMEOUT_SECONDS),
+            'available_at': now,
+            'created_by': created_by,
+            'dataset_id': dataset_id,
+            'created_at': now
+        }
+        return jobs_container.create_item(body=job)
+
+    @staticmethod
+    def get(job_id):
+        """Get a job by id"""
+        try:
+            return jobs_container.read_item(item=job_id, partition_key=job_id)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+    @staticmethod
+    def list_page(created_by, status=None, dataset_id=None, page_size=DEFAULT_PAGE_SIZE, continuation=None):
+        """One page of a user's jobs, newest first, as (jobs, continuation)"""
+        if status and status not in STATUSES:
+            raise ValueError(f"status must be one of {', '.join(STATUSES)}")
+        values = {'created_by': created_by}
+        if status:
+            values['status'] = status
+        if dataset_id:
+            values['dataset_id'] = dataset_id
+        template = queries.job_listing(by_status=bool(status), by_dataset=bool(dataset_id))
+        return template.page(jobs_container, page_size, continuation, **values)
+
+    @staticmethod
+    def status(job):
+        """The public view of a job"""
+        result = {key: job.get(key) for key in (
+            'id', 'kind', 'status', 'priority', 'attempts', 'max_attempts', 'dataset_id', 'payload',
+            'created_by', 'created_at', 'started_at', 'finished_at')}
+        if job['status'] == 'queued' and job['attempts']:
+            result['retry_at'] = job['available_at']
+        if job.get('error'):
+            result['error'] = job['error']
+        if job['status'] == 'succeeded':
+            result['result'] = job.get('result')
+        return result
+
+    @staticmethod
+    def _update(job, operations):
+        """Patch a job unless it changed since it was read; returns the new document or None"""
+        try:
+            return jobs_container.patch_item(
+                item=job['id'], partition_key=job['id'], patch_operations=operations,
+                etag=job['_etag'], match_condition=MatchConditions.IfNotModified)
+        except (exceptions.CosmosResourceNotFoundError, exceptions.CosmosAccessConditionFailedError):
+            return None
+
+    @staticmethod
+    def claim(worker_id, limit=1):
+        """Claim up to limit due jobs for a worker; returns the claimed jobs"""
+        now = datetime.utcnow()
+        claimed = []
+        for job in queries.JOBS_CLAIMABLE.items(jobs_container, limit=limit, now=now.isoformat()):
+            if job['status'] == 'running' and job['attempts'] >= job['max_attempts']:
+                # Its worker died during the last attempt
+                JobModel.fail(job, 'Worker stopped before the job finished', retry=False)
+                continue
+            lease = now + timedelta(seconds=job['timeout_seconds'] + JOB_LEASE_GRACE_SECONDS)
+            job = JobModel._update(job, [
+                {'op': 'set', 'path': '/status', 'value': 'running'},
+                {'op': 'set', 'path': '/worker', 'value': worker_id},
+                {'op': 'set', 'path': '/started_at', 'value': now.isoformat()},
+                {'op': 'set', 'path': '/lease_until', 'value': lease.isoformat()},
+                {'op': 'incr', 'path': '/attempts', 'value': 1}
+            ])
+            if job is not None:
+                claimed.append(job)
+        return claimed
+
+    @staticmethod
+    def complete(job, result=None):
+        """Record a claimed job's success"""
+        return JobModel._update(job, [
+            {'op': 'set', 'path': '/status', 'value': 'succeeded'},
+            {'op': 'set', 'path': '/result', 'value': result},
+            {'op': 'set', 'path': '/finished_at', 'value': datetime.utcnow().isoformat()}
+        ])
+
+    @staticmethod
+    def fail(job, error, retry=True):
+        """Record a claimed job's failure; it is queued again with exponential backoff while attempts remain"""
+        now = datetime.utcnow()
+        if retry and job['attempts'] < job['max_attempts']:
+            delay = JOB_RETRY_SECONDS * 2 ** max(job['attempts'] - 1, 0)
+            return JobModel._update(job, [
+                {'op': 'set', 'path': '/status', 'value': 'queued'},
+                {'op': 'set', 'path': '/available_at', 'value': (now + timedelta(seconds=delay)).isoformat()},
+                {'op': 'set', 'path': '/error', 'value': error}
+            ])
+        return JobModel._update(job, [
+            {'op': 'set', 'path': '/status', 'value': 'failed'},
+            {'op': 'set', 'path': '/error', 'value': error},
+            {'op': 'set', 'path': '/finished_at', 'value': now.isoformat()}
+        ])
+
+    @staticmethod
+    def release(job):
+        """Put a claimed job back in the queue without counting the attempt (worker shutdown)"""
+        return JobModel._update(job, [
+            {'op': 'set', 'path': '/status', 'value': 'queued'},
+            {'op': 'incr', 'path': '/attempts', 'value': -1}
+        ])
@@ -0,0 +1,120 @@
+"""
+Job worker: claims due jobs and runs them on a process pool.
+
+The pool uses spawned processes (each opens its own Cosmos/Blob clients).
+Job deadlines are tracked here; since a single pool process cannot be
+stopped on its own, a job that overruns its timeout restarts the pool, and
+the other jobs it was running go back to the queue without losing an attempt.
+"""
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from .models import JobModel
+
+# Jobs run at once, seconds between polls of an idle queue, and jobs a pool process runs before it is replaced
+JOB_WORKER_PROCESSES = int(os.environ.get("JOB_WORKER_PROCESSES", "2"))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "2"))
+JOB_TASKS_PER_PROCESS = 100
+
+
+def run_job(kind, payload):
+    """Run one job in a pool process; returns the handler's result"""
+    from .handlers import HANDLERS
+    return HANDLERS[kind](**payload)
+
+
+class Worker:
+    """Poll the jobs container and run claimed jobs until stopped"""
+
+    def __init__(self, processes=JOB_WORKER_PROCESSES, poll_seconds=JOB_POLL_SECONDS):
+        self.processes = max(1, processes)
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.pool = None
+        self.running = {}
+        self.stopping = False
+
+    def _start_pool(self):
+        context = multiprocessing.get_context('spawn')
+        self.pool = context.Pool(self.processes, maxtasksperchild=JOB_TASKS_PER_PROCESS)
+
+    def _restart_pool(self):
+        self.pool.terminate()
+        self.pool.join()
+        for job, _, _ in self.running.values():
+            JobModel.release(job)
+        self.running.clear()
+        self._start_pool()
+
+    def _submit(self, job):
+        from .handlers import HANDLERS
+        if job['kind'] not in HANDLERS:
+            JobModel.fail(job, f"Unknown job kind '{job['kind']}'", retry=False)
+            return
+        result = self.pool.apply_async(run_job, (job['kind'], job.get('payload') or {}))
+        self.running[job['id']] = (job, result, time.monotonic() + job['timeout_seconds'])
+        print(f"Started job {job['id']} ({job['kind']}, attempt {job['attempts']}/{job['max_attempts']})")
+
+    def _reap(self):
+        """Record finished and overdue jobs; returns how many were handled"""
+        from .handlers import JobFailed
+        handled = 0
+        timed_out = False
+        for job_id, (job, result, deadline) in list(self.running.items()):
+            if result.ready():
+                del self.running[job_id]
+                handled += 1
+                try:
+                    JobModel.complete(job, result.get())
+                    print(f"Job {job_id} succeeded")
+                except JobFailed as e:
+                    JobModel.fail(job, str(e), retry=False)
+                    print(f"Job {job_id} failed: {e}")
+                except Exception as e:
+                    JobModel.fail(job, f"{type(e).__name__}: {e}")
+                    print(f"Job {job_id} failed (attempt {job['attempts']}): {type(e).__name__}: {e}")
+            elif time.monotonic() > deadline:
+                del self.running[job_id]
+                handled += 1
+                timed_out = True
+                JobModel.fail(job, f"Timed out after {job['timeout_seconds']} seconds")
+                print(f"Job {job_id} timed out")
+        if timed_out:
+            self._restart_pool()
+        return handled
+
+    def run_once(self):
+        """Handle finished jobs and claim new ones for free processes; returns True if anything happened"""
+        handled = self._reap()
+        free = self.processes - len(self.running)
+        claimed = JobModel.claim(self.worker_id, free) if free > 0 else []
+        for job in claimed:
+            self._submit(job)
+        return bool(handled or claimed)
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run(self, until_idle=False):
+        """Work until stopped (SIGTERM/SIGINT), or with until_idle until the queue has no due jobs"""
+        signal.signal(signal.SIGTERM, self.stop)
+        self._start_pool()
+        print(f"Worker {self.worker_id} running {self.processes} processes")
+        try:
+            while not self.stopping:
+                busy = self.run_once()
+                if until_idle and not busy and not self.running:
+                    break
+                if not busy:
+                    time.sleep(self.poll_seconds if not self.running else min(self.poll_seconds, 0.1))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.pool.terminate()
+            self.pool.join()
+            for job, _, _ in self.running.values():
+                JobModel.release(job)
+            self.running.clear()
+            print(f"Worker {self.worker_id} stopped")
@@ -0,0 +1,60 @@
+import base64
+import binascii
+import os
+from azure.cosmos import exceptions
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "500"))
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Parse a page_size request argument, clamped to 1..MAX_PAGE_SIZE"""
+    try:
+        page_size = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        raise ValueError('page_size must be an integer')
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def encode_continuation(token):
+    """Wrap a Cosmos continuation token into an opaque, URL-safe string"""
+    if not token:
+        return None
+    return base64.urlsafe_b64encode(token.encode('utf-8')).decode('ascii')
+
+
+def decode_continuation(token):
+    """Reverse encode_continuation; raises ValueError for tampered tokens"""
+    if not token:
+        return None
+    try:
+        return base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8')
+    except (binascii.Error, UnicodeError):
+        raise ValueError('Invalid continuation token')
+
+
+def query_page(container, query, page_size, continuation=None, parameters=None, partition_key=None):
+    """Fetch one page of a query
+
+    Returns (items, continuation) where continuation is the opaque token for
+    the next page, or None on the last page. Only the requested page is
+    materialized.
+    """
+    options = {'max_item_count': page_size}
+    if parameters:
+        options['parameters'] = parameters
+    if partition_key is not None:
+        options['partition_key'] = partition_key
+    else:
+        options['enable_cross_partition_query'] = True
+
+    pager = container.query_items(query=query, **options).by_page(decode_continuation(continuation))
+    try:
+        items = list(next(pager))
+    except StopIteration:
+        return [], None
+    except exceptions.CosmosHttpResponseError as e:
+        if e.status_code == 400:
+            raise ValueError('Invalid continuation token')
+        raise
+    return items, encode_continuation(pager.continuation_token)
@@ -0,0 +1,119 @@
+"""
+Two-tier cache of file previews.
+
+Entries are keyed on the blob path, the blob's ETag and the preview variant,
+so a blob whose content changes simply stops matching its old entries, which
+then age out. The first tier is an in-process LRU (TTLCache); the second is a
+directory of JSON files shared by every process on the host, trimmed back
+under PREVIEW_CACHE_DISK_BYTES by least recent use.
+"""
+import hashlib
+import json
+import os
+import threading
+from .cache import TTLCache
+
+# Previews kept in memory per process, and the on-disk tier's directory and size budget
+PREVIEW_CACHE_SIZE = int(os.environ.get("PREVIEW_CACHE_SIZE", "256"))
+PREVIEW_CACHE_DIR = os.environ.get("PREVIEW_CACHE_DIR", os.path.join('.cache', 'previews'))
+PREVIEW_CACHE_DISK_BYTES = int(os.environ.get("PREVIEW_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+
+
+class PreviewCache:
+    """Preview payloads by (blob path, ETag, variant), in memory and on local disk"""
+
+    def __init__(self, directory=PREVIEW_CACHE_DIR, max_bytes=PREVIEW_CACHE_DISK_BYTES, maxsize=PREVIEW_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory = TTLCache('previews', maxsize=maxsize, ttl=None)
+        self._lock = threading.Lock()
+        # Estimated size of the disk tier; None until the first write scans it
+        self._disk_bytes = None
+
+    @staticmethod
+    def _key(blob_path, etag, variant):
+        return hashlib.sha256(json.dumps([blob_path, etag, variant]).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, blob_path, etag, variant=''):
+        """A cached preview, or None"""
+        key = self._key(blob_path, etag, variant)
+        preview = self.memory.get(key)
+        if preview is not None or self.max_bytes <= 0:
+            return preview
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                preview = json.load(handle)
+            # The modification time is the disk tier's recency
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        self.memory.set(key, preview)
+        return preview
+
+    def set(self, blob_path, etag, variant, preview):
+        """Store a preview in both tiers"""
+        key = self._key(blob_path, etag, variant)
+        self.memory.set(key, preview)
+        if self.max_bytes <= 0:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as handle:
+                json.dump(preview, handle)
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError):
+            # The disk tier is best effort
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += size
+            if self._disk_bytes is None or self._disk_bytes > self.max_bytes:
+                self._disk_bytes = self._trim()
+
+    def _trim(self):
+        """Delete the least recently used files until the disk tier is within 90% of its budget;
+        returns its size"""
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return total
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        return total
+
+    def clear(self):
+        """Drop every entry of both tiers"""
+        self.memory.clear()
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                try:
+                    os.remove(os.path.join(root, name))
+                except OSError:
+                    pass
+        with self._lock:
+            self._disk_bytes = 0
+
+
+preview_cache = PreviewCache()
@@ -0,0 +1,218 @@
+"""
+Every Cosmos SQL query the app runs, as named parameterized templates.
+
+Query text never contains request values: callers bind them as @parameters,
+so each template has a single query text. That lets the SDK, Cosmos and the
+local backend reuse the compiled plan, and it keeps the whole SQL surface in
+this file. Templates with structural variants (projection, deleted filter,
+number of tag predicates) are generated from fixed fragments and cached per
+variant.
+"""
+import re
+from functools import lru_cache
+from .pagination import query_page
+
+_PARAMETER = re.compile(r'@\w+')
+
+
+class QueryTemplate:
+    """A named query text with its declared @parameters"""
+
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+        self.parameters = frozenset(_PARAMETER.findall(text))
+
+    def bind(self, **values):
+        """Cosmos parameters for this template; every parameter must be given, and nothing else"""
+        names = {f'@{key}' for key in values}
+        if names != self.parameters:
+            raise ValueError(f"Query {self.name} takes {sorted(self.parameters)}, got {sorted(names)}")
+        return [{'name': f'@{key}', 'value': value} for key, value in values.items()]
+
+    def items(self, container, partition_key=None, **values):
+        """Run the query and return the results as a list"""
+        options = {'parameters': self.bind(**values)}
+        if partition_key is not None:
+            options['partition_key'] = partition_key
+        else:
+            options['enable_cross_partition_query'] = True
+        return list(container.query_items(query=self.text, **options))
+
+    def iterate(self, container, **values):
+        """Run a cross-partition query and stream the results"""
+        return container.query_items(query=self.text, parameters=self.bind(**values),
+                                     enable_cross_partition_query=True)
+
+    def page(self, container, page_size, continuation=None, partition_key=None, **values):
+        """One page of results, as (items, continuation); see pagination.query_page"""
+        return query_page(container, self.text, page_size, continuation,
+                          parameters=self.bind(**values), partition_key=partition_key)
+
+    def __repr__(self):
+        return f"QueryTemplate({self.name!r})"
+
+
+# -- dataset projections --
+
+# Fields rendered by list/search views; file count and size are totals kept on the dataset
+DATASET_SUMMARY_FIELDS = (
+    "c.id, c.name, c.base_name, c.description, c.version, c.tags, c.created_by, c.created_at, "
+    "c.is_production, c.is_deleted, c.deleted_by, c.deleted_at, c.parent_id, "
+    "c.file_count, c.total_size_bytes"
+)
+
+# File records share the metadata container (and the dataset's partition); dataset
+# documents are the ones without a doc_type
+IS_DATASET = "NOT IS_DEFINED(c.doc_type)"
+
+DATASET_PROJECTIONS = {
+    'full': "*",
+    'summary': DATASET_SUMMARY_FIELDS,
+    'api': "c.id, c.name, c.description, c.version, c.tags, c.created_at, c.created_by",
+}
+
+# Upper bound on tag filters in one listing query
+MAX_TAG_FILTERS = 10
+
+
+# -- users --
+
+USER_BY_API_KEY = QueryTemplate('user_by_api_key', "SELECT * FROM c WHERE c.api_key = @api_key")
+USER_BY_USERNAME = QueryTemplate('user_by_username', "SELECT * FROM c WHERE c.username = @username")
+USER_BY_USERNAME_OR_EMAIL = QueryTemplate(
+    'user_by_username_or_email', "SELECT * FROM c WHERE c.username = @username OR c.email = @email")
+USERS_ALL = QueryTemplate(
+    'users_all', "SELECT c.id, c.username, c.email, c.role, c.status, c._ts FROM c ORDER BY c._ts DESC")
+USERS_BY_STATUS = QueryTemplate(
+    'users_by_status', "SELECT c.id, c.username, c.email, c._ts FROM c WHERE c.status = @status ORDER BY c._ts DESC")
+
+# -- activities --
+
+ACTIVITIES_RECENT = QueryTemplate(
+    'activities_recent',
+    "SELECT TOP @limit c.id, c.timestamp, c.username, c.message, c.activity_type FROM c ORDER BY c._ts DESC")
+ACTIVITIES_BY_USER = QueryTemplate(
+    'activities_by_user',
+    "SELECT TOP @limit c.id, c.timestamp, c.message, c.activity_type FROM c "
+    "WHERE c.username = @username ORDER BY c._ts DESC")
+
+# -- datasets --
+
+DOCUMENT_BY_ID = QueryTemplate('document_by_id', "SELECT * FROM c WHERE c.id = @id")
+DATASETS_RECENT = QueryTemplate(
+    'datasets_recent',
+    "SELECT TOP @limit c.id, c.name, c.description, c.version, c.tags, c.created_at FROM c "
+    f"WHERE {IS_DATASET} ORDER BY c._ts DESC")
+DATASETS_BY_CREATOR = QueryTemplate(
+    'datasets_by_creator',
+    "SELECT c.id, c.name, c.version, c.created_at, c.file_count, c.total_size_bytes "
+    f"FROM c WHERE c.created_by = @created_by AND {IS_DATASET} ORDER BY c._ts DESC")
+DATASETS_ACTIVE_BY_NAME = QueryTemplate(
+    'datasets_active_by_name', f"SELECT * FROM c WHERE c.name = @name AND NOT IS_DEFINED(c.is_deleted) AND {IS_DATASET}")
+DATASET_FAMILY = QueryTemplate(
+    'dataset_family', f"SELECT * FROM c WHERE c.base_name = @base_name AND {IS_DATASET} ORDER BY c.version DESC")
+DATASET_FAMILY_MAX_VERSION = QueryTemplate(
+    'dataset_family_max_version', "SELECT VALUE MAX(c.version) FROM c WHERE c.base_name = @base_name")
+DATASET_FAMILY_OTHER_PRODUCTION = QueryTemplate(
+    'dataset_family_other_production',
+    "SELECT * FROM c WHERE c.base_name = @base_name AND c.is_production = true AND c.id != @id")
+DATASETS_CHANGED_SINCE = QueryTemplate(
+    'datasets_changed_since', f"SELECT {DATASET_SUMMARY_FIELDS}, c._ts FROM c WHERE c._ts >= @since AND {IS_DATASET}")
+DATASET_LINEAGE_CHANGED_SINCE = QueryTemplate(
+    'dataset_lineage_changed_since',
+    "SELECT c.id, c.name, c.version, c.base_name, c.parent_id, c.tags, c.is_deleted, c._ts "
+    f"FROM c WHERE c._ts >= @since AND {IS_DATASET}")
+DATASET_TAGS_ACTIVE = QueryTemplate(
+    'dataset_tags_active',
+    f"SELECT c.id, c.tags FROM c WHERE (NOT IS_DEFINED(c.is_deleted) OR c.is_deleted = false) AND {IS_DATASET}")
+DATASET_TAGS_ACTIVE_WITH_TAG = QueryTemplate(
+    'dataset_tags_active_with_tag',
+    "SELECT c.id, c.tags FROM c WHERE (ARRAY_CONTAINS(c.tags_norm, @tag) OR NOT IS_DEFINED(c.tags_norm)) "
+    f"AND (NOT IS_DEFINED(c.is_deleted) OR c.is_deleted = false) AND {IS_DATASET}")
+DATASET_ACTIVITY = QueryTemplate(
+    'dataset_activity',
+    "SELECT c.doc_type, c.created_at, c.created_by, c.uploaded_at, c.uploaded_by, c.size_bytes, c.files FROM c")
+DATASETS_WITHOUT_TAGS_NORM = QueryTemplate(
+    'datasets_without_tags_norm',
+    f"SELECT c.id, c.base_name, c.tags FROM c WHERE NOT IS_DEFINED(c.tags_norm) AND {IS_DATASET}")
+DATASETS_WITH_EMBEDDED_FILES = QueryTemplate(
+    'datasets_with_embedded_files',
+    f"SELECT * FROM c WHERE (IS_DEFINED(c.files) OR NOT IS_DEFINED(c.file_count)) AND {IS_DATASET}")
+
+# -- files --
+
+DATASET_FILES = QueryTemplate(
+    'dataset_files', "SELECT * FROM c WHERE c.doc_type = 'file' AND c.dataset_id = @dataset_id ORDER BY c.uploaded_at")
+FAMILY_FILE_WITH_CONTENT = QueryTemplate(
+    'family_file_with_content',
+    "SELECT TOP 1 c.id FROM c WHERE c.doc_type = 'file' AND c.base_name = @base_name "
+    "AND c.sha256 = @sha256 AND c.size_bytes = @size_bytes")
+
+
+@lru_cache(maxsize=None)
+def dataset_listing(projection='full', show_deleted=False, tag_count=0):
+    """Newest-first dataset listing, optionally restricted to datasets carrying tag_count tags
+
+    Tags are bound as @tag0..@tagN against the normalized tags_norm array.
+    """
+    if tag_count > MAX_TAG_FILTERS:
+        raise ValueError(f"At most {MAX_TAG_FILTERS} tag filters are supported")
+    clauses = [IS_DATASET] if show_deleted else [IS_DATASET, "NOT IS_DEFINED(c.is_deleted)"]
+    clauses += [f"ARRAY_CONTAINS(c.tags_norm, @tag{index})" for index in range(tag_count)]
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    name = f"datasets_{projection}{'_with_deleted' if show_deleted else ''}_tags{tag_count}"
+    return QueryTemplate(name, f"SELECT {DATASET_PROJECTIONS[projection]} FROM c{where} ORDER BY c._ts DESC")
+
+
+def tag_values(tags):
+    """Bind values for dataset_listing's @tagN parameters"""
+    return {f'tag{index}': tag for index, tag in enumerate(tags)}
+
+
+# Patch filter predicates (Cosmos does not accept parameters in these)
+PREDICATE_IS_PRODUCTION = "FROM c WHERE c.is_production = true"
+PREDICATE_NOT_DELETED = "FROM c WHERE NOT IS_DEFINED(c.is_deleted)"
+PREDICATE_IS_DELETED = "FROM c WHERE c.is_deleted = true"
+PREDICATE_UPLOAD_OPEN = "FROM c WHERE c.status = 'open'"
+PREDICATE_UPLOAD_COMMITTING = "FROM c WHERE c.status = 'committing'"
+PREDICATE_BLOB_REFERENCED = "FROM c WHERE c.refcount > 0"
+
+
+# -- state documents --
+
+TAG_DOCS_CHANGED_SINCE = QueryTemplate(
+    'tag_docs_changed_since', "SELECT * FROM c WHERE c.doc_type = 'tag' AND c._ts >= @since")
+ROLLUP_KEYS = QueryTemplate(
+    'rollup_keys', "SELECT c.period, c.bucket, c.scope FROM c WHERE c.doc_type = 'rollup'")
+ROLLUP_BUCKETS_SINCE = QueryTemplate(
+    'rollup_buckets_since',
+    "SELECT * FROM c WHERE c.doc_type = 'rollup' AND c.period = @period AND c.scope = @scope "
+    "AND c.bucket >= @since ORDER BY c.bucket")
+ROLLUP_BUCKETS_BETWEEN = QueryTemplate(
+    'rollup_buckets_between',
+    "SELECT * FROM c WHERE c.doc_type = 'rollup' AND c.period = @period AND c.scope = @scope "
+    "AND c.bucket >= @since AND c.bucket <= @until ORDER BY c.bucket")
+
+
+# -- jobs --
+
+# Queued jobs that are due, and running jobs whose worker's lease has run out;
+# the ORDER BY needs the (priority DESC, available_at ASC) composite index from init_db.py
+JOBS_CLAIMABLE = QueryTemplate(
+    'jobs_claimable',
+    "SELECT TOP @limit * FROM c WHERE (c.status = 'queued' AND c.available_at <= @now) "
+    "OR (c.status = 'running' AND c.lease_until < @now) ORDER BY c.priority DESC, c.available_at")
+
+
+@lru_cache(maxsize=None)
+def job_listing(by_status=False, by_dataset=False):
+    """Newest-first jobs of a user, optionally restricted to a @status and/or @dataset_id"""
+    clauses = ["c.created_by = @created_by"]
+    if by_status:
+        clauses.append("c.status = @status")
+    if by_dataset:
+        clauses.append("c.dataset_id = @dataset_id")
+    name = f"jobs{'_by_status' if by_status else ''}{'_by_dataset' if by_dataset else ''}"
+    return QueryTemplate(name, f"SELECT * FROM c WHERE {' AND '.join(clauses)} ORDER BY c.created_at DESC")
+
@@ -0,0 +1,185 @@
+import threading
+from collections import OrderedDict
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+from azure.cosmos.partition_key import NonePartitionKeyValue
+from . import queries
+
+# Marks a container whose properties could not be read
+_UNKNOWN = object()
+
+
+class ContainerRepository:
+    """Partition-aware document access on top of a Cosmos container client.
+
+    Resolves documents by id with point reads (``read_item``) instead of
+    cross-partition ``SELECT * FROM c WHERE c.id = ...`` queries. When the
+    container is not partitioned on ``/id`` the partition key value of a
+    document is remembered in a bounded id -> partition key map, and a
+    single fan-out query is only issued the first time an id is seen.
+    """
+
+    def __init__(self, container, partition_key_path=None, max_cached_keys=100000):
+        self.container = container
+        self._partition_key_path = partition_key_path
+        self._max_cached_keys = max_cached_keys
+        self._partition_keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def partition_key_path(self):
+        """Partition key path of the container, e.g. '/base_name'"""
+        if self._partition_key_path is None:
+            try:
+                properties = self.container.read()
+                self._partition_key_path = properties['partitionKey']['paths'][0]
+            except Exception:
+                # Without container metadata every lookup falls back to a query;
+                # the failure is remembered so the read is not repeated per call
+                self._partition_key_path = _UNKNOWN
+        if self._partition_key_path is _UNKNOWN:
+            return None
+        return self._partition_key_path
+
+    def partition_key_value(self, document):
+        """Extract the partition key value from a document"""
+        path = self.partition_key_path
+        if not path or not document:
+            return None
+
+        value = document
+        for part in path.strip('/').split('/'):
+            if not isinstance(value, dict) or part not in value:
+                return None
+            value = value[part]
+        return value
+
+    def stored_partition_key(self, document):
+        """The partition key a full stored document is addressed by: its key value,
+        or NonePartitionKeyValue when it lacks the key field (as dataset and file
+        documents do on a container partitioned on /type)"""
+        path = self.partition_key_path
+        if not path or not document:
+            return None
+
+        value = document
+        for part in path.strip('/').split('/'):
+            if not isinstance(value, dict) or part not in value:
+                return NonePartitionKeyValue
+            value = value[part]
+        return value
+
+    def remember(self, document):
+        """Record the partition key of a document for later point reads"""
+        partition_key = self.stored_partition_key(document)
+        if partition_key is None or self.partition_key_path == '/id':
+            return
+
+        with self._lock:
+            self._partition_keys[document['id']] = partition_key
+            self._partition_keys.move_to_end(document['id'])
+            while len(self._partition_keys) > self._max_cached_keys:
+                self._partition_keys.popitem(last=False)
+
+    def forget(self, item_id):
+        """Drop a cached partition key"""
+        with self._lock:
+            self._partition_keys.pop(item_id, None)
+
+    def _cached_partition_key(self, item_id):
+        with self._lock:
+            partition_key = self._partition_keys.get(item_id)
+            if partition_key is not None:
+                self._partition_keys.move_to_end(item_id)
+            return partition_key
+
+    def _read(self, item_id, partition_key):
+        try:
+            return self.container.read_item(item=item_id, partition_key=partition_key)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+    def get(self, item_id, partition_key=None):
+        """Get a document by id, using a point read whenever the partition key is known
+
+        ``partition_key`` is an optional hint (for example the ``base_name`` of
+        a sibling version). A wrong hint costs one extra point read.
+        """
+        if not item_id:
+            return None
+
+        if self.partition_key_path == '/id':
+            return self._read(item_id, item_id)
+
+        tried = []
+        for candidate in (partition_key, self._cached_partition_key(item_id)):
+            if candidate is None or candidate in tried:
+                continue
+            tried.append(candidate)
+            document = self._read(item_id, candidate)
+            if document:
+                self.remember(document)
+                return document
+        self.forget(item_id)
+
+        items = queries.DOCUMENT_BY_ID.items(self.container, id=item_id)
+        if not items:
+            return None
+
+        self.remember(items[0])
+        return items[0]
+
+    def create(self, document):
+        """Create a document and remember its partition key"""
+        created = self.container.create_item(body=document)
+        self.remember(document)
+        return created
+
+    def replace(self, document, etag=None):
+        """Replace a document (only if its ETag still matches, when given)"""
+        if etag:
+            replaced = self.container.replace_item(
+                item=document['id'], body=document, etag=etag, match_condition=MatchConditions.IfNotModified)
+        else:
+            replaced = self.container.replace_item(item=document['id'], body=document)
+        self.remember(document)
+        return replaced
+
+    def upsert(self, document):
+        """Upsert a document and remember its partition key"""
+        upserted = self.container.upsert_item(document)
+        self.remember(document)
+        return upserted
+
+    def _patch_partition_key(self, document):
+        """Partition key of the stored copy of a document that may carry only some of its fields"""
+        if self.partition_key_path is None:
+            raise ValueError(f"Cannot resolve the partition key of {document['id']}: "
+                             f"container {self.container.id} could not be read")
+
+        partition_key = self.partition_key_value(document)
+        if partition_key is None:
+            partition_key = self._cached_partition_key(document['id'])
+        if partition_key is None:
+            stored = self.get(document['id'])
+            partition_key = self.stored_partition_key(stored) if stored else None
+        # Documents without the key field live in the "none" partition
+        return NonePartitionKeyValue if partition_key is None else partition_key
+
+    def patch(self, document, operations, filter_predicate=None):
+        """Apply partial-document patch operations to an existing document"""
+        partition_key = self._patch_partition_key(document)
+        options = {'filter_predicate': filter_predicate} if filter_predicate else {}
+        patched = self.container.patch_item(
+            item=document['id'], partition_key=partition_key, patch_operations=operations, **options)
+        self.remember(patched)
+        return patched
+
+    def batch(self, partition_key, operations):
+        """Run a transactional batch in one partition; returns the resulting documents"""
+        results = self.container.execute_item_batch(batch_operations=operations, partition_key=partition_key)
+        documents = [result.get('resourceBody') for result in results]
+        for document in documents:
+            if document:
+                self.remember(document)
+        return documents
@@ -0,0 +1,27 @@
+"""
+Storage backend selection.
+
+STORAGE_BACKEND=azure (default) uses Cosmos DB and Blob Storage.
+STORAGE_BACKEND=local keeps documents in a SQLite file and blobs in a
+directory under LOCAL_STORAGE_PATH, so the catalog can run, be profiled
+and be load-tested without Azure.
+"""
+import os
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "azure").lower()
+LOCAL_STORAGE_PATH = os.environ.get("LOCAL_STORAGE_PATH", ".localdata")
+
+
+def is_local_backend():
+    """True when the local SQLite/filesystem backend is selected"""
+    return STORAGE_BACKEND == 'local'
+
+
+def local_database_path():
+    """SQLite database used for the local document store"""
+    return os.environ.get("LOCAL_COSMOS_DB", os.path.join(LOCAL_STORAGE_PATH, 'cosmos.sqlite3'))
+
+
+def local_blob_root():
+    """Directory used for local blob storage"""
+    return os.path.join(LOCAL_STORAGE_PATH, 'blobs')
@@ -0,0 +1,715 @@
+"""
+Evaluator for the subset of the Cosmos DB SQL dialect used by the catalog.
+
+Supported:
+    SELECT [TOP n] [VALUE] * | expr [AS alias], ... FROM c
+    [WHERE expr] [ORDER BY expr [ASC|DESC], ...] [OFFSET n LIMIT m]
+
+Expressions cover property paths (c.a.b, c['a']), string/number/boolean/null
+literals, @parameters, comparison operators, AND/OR/NOT, IN (...), scalar
+subqueries over arrays ((SELECT VALUE SUM(f.x) FROM f IN c.files)) and the
+functions in FUNCTIONS. COUNT/SUM/MIN/MAX/AVG are supported as aggregates in
+the select list. As in Cosmos, missing properties evaluate to undefined,
+which is omitted from projections and never satisfies a WHERE clause.
+
+Queries are parsed once per distinct query text and compiled to Python
+closures, so parameterized queries reuse the compiled plan. Top-level
+`c.path <op> literal/@param` conjuncts of the WHERE clause are also kept as
+plain filters, which a storage engine can apply before documents are decoded.
+"""
+import re
+from functools import lru_cache
+
+
+class _Undefined:
+    """Marker for Cosmos 'undefined' values"""
+
+    def __repr__(self):
+        return 'undefined'
+
+    def __bool__(self):
+        return False
+
+
+UNDEFINED = _Undefined()
+
+
+class CosmosSqlError(ValueError):
+    """Raised for queries outside the supported subset"""
+
+
+# ===== Tokenizer =====
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.)*")
+  | (?P<param>@[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op><=|>=|!=|<>|\|\||[=<>(),.\[\]*+\-/%])
+""", re.VERBOSE)
+
+_KEYWORDS = {
+    'SELECT', 'TOP', 'VALUE', 'FROM', 'WHERE', 'ORDER', 'BY', 'ASC', 'DESC',
+    'AND', 'OR', 'NOT', 'AS', 'IN', 'OFFSET', 'LIMIT', 'TRUE', 'FALSE',
+    'NULL', 'UNDEFINED', 'DISTINCT',
+}
+
+
+def _unescape(literal):
+    quote = literal[0]
+    body = literal[1:-1]
+    if quote == "'":
+        body = body.replace("''", "'")
+    return re.sub(r'\\(.)', lambda m: {'n': '\n', 't': '\t', 'r': '\r'}.get(m.group(1), m.group(1)), body)
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match:
+            raise CosmosSqlError(f"Unexpected character at {pos}: {text[pos:pos + 10]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'ws':
+            continue
+        if kind == 'ident' and value.upper() in _KEYWORDS:
+            tokens.append(('kw', value.upper()))
+        elif kind == 'number':
+            tokens.append(('literal', float(value) if any(ch in value for ch in '.eE') else int(value)))
+        elif kind == 'string':
+            tokens.append(('literal', _unescape(value)))
+        else:
+            tokens.append((kind, value))
+    tokens.append(('eof', None))
+    return tokens
+
+
+# ===== Value semantics =====
+
+def _type_rank(value):
+    if value is UNDEFINED:
+        return 0
+    if value is None:
+        return 1
+    if isinstance(value, bool):
+        return 2
+    if isinstance(value, (int, float)):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, list):
+        return 5
+    return 6
+
+
+def _comparable(left, right):
+    return (left is not UNDEFINED and right is not UNDEFINED
+            and _type_rank(left) == _type_rank(right) and _type_rank(left) in (1, 2, 3, 4))
+
+
+def _compare(op, left, right):
+    if left is UNDEFINED or right is UNDEFINED:
+        return UNDEFINED
+    if op in ('=', '!=', '<>'):
+        equal = _type_rank(left) == _type_rank(right) and left == right
+        return equal if op == '=' else not equal
+    if not _comparable(left, right):
+        return UNDEFINED
+    if op == '<':
+        return left < right
+    if op == '>':
+        return left > right
+    if op == '<=':
+        return left <= right
+    return left >= right
+
+
+def _and(left, right):
+    if left is False or right is False:
+        return False
+    if left is True and right is True:
+        return True
+    return UNDEFINED
+
+
+def _or(left, right):
+    if left is True or right is True:
+        return True
+    if left is False and right is False:
+        return False
+    return UNDEFINED
+
+
+def sort_key(value):
+    """Ordering key matching Cosmos ORDER BY across mixed types"""
+    rank = _type_rank(value)
+    if rank in (2, 3, 4):
+        return (rank, value)
+    return (rank, 0)
+
+
+def _is_str(*values):
+    return all(isinstance(value, str) for value in values)
+
+
+def _fn_contains(value, substring, ignore_case=False):
+    if not _is_str(value, substring):
+        return UNDEFINED
+    if ignore_case is True:
+        return substring.lower() in value.lower()
+    return substring in value
+
+
+def _fn_startswith(value, prefix, ignore_case=False):
+    if not _is_str(value, prefix):
+        return UNDEFINED
+    if ignore_case is True:
+        return value.lower().startswith(prefix.lower())
+    return value.startswith(prefix)
+
+
+def _fn_endswith(value, suffix, ignore_case=False):
+    if not _is_str(value, suffix):
+        return UNDEFINED
+    if ignore_case is True:
+        return value.lower().endswith(suffix.lower())
+    return value.endswith(suffix)
+
+
+def _fn_array_contains(array, value, partial=False):
+    if not isinstance(array, list) or value is UNDEFINED:
+        return UNDEFINED
+    if partial is True and isinstance(value, dict):
+        return any(isinstance(item, dict) and all(item.get(k, UNDEFINED) == v for k, v in value.items())
+                   for item in array)
+    return any(_type_rank(item) == _type_rank(value) and item == value for item in array)
+
+
+FUNCTIONS = {
+    'CONTAINS': _fn_contains,
+    'STARTSWITH': _fn_startswith,
+    'ENDSWITH': _fn_endswith,
+    'LOWER': lambda value: value.lower() if _is_str(value) else UNDEFINED,
+    'UPPER': lambda value: value.upper() if _is_str(value) else UNDEFINED,
+    'LENGTH': lambda value: len(value) if _is_str(value) else UNDEFINED,
+    'IS_DEFINED': lambda value: value is not UNDEFINED,
+    'IS_NULL': lambda value: value is None,
+    'IS_ARRAY': lambda value: isinstance(value, list),
+    'IS_STRING': lambda value: isinstance(value, str),
+    'IS_NUMBER': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'IS_BOOL': lambda value: isinstance(value, bool),
+    'ARRAY_LENGTH': lambda value: len(value) if isinstance(value, list) else UNDEFINED,
+    'ARRAY_CONTAINS': _fn_array_contains,
+}
+
+AGGREGATES = {'COUNT', 'SUM', 'MIN', 'MAX', 'AVG'}
+
+# Comparisons kept as plain filters when they appear as top-level WHERE conjuncts
+FILTER_OPERATORS = {'=', '<', '>', '<=', '>='}
+
+
+def _aggregate(name, values):
+    values = [value for value in values if value is not UNDEFINED]
+    if name == 'COUNT':
+        return len(values)
+    numbers = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    if name == 'SUM':
+        return sum(numbers) if len(numbers) == len(values) else UNDEFINED
+    if name == 'AVG':
+        return sum(numbers) / len(numbers) if numbers and len(numbers) == len(values) else UNDEFINED
+    comparable = [value for value in values if _type_rank(value) in (2, 3, 4)]
+    if not comparable:
+        return UNDEFINED
+    picked = min(comparable, key=sort_key) if name == 'MIN' else max(comparable, key=sort_key)
+    return picked
+
+
+# ===== Parser / compiler =====
+
+class _Query:
+    """A compiled query"""
+
+    def __init__(self):
+        self.top = None
+        self.value = False
+        self.star = False
+        self.projections = []   # list of (name, fn, aggregate_name or None)
+        self.alias = 'c'
+        self.where = None
+        self.order_by = []      # list of (fn, descending)
+        self.filters = []       # list of (path, op, value fn) ANDed into WHERE
+        self.offset = None
+        self.limit = None
+
+    @property
+    def is_aggregate(self):
+        return bool(self.projections) and all(agg for _, _, agg in self.projections)
+
+
+class _Parser:
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+        self.alias = 'c'
+        self.auto_names = 0
+
+    # -- token helpers --
+
+    def peek(self, offset=0):
+        return self.tokens[self.pos + offset]
+
+    def next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.pos += 1
+            return token
+        return None
+
+    def expect(self, kind, value=None):
+        token = self.accept(kind, value)
+        if not token:
+            raise CosmosSqlError(f"Expected {value or kind}, found {self.peek()[1]!r}")
+        return token
+
+    # -- statements --
+
+    def parse_query(self):
+        query = _Query()
+        self.expect('kw', 'SELECT')
+        if self.accept('kw', 'TOP'):
+            query.top = self._int_or_param()
+        if self.accept('kw', 'VALUE'):
+            query.value = True
+
+        # FROM comes after the projection but defines the alias, so look ahead for it
+        query.alias = self._lookahead_alias()
+        self.alias = query.alias
+
+        if self.accept('op', '*'):
+            query.star = True
+        else:
+            while True:
+                query.projections.append(self._projection())
+                if not self.accept('op', ','):
+                    break
+
+        self.expect('kw', 'FROM')
+        self.expect('ident')
+        if self.peek()[0] == 'ident':
+            self.next()
+
+        if self.accept('kw', 'WHERE'):
+            query.where = self._where(query)
+
+        if self.accept('kw', 'ORDER'):
+            self.expect('kw', 'BY')
+            while True:
+                fn = self.parse_expr()
+                descending = False
+                if self.accept('kw', 'DESC'):
+                    descending = True
+                else:
+                    self.accept('kw', 'ASC')
+                query.order_by.append((fn, descending))
+                if not self.accept('op', ','):
+                    break
+
+        if self.accept('kw', 'OFFSET'):
+            query.offset = self._int_or_param()
+            self.expect('kw', 'LIMIT')
+            query.limit = self._int_or_param()
+
+        self.expect('eof')
+        return query
+
+    def _int_or_param(self):
+        token = self.next()
+        if token[0] == 'literal' and isinstance(token[1], int):
+            value = token[1]
+            return lambda params: value
+        if token[0] == 'param':
+            name = token[1]
+            return lambda params: params[name]
+        raise CosmosSqlError(f"Expected integer, found {token[1]!r}")
+
+    def _lookahead_alias(self):
+        depth = 0
+        for index in range(self.pos, len(self.tokens) - 1):
+            kind, value = self.tokens[index]
+            if kind == 'op' and value == '(':
+                depth += 1
+            elif kind == 'op' and value == ')':
+                depth -= 1
+            elif depth == 0 and kind == 'kw' and value == 'FROM':
+                following = self.tokens[index + 1:index + 3]
+                if len(following) > 1 and following[1][0] == 'ident':
+                    return following[1][1]
+                return following[0][1]
+        raise CosmosSqlError("Missing FROM clause")
+
+    def _simple_path(self, start, end):
+        """Return ('a', 'b') when the tokens form a plain c.a.b path"""
+        tokens = self.tokens[start:end]
+        if not tokens or tokens[0] != ('ident', self.alias):
+            return None
+        path = []
+        index = 1
+        while index < len(tokens):
+            if tokens[index] == ('op', '.') and index + 1 < len(tokens) and tokens[index + 1][0] in ('ident', 'kw'):
+                path.append(tokens[index + 1][1])
+                index += 2
+            else:
+                return None
+        return tuple(path)
+
+    def _projection(self):
+        token = self.peek()
+        aggregate = None
+        if token[0] == 'ident' and token[1].upper() in AGGREGATES and self.peek(1) == ('op', '('):
+            aggregate = token[1].upper()
+            self.pos += 2
+            fn = self.parse_expr()
+            self.expect('op', ')')
+            name = None
+        else:
+            start = self.pos
+            fn = self.parse_expr()
+            path = self._simple_path(start, self.pos)
+            name = path[-1] if path else None
+
+        if self.accept('kw', 'AS'):
+            name = self.expect('ident')[1]
+        elif self.peek()[0] == 'ident':
+            name = self.next()[1]
+
+        if name is None:
+            self.auto_names += 1
+            name = f"${self.auto_names}"
+        return name, fn, aggregate
+
+    def _where(self, query):
+        """Parse a WHERE clause, noting its top-level plain comparisons in query.filters"""
+        filters = []
+        where = self._filter(filters)
+        while self.accept('kw', 'AND'):
+            right = self._filter(filters)
+            where = (lambda l, r: lambda env: _and(l(env), r(env)))(where, right)
+        if self.peek() == ('kw', 'OR'):
+            # Any OR at the top level means no conjunct has to hold on its own
+            filters = []
+            while self.accept('kw', 'OR'):
+                right = self._and_expr()
+                where = (lambda l, r: lambda env: _or(l(env), r(env)))(where, right)
+        query.filters = filters
+        return where
+
+    def _filter(self, filters):
+        """Parse one conjunct; a `c.path <op> literal/@param` comparison is added to filters"""
+        start = self.pos
+        fn = self._not_expr()
+        tokens = self.tokens[start:self.pos]
+        if len(tokens) < 5 or tokens[-2][0] != 'op' or tokens[-2][1] not in FILTER_OPERATORS:
+            return fn
+        path = self._simple_path(start, self.pos - 2)
+        # Keywords are upper-cased by the tokenizer, so c.value is not a reliable path
+        if not path or any(kind == 'kw' for kind, _ in tokens[:-2]):
+            return fn
+        kind, value = tokens[-1]
+        if kind == 'literal':
+            filters.append((path, tokens[-2][1], lambda params, value=value: value))
+        elif kind == 'param':
+            filters.append((path, tokens[-2][1], lambda params, name=value: params.get(name, UNDEFINED)))
+        return fn
+
+    # -- expressions --
+
+    def parse_expr(self):
+        left = self._and_expr()
+        while self.accept('kw', 'OR'):
+            right = self._and_expr()
+            left = (lambda l, r: lambda env: _or(l(env), r(env)))(left, right)
+        return left
+
+    def _and_expr(self):
+        left = self._not_expr()
+        while self.accept('kw', 'AND'):
+            right = self._not_expr()
+            left = (lambda l, r: lambda env: _and(l(env), r(env)))(left, right)
+        return left
+
+    def _not_expr(self):
+        if self.accept('kw', 'NOT'):
+            inner = self._not_expr()
+
+            def negate(env):
+                value = inner(env)
+                return (not value) if isinstance(value, bool) else UNDEFINED
+            return negate
+        return self._comparison()
+
+    def _comparison(self):
+        left = self._additive()
+        token = self.peek()
+        if token[0] == 'op' and token[1] in ('=', '!=', '<>', '<', '>', '<=', '>='):
+            op = self.next()[1]
+            right = self._additive()
+            return lambda env: _compare(op, left(env), right(env))
+
+        negated = False
+        if token == ('kw', 'NOT') and self.peek(1) == ('kw', 'IN'):
+            self.next()
+            negated = True
+        if self.accept('kw', 'IN'):
+            self.expect('op', '(')
+            options = [self.parse_expr()]
+            while self.accept('op', ','):
+                options.append(self.parse_expr())
+            self.expect('op', ')')
+
+            def contained(env):
+                value = left(env)
+                if value is UNDEFINED:
+                    return UNDEFINED
+                found = any(_compare('=', value, option(env)) is True for option in options)
+                return not found if negated else found
+            return contained
+        return left
+
+    def _additive(self):
+        left = self._primary()
+        while True:
+            token = self.peek()
+            if token == ('op', '||'):
+                self.next()
+                right = self._primary()
+                left = (lambda l, r: lambda env: (l(env) + r(env)) if _is_str(l(env), r(env)) else UNDEFINED)(left, right)
+            elif token[0] == 'op' and token[1] in ('+', '-'):
+                op = self.next()[1]
+                right = self._primary()
+
+                def arithmetic(env, l=left, r=right, op=op):
+                    a, b = l(env), r(env)
+                    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (a, b)):
+                        return UNDEFINED
+                    return a + b if op == '+' else a - b
+                left = arithmetic
+            else:
+                return left
+
+    def _primary(self):
+        token = self.next()
+        kind, value = token
+
+        if kind == 'literal':
+            return lambda env: value
+        if kind == 'param':
+            return lambda env: env['@'].get(value, UNDEFINED)
+        if kind == 'kw' and value in ('TRUE', 'FALSE'):
+            literal = value == 'TRUE'
+            return lambda env: literal
+        if kind == 'kw' and value == 'NULL':
+            return lambda env: None
+        if kind == 'kw' and value == 'UNDEFINED':
+            return lambda env: UNDEFINED
+        if kind == 'op' and value == '-':
+            inner = self._primary()
+
+            def negative(env):
+                number = inner(env)
+                return -number if isinstance(number, (int, float)) and not isinstance(number, bool) else UNDEFINED
+            return negative
+        if kind == 'op' and value == '(' and self.peek() == ('kw', 'SELECT'):
+            return self._subquery()
+        if kind == 'op' and value == '(':
+            inner = self.parse_expr()
+            self.expect('op', ')')
+            return inner
+        if kind == 'op' and value == '[':
+            items = []
+            if not self.accept('op', ']'):
+                items.append(self.parse_expr())
+                while self.accept('op', ','):
+                    items.append(self.parse_expr())
+                self.expect('op', ']')
+            return lambda env: [item(env) for item in items]
+        if kind == 'ident' and self.peek() == ('op', '('):
+            return self._function(value)
+        if kind == 'ident':
+            return self._path(value)
+        raise CosmosSqlError(f"Unexpected token {value!r}")
+
+    def _subquery(self):
+        """Scalar subquery over an array: (SELECT VALUE [AGG](expr) FROM x IN c.path [WHERE ...])"""
+        self.expect('kw', 'SELECT')
+        self.expect('kw', 'VALUE')
+        aggregate = None
+        token = self.peek()
+        if token[0] == 'ident' and token[1].upper() in AGGREGATES and self.peek(1) == ('op', '('):
+            aggregate = token[1].upper()
+            self.pos += 2
+            fn = self.parse_expr()
+            self.expect('op', ')')
+        else:
+            fn = self.parse_expr()
+
+        self.expect('kw', 'FROM')
+        alias = self.expect('ident')[1]
+        self.expect('kw', 'IN')
+        source = self._primary()
+        where = self.parse_expr() if self.accept('kw', 'WHERE') else None
+        self.expect('op', ')')
+
+        def evaluate(env):
+            items = source(env)
+            if not isinstance(items, list):
+                return UNDEFINED
+            selected = []
+            for item in items:
+                inner = dict(env)
+                inner[alias] = item
+                if where is None or where(inner) is True:
+                    selected.append(inner)
+            if aggregate:
+                return _aggregate(aggregate, [fn(inner) for inner in selected])
+            return fn(selected[0]) if selected else UNDEFINED
+        return evaluate
+
+    def _function(self, name):
+        self.expect('op', '(')
+        args = []
+        if not self.accept('op', ')'):
+            args.append(self.parse_expr())
+            while self.accept('op', ','):
+                args.append(self.parse_expr())
+            self.expect('op', ')')
+
+        impl = FUNCTIONS.get(name.upper())
+        if impl is None:
+            raise CosmosSqlError(f"Unsupported function {name}")
+        return lambda env: impl(*[arg(env) for arg in args])
+
+    def _path(self, root):
+        steps = []
+        while True:
+            if self.accept('op', '.'):
+                token = self.next()
+                if token[0] not in ('ident', 'kw'):
+                    raise CosmosSqlError(f"Expected property name, found {token[1]!r}")
+                steps.append(token[1])
+            elif self.peek() == ('op', '['):
+                self.next()
+                steps.append(self.parse_expr())
+                self.expect('op', ']')
+            else:
+                break
+
+        def resolve(env):
+            value = env.get(root, UNDEFINED)
+            for step in steps:
+                key = step if isinstance(step, str) else step(env)
+                if isinstance(value, dict) and isinstance(key, str):
+                    value = value.get(key, UNDEFINED)
+                elif isinstance(value, list) and isinstance(key, int) and not isinstance(key, bool) and 0 <= key < len(value):
+                    value = value[key]
+                else:
+                    return UNDEFINED
+            return value
+        return resolve
+
+
+@lru_cache(maxsize=512)
+def compile_query(text):
+    """Parse and compile a query; compiled plans are cached per query text"""
+    parser = _Parser(text)
+    query = parser.parse_query()
+    return query
+
+
+def _parameters(parameters):
+    return {param['name']: param['value'] for param in (parameters or [])}
+
+
+def execute(text, documents, parameters=None):
+    """Run a query over an iterable of documents and return the result list"""
+    query = compile_query(text)
+    params = _parameters(parameters)
+    alias = query.alias
+
+    rows = []
+    for document in documents:
+        env = {alias: document, '@': params}
+        if query.where is not None and query.where(env) is not True:
+            continue
+        rows.append(env)
+
+    if query.is_aggregate:
+        results = []
+        record = {}
+        for name, fn, aggregate in query.projections:
+            value = _aggregate(aggregate, [fn(env) for env in rows])
+            if query.value:
+                # An undefined VALUE aggregate (e.g. MAX over no rows) yields no result
+                if value is not UNDEFINED:
+                    results.append(value)
+            elif value is not UNDEFINED:
+                record[name] = value
+        return results if query.value else [record]
+
+    if query.order_by:
+        # Stable multi-key sort, applied from the least significant key
+        for fn, descending in reversed(query.order_by):
+            rows.sort(key=lambda env: sort_key(fn(env)), reverse=descending)
+
+    if query.offset is not None:
+        offset = query.offset(params)
+        rows = rows[offset:offset + query.limit(params)]
+    if query.top is not None:
+        rows = rows[:query.top(params)]
+
+    return [_project(query, env) for env in rows]
+
+
+def stream(text, documents, parameters=None):
+    """Like execute, but yields results while consuming documents when the
+    query needs no sorting, aggregation or OFFSET"""
+    query = compile_query(text)
+    if query.is_aggregate or query.order_by or query.offset is not None:
+        yield from execute(text, documents, parameters)
+        return
+
+    params = _parameters(parameters)
+    remaining = query.top(params) if query.top is not None else None
+    if remaining is not None and remaining <= 0:
+        return
+    for document in documents:
+        env = {query.alias: document, '@': params}
+        if query.where is not None and query.where(env) is not True:
+            continue
+        yield _project(query, env)
+        if remaining is not None:
+            remaining -= 1
+            if remaining <= 0:
+                return
+
+
+def _project(query, env):
+    if query.star:
+        return env[query.alias]
+    if query.value:
+        return query.projections[0][1](env)
+    record = {}
+    for name, fn, _ in query.projections:
+        value = fn(env)
+        if value is not UNDEFINED:
+            record[name] = value
+    return record
+
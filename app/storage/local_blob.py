@@ -0,0 +1,231 @@
+"""
+Filesystem stand-in for the parts of azure.storage.blob the catalog uses.
+
+Blobs live under <root>/<container>/<blob path>; staged blocks are kept
+under <root>/.blocks until commit_block_list assembles them.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+
+class LocalBlobProperties(dict):
+    """Blob properties with attribute access like azure's BlobProperties"""
+
+    __getattr__ = dict.get
+
+
+class LocalStorageStreamDownloader:
+    """Result of download_blob(): readall(), chunks() and readinto()"""
+
+    def __init__(self, path, offset=None, length=None, chunk_size=4 * 1024 * 1024, properties=None):
+        self._path = path
+        total = os.path.getsize(path)
+        self._offset = offset or 0
+        end = total if length is None else min(total, self._offset + length)
+        self.size = max(0, end - self._offset)
+        # Like azure's downloader, a ranged download reports the range's size and
+        # the whole blob's size only in content_range ("bytes <first>-<last>/<total>")
+        self.properties = LocalBlobProperties(properties or {}, size=self.size)
+        if offset is not None or length is not None:
+            self.properties['content_range'] = f'bytes {self._offset}-{self._offset + self.size - 1}/{total}'
+        self._chunk_size = chunk_size
+
+    def chunks(self):
+        remaining = self.size
+        with open(self._path, 'rb') as handle:
+            handle.seek(self._offset)
+            while remaining > 0:
+                data = handle.read(min(self._chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    def readall(self):
+        return b''.join(self.chunks())
+
+    def readinto(self, stream):
+        written = 0
+        for chunk in self.chunks():
+            stream.write(chunk)
+            written += len(chunk)
+        return written
+
+
+class LocalBlobClient:
+    """A single blob on the local filesystem"""
+
+    def __init__(self, service, container, blob):
+        self._service = service
+        self.container_name = container
+        self.blob_name = blob
+        self._path = service.blob_path(container, blob)
+
+    @property
+    def url(self):
+        return Path(self._path).as_uri()
+
+    def exists(self, **kwargs):
+        return os.path.isfile(self._path)
+
+    def _require(self):
+        if not self.exists():
+            raise ResourceNotFoundError(f"The specified blob does not exist: {self.blob_name}")
+
+    def get_blob_properties(self, **kwargs):
+        self._require()
+        stat = os.stat(self._path)
+        return LocalBlobProperties(
+            name=self.blob_name,
+            container=self.container_name,
+            size=stat.st_size,
+            etag=f'"0x{stat.st_mtime_ns:X}{stat.st_size:X}"',
+            last_modified=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+        )
+
+    def _write(self, chunks, overwrite):
+        if not overwrite and self.exists():
+            raise ResourceExistsError(f"The specified blob already exists: {self.blob_name}")
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self._path), prefix='.upload-')
+        with os.fdopen(fd, 'wb') as handle:
+            for chunk in chunks:
+                handle.write(chunk)
+        os.replace(temp_path, self._path)
+
+    def upload_blob(self, data, overwrite=False, length=None, **kwargs):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            chunks = [bytes(data)]
+        elif hasattr(data, 'read'):
+            chunks = iter(lambda: data.read(4 * 1024 * 1024), b'')
+        else:
+            chunks = data
+        self._write(chunks, overwrite)
+        return self.get_blob_properties()
+
+    def download_blob(self, offset=None, length=None, **kwargs):
+        properties = self.get_blob_properties()
+        return LocalStorageStreamDownloader(self._path, offset, length, properties=properties)
+
+    def delete_blob(self, **kwargs):
+        self._require()
+        os.remove(self._path)
+
+    # -- block blobs --
+
+    def _block_dir(self):
+        digest = hashlib.sha1(f"{self.container_name}/{self.blob_name}".encode()).hexdigest()
+        return os.path.join(self._service.root, '.blocks', digest)
+
+    def _block_path(self, block_id):
+        raw = block_id.encode() if isinstance(block_id, str) else block_id
+        return os.path.join(self._block_dir(), raw.hex())
+
+    def stage_block(self, block_id, data, length=None, **kwargs):
+        os.makedirs(self._block_dir(), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self._block_dir(), prefix='.stage-')
+        with os.fdopen(fd, 'wb') as handle:
+            if hasattr(data, 'read'):
+                shutil.copyfileobj(data, handle)
+            else:
+                handle.write(data)
+        os.replace(temp_path, self._block_path(block_id))
+
+    def get_block_list(self, block_list_type='committed', **kwargs):
+        uncommitted = []
+        if os.path.isdir(self._block_dir()):
+            for name in sorted(os.listdir(self._block_dir())):
+                if name.startswith('.'):
+                    continue
+                size = os.path.getsize(os.path.join(self._block_dir(), name))
+                uncommitted.append(LocalBlobProperties(id=bytes.fromhex(name).decode(), size=size))
+        return [], uncommitted
+
+    def commit_block_list(self, block_list, **kwargs):
+        paths = []
+        for block in block_list:
+            block_id = getattr(block, 'id', block)
+            path = self._block_path(block_id)
+            if not os.path.isfile(path):
+                raise ResourceNotFoundError(f"The specified block list is invalid: missing block {block_id}")
+            paths.append(path)
+
+        def chunks():
+            for path in paths:
+                with open(path, 'rb') as handle:
+                    while True:
+                        data = handle.read(4 * 1024 * 1024)
+                        if not data:
+                            break
+                        yield data
+
+        self._write(chunks(), overwrite=True)
+        shutil.rmtree(self._block_dir(), ignore_errors=True)
+        return self.get_blob_properties()
+
+
+class LocalContainerClient:
+    """A blob container directory"""
+
+    def __init__(self, service, container):
+        self._service = service
+        self.container_name = container
+        self._path = os.path.join(service.root, container)
+
+    def get_container_properties(self, **kwargs):
+        if not os.path.isdir(self._path):
+            raise ResourceNotFoundError(f"The specified container does not exist: {self.container_name}")
+        return LocalBlobProperties(name=self.container_name)
+
+    def create_container(self, **kwargs):
+        os.makedirs(self._path, exist_ok=True)
+        return self
+
+    def get_blob_client(self, blob):
+        return LocalBlobClient(self._service, self.container_name, blob)
+
+    def list_blobs(self, name_starts_with=None, **kwargs):
+        if not os.path.isdir(self._path):
+            return
+        for directory, _, filenames in os.walk(self._path):
+            for filename in filenames:
+                if filename.startswith('.upload-'):
+                    continue
+                name = os.path.relpath(os.path.join(directory, filename), self._path).replace(os.sep, '/')
+                if name_starts_with and not name.startswith(name_starts_with):
+                    continue
+                yield LocalBlobClient(self._service, self.container_name, name).get_blob_properties()
+
+
+class LocalBlobServiceClient:
+    """Drop-in replacement for BlobServiceClient rooted at a local directory"""
+
+    account_name = 'local'
+    credential = None
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def blob_path(self, container, blob):
+        base = os.path.join(self.root, container)
+        path = os.path.abspath(os.path.join(base, *blob.split('/')))
+        if not path.startswith(base + os.sep):
+            raise ValueError(f"Invalid blob name: {blob}")
+        return path
+
+    def get_container_client(self, container):
+        return LocalContainerClient(self, container)
+
+    def create_container(self, container, **kwargs):
+        return LocalContainerClient(self, container).create_container()
+
+    def get_blob_client(self, container, blob):
+        return LocalBlobClient(self, container, blob)
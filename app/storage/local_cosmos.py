@@ -0,0 +1,514 @@
+"""
+SQLite-backed stand-in for the parts of azure.cosmos the catalog uses.
+
+Each container is a set of rows in a single SQLite database keyed by
+(container, partition key, id). Queries are evaluated by cosmos_sql over the
+decoded documents; single-partition queries only scan their partition, and
+plain equality and _ts filters are applied by SQLite (with indexes on the id,
+_ts and INDEXED_FIELDS) before documents are decoded. Results are produced
+lazily, a batch of rows at a time. Documents with a positive ``ttl`` are
+removed once it has passed, by the next write (every container behaves like
+one with Cosmos TTL switched on).
+"""
+import base64
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+from azure.cosmos.partition_key import NonePartitionKeyValue
+from . import cosmos_sql
+
+
+# Rows read from SQLite per round trip while a query is consumed
+SCAN_BATCH_SIZE = 500
+
+# Document fields with an expression index, for equality filters pushed into SQLite
+INDEXED_FIELDS = ('doc_type', 'base_name', 'dataset_id', 'username', 'status')
+
+_END = object()
+
+# Documents with a ttl expire that many seconds after their last write
+_HAS_TTL = "json_extract(body, '$.ttl') > 0"
+_EXPIRY = "ts + json_extract(body, '$.ttl')"
+
+
+def _partition_value(partition_key):
+    """NonePartitionKeyValue addresses the documents that lack the partition key field"""
+    return None if partition_key is NonePartitionKeyValue else partition_key
+
+
+def _partition_json(partition_key):
+    return json.dumps(_partition_value(partition_key))
+
+
+def _not_found(item_id):
+    return exceptions.CosmosResourceNotFoundError(
+        status_code=404, message=f"Entity with the specified id '{item_id}' does not exist in the system.")
+
+
+def _conflict(item_id):
+    return exceptions.CosmosResourceExistsError(
+        status_code=409, message=f"Entity with the specified id '{item_id}' already exists in the system.")
+
+
+def _precondition_failed(item_id):
+    return exceptions.CosmosAccessConditionFailedError(
+        status_code=412, message=f"Operation cannot be performed because one of the specified precondition for '{item_id}' is not met.")
+
+
+def _bad_patch(message):
+    return exceptions.CosmosHttpResponseError(status_code=400, message=message)
+
+
+def _patch_parent(document, path):
+    """Resolve '/a/b/c' to (container of c, 'c' or list index)"""
+    parts = [part.replace('~1', '/').replace('~0', '~') for part in path.strip('/').split('/')]
+    target = document
+    for part in parts[:-1]:
+        if isinstance(target, dict) and part in target:
+            target = target[part]
+        elif isinstance(target, list) and part.isdigit() and int(part) < len(target):
+            target = target[int(part)]
+        else:
+            raise _bad_patch(f"Path {path} does not exist")
+    key = parts[-1]
+    if isinstance(target, list):
+        if key == '-':
+            return target, len(target)
+        if not key.isdigit():
+            raise _bad_patch(f"Invalid array index in {path}")
+        return target, int(key)
+    if not isinstance(target, dict):
+        raise _bad_patch(f"Path {path} does not exist")
+    return target, key
+
+
+def _apply_patch(document, operation):
+    """Apply one Cosmos partial-document patch operation in place"""
+    op = operation['op'].lower()
+    path = operation['path']
+
+    if op == 'move':
+        source, source_key = _patch_parent(document, operation['from'])
+        try:
+            value = source.pop(source_key)
+        except (KeyError, IndexError):
+            raise _bad_patch(f"Path {operation['from']} does not exist")
+        _apply_patch(document, {'op': 'set', 'path': path, 'value': value})
+        return
+
+    target, key = _patch_parent(document, path)
+    exists = key in target if isinstance(target, dict) else key < len(target)
+
+    if op == 'add':
+        if isinstance(target, list):
+            target.insert(key, operation['value'])
+        else:
+            target[key] = operation['value']
+    elif op == 'set':
+        if isinstance(target, list) and not exists:
+            target.append(operation['value'])
+        else:
+            target[key] = operation['value']
+    elif op == 'replace':
+        if not exists:
+            raise _bad_patch(f"Path {path} does not exist")
+        target[key] = operation['value']
+    elif op == 'remove':
+        if not exists:
+            raise _bad_patch(f"Path {path} does not exist")
+        del target[key]
+    elif op == 'incr':
+        current = target[key] if exists else 0
+        if not isinstance(current, (int, float)) or isinstance(current, bool):
+            raise _bad_patch(f"Path {path} is not a number")
+        target[key] = current + operation['value']
+    else:
+        raise _bad_patch(f"Unsupported patch operation {op}")
+
+
+class LocalPageIterator:
+    """Iterator over result pages; continuation_token is updated after each page"""
+
+    def __init__(self, results, page_size, continuation_token=None):
+        self._page_size = page_size
+        self._offset = 0
+        if continuation_token:
+            try:
+                self._offset = int(json.loads(base64.b64decode(continuation_token))['offset'])
+            except (ValueError, TypeError, KeyError):
+                raise exceptions.CosmosHttpResponseError(status_code=400, message='Invalid continuation token')
+        # Results are consumed one page (plus one look-ahead item) at a time
+        self._results = itertools.islice(iter(results), self._offset, None)
+        self._next = next(self._results, _END)
+        self.continuation_token = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._next is _END:
+            raise StopIteration
+        page = [self._next] + list(itertools.islice(self._results, self._page_size - 1))
+        self._next = next(self._results, _END)
+        self._offset += len(page)
+        self.continuation_token = (
+            base64.b64encode(json.dumps({'offset': self._offset}).encode()).decode()
+            if self._next is not _END else None
+        )
+        return iter(page)
+
+
+class LocalItemPaged:
+    """Iterable query result with Cosmos-style by_page() paging; results are
+    produced lazily on each iteration"""
+
+    def __init__(self, fetch, max_item_count=None):
+        self._fetch = fetch
+        self._max_item_count = max_item_count
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+    def by_page(self, continuation_token=None):
+        """Page through results max_item_count items at a time"""
+        return LocalPageIterator(self._fetch(), self._max_item_count or 100, continuation_token)
+
+
+class LocalContainerProxy:
+    """A container stored in the shared SQLite database"""
+
+    def __init__(self, database, name, partition_key_path='/id'):
+        self._database = database
+        self.id = name
+        self.partition_key_path = partition_key_path
+
+    # -- helpers --
+
+    def _partition_value(self, body):
+        value = body
+        for part in self.partition_key_path.strip('/').split('/'):
+            if not isinstance(value, dict) or part not in value:
+                return None
+            value = value[part]
+        return value
+
+    @staticmethod
+    def _item_id(item):
+        return item['id'] if isinstance(item, dict) else item
+
+    @staticmethod
+    def _check_condition(item_id, current_etag, etag, match_condition):
+        if match_condition == MatchConditions.IfNotModified and etag and current_etag != etag:
+            raise _precondition_failed(item_id)
+        if match_condition == MatchConditions.IfModified and etag and current_etag == etag:
+            raise _precondition_failed(item_id)
+
+    def _stamp(self, body):
+        document = dict(body)
+        document['_ts'] = int(time.time())
+        document['_etag'] = f'"{uuid.uuid4()}"'
+        return document
+
+    def _load(self, connection, item_id, partition_key):
+        row = connection.execute(
+            "SELECT body FROM items WHERE container = ? AND pk = ? AND id = ?",
+            (self.id, _partition_json(partition_key), item_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store(self, connection, document, replace):
+        # Updating in place keeps the rowid, so a scan in progress neither
+        # misses a document that changes nor sees it twice
+        upsert = " ON CONFLICT (container, pk, id) DO UPDATE SET ts = excluded.ts, body = excluded.body" if replace else ""
+        connection.execute(
+            f"INSERT INTO items (container, pk, id, ts, body) VALUES (?, ?, ?, ?, ?){upsert}",
+            (self.id, json.dumps(self._partition_value(document)), document['id'],
+             document['_ts'], json.dumps(document))
+        )
+
+    # -- container API --
+
+    def read(self, **kwargs):
+        """Container properties"""
+        return {'id': self.id, 'partitionKey': {'paths': [self.partition_key_path], 'kind': 'Hash'}}
+
+    def read_item(self, item, partition_key, **kwargs):
+        item_id = self._item_id(item)
+        with self._database.lock:
+            document = self._load(self._database.connection, item_id, partition_key)
+        if document is None:
+            raise _not_found(item_id)
+        return document
+
+    def create_item(self, body, **kwargs):
+        document = self._stamp(body)
+        with self._database.transaction() as connection:
+            try:
+                self._store(connection, document, replace=False)
+            except sqlite3.IntegrityError:
+                raise _conflict(body['id'])
+        return document
+
+    def upsert_item(self, body, etag=None, match_condition=None, **kwargs):
+        document = self._stamp(body)
+        with self._database.transaction() as connection:
+            current = self._load(connection, body['id'], self._partition_value(body))
+            if current is not None:
+                self._check_condition(body['id'], current.get('_etag'), etag, match_condition)
+            self._store(connection, document, replace=True)
+        return document
+
+    def replace_item(self, item, body, etag=None, match_condition=None, **kwargs):
+        item_id = self._item_id(item)
+        document = self._stamp(body)
+        with self._database.transaction() as connection:
+            current = self._load(connection, item_id, self._partition_value(body))
+            if current is None:
+                raise _not_found(item_id)
+            self._check_condition(item_id, current.get('_etag'), etag, match_condition)
+            self._store(connection, document, replace=True)
+        return document
+
+    def delete_item(self, item, partition_key, etag=None, match_condition=None, **kwargs):
+        item_id = self._item_id(item)
+        with self._database.transaction() as connection:
+            current = self._load(connection, item_id, partition_key)
+            if current is None:
+                raise _not_found(item_id)
+            self._check_condition(item_id, current.get('_etag'), etag, match_condition)
+            connection.execute(
+                "DELETE FROM items WHERE container = ? AND pk = ? AND id = ?",
+                (self.id, _partition_json(partition_key), item_id)
+            )
+
+    def patch_item(self, item, partition_key, patch_operations, filter_predicate=None,
+                   etag=None, match_condition=None, **kwargs):
+        item_id = self._item_id(item)
+        with self._database.transaction() as connection:
+            current = self._load(connection, item_id, partition_key)
+            if current is None:
+                raise _not_found(item_id)
+            self._check_condition(item_id, current.get('_etag'), etag, match_condition)
+            document = self._patched(item_id, current, partition_key, patch_operations, filter_predicate)
+            self._store(connection, document, replace=True)
+        return document
+
+    def _patched(self, item_id, current, partition_key, patch_operations, filter_predicate):
+        if filter_predicate and not cosmos_sql.execute(f"SELECT * {filter_predicate}", [current]):
+            raise _precondition_failed(item_id)
+        current = json.loads(json.dumps(current))
+        for operation in patch_operations:
+            _apply_patch(current, operation)
+        if self._partition_value(current) != _partition_value(partition_key):
+            raise exceptions.CosmosHttpResponseError(status_code=400, message="Cannot patch the partition key")
+        return self._stamp(current)
+
+    def execute_item_batch(self, batch_operations, partition_key, **kwargs):
+        """Run operations against one partition; either all of them apply or none do"""
+        with self._database.transaction() as connection:
+            pending = {}
+            results = []
+            for index, operation in enumerate(batch_operations):
+                try:
+                    results.append(self._batch_operation(connection, pending, partition_key, *operation))
+                except exceptions.CosmosHttpResponseError as e:
+                    responses = [dict(result, statusCode=424) for result in results]
+                    responses.append({'statusCode': e.status_code})
+                    raise exceptions.CosmosBatchOperationError(
+                        error_index=index, headers={}, status_code=e.status_code,
+                        message=f"Batch operation {index} failed: {e.message}",
+                        operation_responses=responses
+                    )
+            for item_id, document in pending.items():
+                if document is None:
+                    connection.execute(
+                        "DELETE FROM items WHERE container = ? AND pk = ? AND id = ?",
+                        (self.id, _partition_json(partition_key), item_id)
+                    )
+                else:
+                    self._store(connection, document, replace=True)
+        return results
+
+    def _batch_operation(self, connection, pending, partition_key, kind, args, options=None):
+        options = options or {}
+        kind = kind.lower()
+        item_id = self._item_id(args[0])
+        current = pending[item_id] if item_id in pending else self._load(connection, item_id, partition_key)
+
+        if current is not None and options.get('if_match_etag') not in (None, current.get('_etag')):
+            raise _precondition_failed(item_id)
+        if kind in ('create', 'upsert', 'replace'):
+            body = args[-1]
+            if self._partition_value(body) != _partition_value(partition_key):
+                raise exceptions.CosmosHttpResponseError(
+                    status_code=400, message="Partition key of the document does not match the batch")
+
+        if kind == 'read':
+            if current is None:
+                raise _not_found(item_id)
+            return {'statusCode': 200, 'resourceBody': current, 'eTag': current['_etag']}
+        if kind == 'delete':
+            if current is None:
+                raise _not_found(item_id)
+            pending[item_id] = None
+            return {'statusCode': 204}
+        if kind == 'create':
+            if current is not None:
+                raise _conflict(item_id)
+            document, status = self._stamp(args[0]), 201
+        elif kind == 'upsert':
+            document, status = self._stamp(args[0]), 200 if current is not None else 201
+        elif kind == 'replace':
+            if current is None:
+                raise _not_found(item_id)
+            document, status = self._stamp(args[1]), 200
+        elif kind == 'patch':
+            if current is None:
+                raise _not_found(item_id)
+            document = self._patched(item_id, current, partition_key, args[1], options.get('filter_predicate'))
+            status = 200
+        else:
+            raise exceptions.CosmosHttpResponseError(status_code=400, message=f"Unsupported batch operation {kind}")
+        pending[item_id] = document
+        return {'statusCode': status, 'resourceBody': document, 'eTag': document['_etag']}
+
+    def _documents(self, partition_key=None, conditions=(), arguments=()):
+        """Decoded documents in insertion order, read a batch at a time
+
+        ``conditions`` are extra SQL terms on the items table. Documents
+        created after the scan starts are not included.
+        """
+        clauses = ["container = ?"] + list(conditions)
+        values = [self.id] + list(arguments)
+        if partition_key is not None:
+            clauses.append("pk = ?")
+            values.append(_partition_json(partition_key))
+        where = " AND ".join(clauses)
+
+        with self._database.lock:
+            last_rowid = self._database.connection.execute("SELECT MAX(rowid) FROM items").fetchone()[0] or 0
+        rowid = 0
+        while True:
+            with self._database.lock:
+                rows = self._database.connection.execute(
+                    f"SELECT rowid, body FROM items WHERE {where} AND rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?",
+                    (*values, rowid, last_rowid, SCAN_BATCH_SIZE)
+                ).fetchall()
+            for rowid, body in rows:
+                yield json.loads(body)
+            if len(rows) < SCAN_BATCH_SIZE:
+                return
+
+    @staticmethod
+    def _filter_conditions(query, parameters):
+        """SQL terms for the query's plain WHERE filters that SQLite can evaluate
+        exactly as Cosmos would; the full WHERE clause still runs on each document"""
+        params = {param['name']: param['value'] for param in (parameters or [])}
+        conditions, arguments = [], []
+        for path, op, value in cosmos_sql.compile_query(query).filters:
+            value = value(params)
+            number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if number and isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63:
+                continue
+            if path == ('_ts',) and number:
+                conditions.append(f"ts {op} ?")
+            elif op != '=' or not (number or isinstance(value, str)):
+                continue
+            elif path == ('id',) and isinstance(value, str):
+                conditions.append("id = ?")
+            else:
+                # Path parts are identifier tokens, so they can be inlined (and
+                # then match the expression indexes)
+                conditions.append(f"json_extract(body, '$.{'.'.join(path)}') = ?")
+            arguments.append(value)
+        return conditions, arguments
+
+    def query_items(self, query, parameters=None, partition_key=None, enable_cross_partition_query=None,
+                    max_item_count=None, **kwargs):
+        def fetch():
+            conditions, arguments = self._filter_conditions(query, parameters)
+            return cosmos_sql.stream(query, self._documents(partition_key, conditions, arguments), parameters)
+        return LocalItemPaged(fetch, max_item_count=max_item_count)
+
+    def read_all_items(self, max_item_count=None, **kwargs):
+        return LocalItemPaged(self._documents, max_item_count=max_item_count)
+
+
+class LocalDatabaseProxy:
+    """A database holding LocalContainerProxy objects"""
+
+    def __init__(self, client, name):
+        self._client = client
+        self.id = name
+        self.lock = client.lock
+        self.connection = client.connection
+        self.transaction = client.transaction
+
+    def get_container_client(self, container):
+        return LocalContainerProxy(self, container, self._client.partition_key_for(container))
+
+    def create_container_if_not_exists(self, id, partition_key=None, **kwargs):
+        path = getattr(partition_key, 'path', None) or partition_key or self._client.partition_key_for(id)
+        if isinstance(path, (list, tuple)):
+            path = path[0]
+        self._client.partition_keys.setdefault(id, path)
+        return self.get_container_client(id)
+
+
+class LocalCosmosClient:
+    """Drop-in replacement for CosmosClient backed by a SQLite file (or ':memory:')"""
+
+    def __init__(self, path, partition_keys=None):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.partition_keys = dict(partition_keys or {})
+        self.lock = threading.RLock()
+        # Writers in other processes are waited for (BEGIN IMMEDIATE) rather than failed
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            " container TEXT NOT NULL, pk TEXT NOT NULL, id TEXT NOT NULL,"
+            " ts INTEGER NOT NULL, body TEXT NOT NULL,"
+            " PRIMARY KEY (container, pk, id))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS items_container_ts ON items (container, ts)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS items_container_id ON items (container, id)")
+        for field in INDEXED_FIELDS:
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS items_container_{field} ON items (container, json_extract(body, '$.{field}'))")
+        self.connection.execute(
+            f"CREATE INDEX IF NOT EXISTS items_expiry ON items ({_EXPIRY}) WHERE {_HAS_TTL}")
+        self.connection.commit()
+
+    @contextmanager
+    def transaction(self):
+        """A write transaction holding SQLite's write lock from its first read, so a
+        load-check-store sequence is atomic across processes sharing the file"""
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired documents go before anything can read or recreate them
+                self.connection.execute(
+                    f"DELETE FROM items WHERE {_HAS_TTL} AND {_EXPIRY} <= ?", (int(time.time()),))
+                yield self.connection
+            except BaseException:
+                self.connection.rollback()
+                raise
+            self.connection.commit()
+
+    def partition_key_for(self, container):
+        return self.partition_keys.get(container, '/id')
+
+    def get_database_client(self, database):
+        return LocalDatabaseProxy(self, database)
+
+    def create_database_if_not_exists(self, id, **kwargs):
+        return self.get_database_client(id)
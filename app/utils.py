@@ -6,54 +6,272 @@ import re
 import uuid
 from datetime import datetime, timedelta
 import pytz
-from .cosmos_client import metadata_container, activities_container
+from .cosmos_client import activities_container
+from .storage import is_local_backend, local_blob_root
+from .preview_cache import preview_cache
 
 # Azure Blob Storage Configuration
 AZURE_STORAGE_CONNECTION_STRING = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
-AZURE_BLOB_CONTAINER = os.environ.get("AZURE_BLOB_CONTAINER")
+AZURE_BLOB_CONTAINER = os.environ.get("AZURE_BLOB_CONTAINER", "datasets")
 
-# Initialize Blob Storage client
-blob_service_client = BlobServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING)
+# Initialize Blob Storage client (or the local filesystem stand-in)
+if is_local_backend():
+    from .storage.local_blob import LocalBlobServiceClient
+    blob_service_client = LocalBlobServiceClient(local_blob_root())
+    blob_service_client.create_container(AZURE_BLOB_CONTAINER)
+else:
+    blob_service_client = BlobServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING)
 blob_container_client = blob_service_client.get_container_client(AZURE_BLOB_CONTAINER)
 
-def get_dataset_file_preview(blob_path):
+# Rows (or lines) shown in a preview
+PREVIEW_ROWS = 10
+# CSV/TSV/JSON lines/text previews read the start of the blob: first this many bytes,
+# growing (4x at a time) up to PREVIEW_MAX_RANGE_BYTES while too few complete rows were read
+PREVIEW_RANGE_BYTES = int(os.environ.get("PREVIEW_RANGE_BYTES", str(256 * 1024)))
+PREVIEW_MAX_RANGE_BYTES = int(os.environ.get("PREVIEW_MAX_RANGE_BYTES", str(8 * 1024 * 1024)))
+
+TABLE_SEPARATORS = {'.csv': ',', '.tsv': '\t'}
+JSON_LINES_EXTENSIONS = ('.jsonl', '.ndjson')
+TEXT_EXTENSIONS = ('.txt', '.json', '.md', '.py', '.js', '.html', '.css')
+
+def _blob_size(downloader):
+    """Size of the whole blob behind a (ranged) download"""
+    # properties.size is the size of the range; content_range is "bytes <first>-<last>/<total>"
+    content_range = downloader.properties.content_range
+    if content_range:
+        return int(content_range.rsplit('/', 1)[1])
+    return downloader.properties.size
+
+def _read_preview_range(blob_client, parse):
+    """
+    Parse the start of a blob without downloading all of it.
+    
+    parse(sample, complete) gets the bytes read so far, cut after the last
+    complete line unless complete (the whole blob was read), and returns
+    (result, rows found). The range grows until PREVIEW_ROWS rows are found,
+    the blob is exhausted or PREVIEW_MAX_RANGE_BYTES is reached.
+    
+    Returns (result, blob size, complete).
+    """
+    data = b''
+    length = max(1, min(PREVIEW_RANGE_BYTES, PREVIEW_MAX_RANGE_BYTES))
+    while True:
+        downloader = blob_client.download_blob(offset=len(data), length=length - len(data))
+        data += downloader.readall()
+        size = _blob_size(downloader)
+        complete = len(data) >= size
+        sample = data if complete else data[:data.rfind(b'\n') + 1]
+        try:
+            result, found = parse(sample, complete)
+        except Exception:
+            # A cut inside a quoted field or a long record; more data may fix it
+            if complete or length >= PREVIEW_MAX_RANGE_BYTES:
+                raise
+            result, found = None, 0
+        if complete or found >= PREVIEW_ROWS or length >= PREVIEW_MAX_RANGE_BYTES:
+            return result, size, complete
+        length = min(length * 4, PREVIEW_MAX_RANGE_BYTES)
+
+def _table_preview(blob_client, read):
+    """Preview of a delimited or JSON-lines table; read(stream, nrows) returns a DataFrame"""
+    def parse(sample, complete):
+        if not sample.strip():
+            return None, 0
+        # A fully read (small) file is parsed whole so its row count is exact
+        df = read(io.BytesIO(sample), None if complete else PREVIEW_ROWS)
+        return df, len(df)
+    
+    df, size, complete = _read_preview_range(blob_client, parse)
+    if df is None:
+        raise ValueError('No rows found in the start of the file')
+    return {
+        'type': 'csv',
+        'column_info': {
+            'count': len(df.columns),
+            'names': [str(name) for name in df.columns]
+        },
+        'preview': df.head(PREVIEW_ROWS).to_html(classes="table table-striped table-sm", index=False),
+        # Only known when the whole file was read; the file's profile fills it in otherwise
+        'row_count': len(df) if complete else None,
+        'partial': not complete,
+        'size_bytes': size
+    }
+
+def _text_preview(blob_client):
+    """Preview of the first lines of a text file"""
+    def parse(sample, complete):
+        lines = sample.decode('utf-8', errors='replace').split('\n')
+        if not complete and lines and lines[-1] == '':
+            # The sample ends with a line break
+            lines.pop()
+        return lines, len(lines)
+    
+    lines, size, complete = _read_preview_range(blob_client, parse)
+    return {
+        'type': 'text',
+        'preview': '\n'.join(lines[:PREVIEW_ROWS]),
+        'line_count': len(lines) if complete else None,
+        'partial': not complete,
+        'size_bytes': size
+    }
+
+class BlobRangeFile(io.RawIOBase):
+    """Seekable read-only file over a blob; every read is a ranged download
+
+    Wrap it in io.BufferedReader so small reads share one request.
+    """
+    
+    def __init__(self, blob_client):
+        self.blob_client = blob_client
+        self.size = blob_client.get_blob_properties().size
+        self.position = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def tell(self):
+        return self.position
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+    
+    def readinto(self, buffer):
+        length = min(len(buffer), self.size - self.position)
+        if length <= 0:
+            return 0
+        data = self.blob_client.download_blob(offset=self.position, length=length).readall()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+def _sheet_size(worksheet):
+    """(rows, columns) of a worksheet from its stored dimension, or (None, None) when it has none"""
+    try:
+        worksheet.calculate_dimension()
+    except ValueError:
+        return None, None
+    return worksheet.max_row, worksheet.max_column
+
+def _excel_preview(blob_client, sheet=None):
+    """
+    Preview of one worksheet of an .xlsx workbook, streamed with openpyxl in read-only mode.
+    
+    The workbook is read through ranged downloads: the zip directory, the
+    workbook part and shared strings, each sheet's stored dimension and
+    the first rows of the requested sheet. Other sheets are only listed.
+    """
+    from openpyxl import load_workbook
+    
+    stream = io.BufferedReader(BlobRangeFile(blob_client), buffer_size=PREVIEW_RANGE_BYTES)
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        sheets = []
+        for worksheet in workbook.worksheets:
+            rows, columns = _sheet_size(worksheet)
+            sheets.append({'name': worksheet.title, 'rows': rows, 'columns': columns})
+        if not sheets:
+            raise ValueError('The workbook has no worksheets')
+        
+        name = sheet or sheets[0]['name']
+        if name not in [entry['name'] for entry in sheets]:
+            raise ValueError(f"Sheet '{name}' not found")
+        worksheet = workbook[name]
+        
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        names = [str(value) if value is not None else f'Column {index + 1}' for index, value in enumerate(header)]
+        records = []
+        for row in rows:
+            if len(records) >= PREVIEW_ROWS:
+                break
+            records.append(tuple(row[:len(names)]) + (None,) * (len(names) - len(row)))
+        df = pd.DataFrame.from_records(records, columns=names)
+        
+        size = next(entry for entry in sheets if entry['name'] == name)
+        return {
+            'type': 'excel',
+            'sheet': name,
+            'sheets': sheets,
+            'column_info': {
+                'count': len(names),
+                'names': names
+            },
+            'preview': df.to_html(classes="table table-striped table-sm", index=False),
+            # Data rows below the header row, from the sheet's stored dimension
+            'row_count': size['rows'] - 1 if size['rows'] else None
+        }
+    finally:
+        workbook.close()
+
+def get_dataset_file_preview(blob_path, filename=None, sheet=None):
     """
     Get a preview of a dataset file from Azure Blob storage
-    For CSV and Excel files, returns the first 10 rows and header information
+    For CSV, TSV, JSON lines and Excel files, returns the first 10 rows and header information
     For PDF files, returns text content from first few pages
     For other text-based files, returns the first 10 lines
+    
+    The file type comes from filename when given (deduplicated files share a
+    blob that may have been uploaded under another name). sheet picks the
+    worksheet of an Excel workbook (the first one by default). Previews are
+    cached by the blob's ETag (see preview_cache), so a repeat preview only
+    reads the blob's properties.
     """
     blob_client = blob_service_client.get_blob_client(container=AZURE_BLOB_CONTAINER, blob=blob_path)
+    name = (filename or blob_path).lower()
+    variant = f"{os.path.splitext(name)[1]}|{sheet or ''}"
     
-    # Download the blob content
-    file_content = blob_client.download_blob().readall()
+    etag = blob_client.get_blob_properties().etag
+    preview = preview_cache.get(blob_path, etag, variant)
+    if preview is None:
+        preview = _build_preview(blob_client, name, sheet)
+        if preview['type'] != 'error':
+            preview_cache.set(blob_path, etag, variant, preview)
+    return preview
+
+def _build_preview(blob_client, name, sheet=None):
+    """
+    Build the preview of a blob for a file name.
+    
+    CSV, TSV, JSON lines and text previews only read the start of the blob
+    (see _read_preview_range) and Excel previews only the parts of the
+    workbook they show (see _excel_preview), so their cost does not depend
+    on the file size.
+    """
+    extension = os.path.splitext(name)[1]
     
     # Handle different file types
-    if blob_path.lower().endswith('.csv'):
+    if extension in TABLE_SEPARATORS or extension in JSON_LINES_EXTENSIONS:
+        if extension in TABLE_SEPARATORS:
+            def read(stream, nrows):
+                return pd.read_csv(stream, sep=TABLE_SEPARATORS[extension], nrows=nrows)
+        else:
+            def read(stream, nrows):
+                return pd.read_json(stream, lines=True, nrows=nrows)
         try:
-            df = pd.read_csv(io.BytesIO(file_content))
-            # Get column information
-            column_info = {
-                'count': len(df.columns),
-                'names': list(df.columns)
-            }
-            # Generate HTML preview with first 10 rows
-            preview_html = df.head(10).to_html(classes="table table-striped table-sm", index=False)
+            return _table_preview(blob_client, read)
+        except Exception as e:
             return {
-                'type': 'csv',
-                'column_info': column_info,
-                'preview': preview_html,
-                'row_count': len(df)
+                'type': 'error', 
+                'error': str(e)
             }
+    elif name.endswith(('.xlsx', '.xlsm')):
+        try:
+            return _excel_preview(blob_client, sheet)
         except Exception as e:
             return {
                 'type': 'error', 
                 'error': str(e)
             }
-    elif blob_path.lower().endswith(('.xlsx', '.xls')):
+    elif name.endswith('.xls'):
         try:
-            # Explicitly use openpyxl engine for Excel files
-            df = pd.read_excel(io.BytesIO(file_content), engine='openpyxl')
+            # Legacy workbooks are not zip files: read the whole first sheet with pandas
+            file_content = blob_client.download_blob().readall()
+            df = pd.read_excel(io.BytesIO(file_content))
             # Get column information
             column_info = {
                 'count': len(df.columns),
@@ -72,11 +290,12 @@ def get_dataset_file_preview(blob_path):
                 'type': 'error', 
                 'error': str(e)
             }
-    elif blob_path.lower().endswith('.pdf'):
+    elif name.endswith('.pdf'):
         try:
             import pypdf
             from io import BytesIO
             
+            file_content = blob_client.download_blob().readall()
             pdf_reader = pypdf.PdfReader(BytesIO(file_content))
             num_pages = len(pdf_reader.pages)
             
@@ -102,16 +321,9 @@ def get_dataset_file_preview(blob_path):
             }
             
     # Handle text files
-    elif blob_path.lower().endswith(('.txt', '.json', '.md', '.py', '.js', '.html', '.css')):
+    elif extension in TEXT_EXTENSIONS:
         try:
-            text_content = file_content.decode('utf-8', errors='replace')
-            lines = text_content.split('\n')
-            preview_lines = lines[:10]
-            return {
-                'type': 'text',
-                'preview': '\n'.join(preview_lines),
-                'line_count': len(lines)
-            }
+            return _text_preview(blob_client)
         except Exception as e:
             return {
                 'type': 'error', 
@@ -129,40 +341,13 @@ def get_dataset_lineage_tree(dataset_id):
     Get the complete lineage tree for a dataset
     Returns a dictionary with nodes and links for visualization
     """
-    # Get the initial dataset
-    query = f"SELECT * FROM c WHERE c.id = '{dataset_id}'"
-    items = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
+    from .datasets.lineage import lineage_graph
     
-    if not items:
+    node = lineage_graph.get(dataset_id)
+    if not node:
         return {"nodes": [], "links": []}
     
-    dataset = items[0]
-    base_name = dataset.get('base_name', dataset['name'])
-    
-    # Get all versions of this dataset
-    query = f"SELECT * FROM c WHERE c.base_name = '{base_name}'"
-    all_versions = list(metadata_container.query_items(query=query, enable_cross_partition_query=True))
-    
-    # Build nodes and links
-    nodes = []
-    links = []
-    
-    for version in all_versions:
-        nodes.append({
-            "id": version["id"],
-            "name": version["name"],
-            "version": version["version"],
-            "tags": version.get("tags", [])
-        })
-        
-        if version.get("parent_id"):
-            links.append({
-                "source": version["parent_id"],
-                "target": version["id"],
-                "type": "version"
-            })
-    
-    return {"nodes": nodes, "links": links}
+    return lineage_graph.family(node.get('base_name', node['name']))
 
 def generate_blob_sas_url(blob_path, hours_valid=1):
     """
@@ -175,6 +360,10 @@ def generate_blob_sas_url(blob_path, hours_valid=1):
     Returns:
         Full URL with SAS token
     """
+    if is_local_backend():
+        # Local blobs are plain files; there is no SAS to sign
+        return blob_service_client.get_blob_client(container=AZURE_BLOB_CONTAINER, blob=blob_path).url
+    
     # Generate SAS token for blob access
     sas_token = generate_blob_sas(
         account_name=blob_service_client.account_name,
@@ -0,0 +1,27 @@
+"""
+Rebuild the dataset/upload rollups used by the dashboard statistics.
+This script will:
+1. Scan every dataset and its files
+2. Recompute the daily and monthly counters (catalog-wide and per user)
+3. Overwrite the rollup documents in the state container
+
+Run it once after upgrading, or whenever the rollups need repairing.
+"""
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.datasets import rollups
+
+
+def main():
+    """Recompute all rollups."""
+    print("Recomputing rollups from the metadata container...")
+    count = rollups.backfill()
+    print(f"Wrote {count} rollup buckets")
+
+
+if __name__ == "__main__":
+    main()
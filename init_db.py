@@ -2,12 +2,12 @@
 Initialize Azure Cosmos DB database and container for the Data Catalog application.
 This script will:
 1. Create the database if it doesn't exist
-2. Create the container if it doesn't exist
+2. Create the containers if they don't exist
 3. Create a sample user for testing
 """
 
 import os
-from azure.cosmos import CosmosClient, exceptions
+from azure.cosmos import CosmosClient, PartitionKey, exceptions
 from dotenv import load_dotenv
 import uuid
 from werkzeug.security import generate_password_hash
@@ -20,6 +20,8 @@ ENDPOINT = os.environ.get("COSMOSDB_ENDPOINT")
 KEY = os.environ.get("COSMOSDB_KEY")
 DATABASE_NAME = os.environ.get("COSMOSDB_DATABASE", "datacatalog")
 CONTAINER_NAME = os.environ.get("COSMOSDB_CONTAINER", "metadata")
+STATE_CONTAINER_NAME = os.environ.get("COSMOSDB_STATE_CONTAINER", "catalog_state")
+JOBS_CONTAINER_NAME = os.environ.get("COSMOSDB_JOBS_CONTAINER", "jobs")
 
 # Test user settings
 ADMIN_USER_USERNAME = os.environ.get("ADMIN_USER_USERNAME", "testuser")
@@ -57,6 +59,32 @@ def main():
         print(f"Container '{CONTAINER_NAME}' already exists")
         container = database.get_container_client(CONTAINER_NAME)
     
+    # Create the bookkeeping container (version counters etc.). TTL is on
+    # without a default (-1), so only documents with a ttl (upload sessions) expire
+    state_container = database.create_container_if_not_exists(
+        id=STATE_CONTAINER_NAME,
+        partition_key=PartitionKey(path="/id"),
+        default_ttl=-1
+    )
+    if state_container.read().get('defaultTtl') is None:
+        database.replace_container(state_container, partition_key=PartitionKey(path="/id"), default_ttl=-1)
+    print(f"Container '{STATE_CONTAINER_NAME}' exists or created successfully")
+    
+    # Create the background job queue; workers claim jobs by priority, then due time
+    database.create_container_if_not_exists(
+        id=JOBS_CONTAINER_NAME,
+        partition_key=PartitionKey(path="/id"),
+        indexing_policy={
+            'indexingMode': 'consistent',
+            'includedPaths': [{'path': '/*'}],
+            'compositeIndexes': [[
+                {'path': '/priority', 'order': 'descending'},
+                {'path': '/available_at', 'order': 'ascending'}
+            ]]
+        }
+    )
+    print(f"Container '{JOBS_CONTAINER_NAME}' exists or created successfully")
+    
     # Create a test user if no users exist
     query = "SELECT * FROM c WHERE c.type = 'user'"
     users = list(container.query_items(query=query, enable_cross_partition_query=True))
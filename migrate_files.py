@@ -0,0 +1,49 @@
+"""
+Move the files embedded in existing dataset documents to file records.
+This script will:
+1. Find datasets that still embed a files array or lack the file totals
+2. Upsert one file record (doc_type 'file') per embedded file
+3. Drop the embedded array and set file_count and total_size_bytes with a patch operation
+
+Run it once after upgrading, while no uploads are in progress. The app reads
+embedded files until then, but their counts are only right after migrating.
+"""
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.cosmos_client import metadata_container, metadata_repository
+from app.datasets.models import DatasetModel
+from app import queries
+
+
+def main():
+    """Split embedded files out of every dataset that still has them."""
+    datasets = queries.DATASETS_WITH_EMBEDDED_FILES.items(metadata_container)
+    print(f"Found {len(datasets)} datasets to migrate")
+    
+    for dataset in datasets:
+        for file_info in dataset.get('files') or []:
+            metadata_repository.upsert(dict(file_info, doc_type='file', dataset_id=dataset['id'],
+                                            base_name=dataset['base_name']))
+        
+        records = queries.DATASET_FILES.items(
+            metadata_container, partition_key=DatasetModel._partition_hint(dataset['base_name']),
+            dataset_id=dataset['id'])
+        operations = [
+            {'op': 'set', 'path': '/file_count', 'value': len(records)},
+            {'op': 'set', 'path': '/total_size_bytes',
+             'value': sum(record.get('size_bytes') or 0 for record in records)}
+        ]
+        if 'files' in dataset:
+            operations.append({'op': 'remove', 'path': '/files'})
+        metadata_repository.patch(dataset, operations)
+        print(f"  {dataset['name']}: {len(records)} files")
+    
+    print("Migration complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Add the normalized tags_norm array to existing datasets.
+This script will:
+1. Find datasets whose tags_norm is missing
+2. Set tags_norm to the lowercase, de-duplicated tags with a patch operation
+
+Run it once after upgrading; tag filters on /api/datasets only match datasets
+that carry tags_norm. New and edited datasets get it automatically.
+"""
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.cosmos_client import metadata_container, metadata_repository
+from app.datasets.models import DatasetModel
+from app import queries
+
+
+def main():
+    """Backfill tags_norm on every dataset that lacks it."""
+    datasets = queries.DATASETS_WITHOUT_TAGS_NORM.items(metadata_container)
+    print(f"Found {len(datasets)} datasets without tags_norm")
+    
+    for dataset in datasets:
+        metadata_repository.patch(dataset, [
+            {'op': 'set', 'path': '/tags_norm', 'value': DatasetModel.normalize_tags(dataset.get('tags'))}
+        ])
+    
+    print("Migration complete!")
+
+
+if __name__ == "__main__":
+    main()
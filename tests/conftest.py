@@ -0,0 +1,7 @@
+"""Run the catalog's modules on the local backend, in a throwaway directory"""
+import os
+import tempfile
+
+# Set before any app module is imported: the backend is chosen at import time
+os.environ['STORAGE_BACKEND'] = 'local'
+os.environ['LOCAL_STORAGE_PATH'] = tempfile.mkdtemp(prefix='catalog-tests-')
@@ -0,0 +1,46 @@
+"""Local SQLite Cosmos stand-in shared by several processes"""
+import multiprocessing
+import time
+from app.storage import local_cosmos
+from app.storage.local_cosmos import LocalCosmosClient
+
+
+def _container(path):
+    return LocalCosmosClient(path).get_database_client('catalog').get_container_client('state')
+
+
+def _increment(path, times):
+    container = _container(path)
+    for _ in range(times):
+        container.patch_item(item='counter', partition_key='counter',
+                             patch_operations=[{'op': 'incr', 'path': '/value', 'value': 1}])
+
+
+def test_patches_from_several_processes_are_not_lost(tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    _container(path).create_item({'id': 'counter', 'value': 0})
+
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_increment, args=(path, 50)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert _container(path).read_item('counter', partition_key='counter')['value'] == 200
+
+
+
+def test_documents_expire_after_their_ttl(monkeypatch):
+    container = _container(':memory:')
+    container.create_item({'id': 'session', 'ttl': 60})
+    container.create_item({'id': 'counter', 'ttl': -1})
+    container.create_item({'id': 'marker'})
+
+    now = time.time() + 61
+    monkeypatch.setattr(local_cosmos.time, 'time', lambda: now)
+    container.create_item({'id': 'session', 'ttl': 60})
+    container.upsert_item({'id': 'other'})
+
+    assert sorted(item['id'] for item in container.read_all_items()) == ['counter', 'marker', 'other', 'session']
+    assert container.read_item('session', partition_key='session')['_ts'] == int(now)
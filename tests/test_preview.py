@@ -0,0 +1,47 @@
+"""Range-read previews against local blobs with azure's ranged download semantics"""
+import pytest
+from app import utils
+from app.storage.local_blob import LocalBlobServiceClient
+
+
+@pytest.fixture
+def blob_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'PREVIEW_RANGE_BYTES', 64)
+    monkeypatch.setattr(utils, 'PREVIEW_MAX_RANGE_BYTES', 1024)
+    service = LocalBlobServiceClient(str(tmp_path))
+    service.create_container('datasets')
+    return service.get_blob_client(container='datasets', blob='rows.csv')
+
+
+def test_ranged_download_reports_range_and_total(blob_client):
+    blob_client.upload_blob(b'0123456789')
+
+    downloader = blob_client.download_blob(offset=2, length=4)
+
+    assert downloader.readall() == b'2345'
+    assert downloader.properties.size == 4
+    assert downloader.properties.content_range == 'bytes 2-5/10'
+
+
+def test_large_csv_preview_reads_a_trimmed_range(blob_client):
+    content = 'id,name\n' + ''.join(f'{i},name-{i}\n' for i in range(1000))
+    blob_client.upload_blob(content.encode())
+
+    preview = utils._build_preview(blob_client, 'rows.csv')
+
+    assert preview['type'] == 'csv'
+    assert preview['partial'] is True
+    assert preview['row_count'] is None
+    assert preview['size_bytes'] == len(content)
+    assert preview['column_info']['names'] == ['id', 'name']
+
+
+def test_small_csv_preview_is_complete(blob_client):
+    content = 'id,name\n1,a\n2,b\n'
+    blob_client.upload_blob(content.encode())
+
+    preview = utils._build_preview(blob_client, 'rows.csv')
+
+    assert preview['partial'] is False
+    assert preview['row_count'] == 2
+    assert preview['size_bytes'] == len(content)
@@ -0,0 +1,68 @@
+"""ContainerRepository against local containers partitioned like the deployed ones"""
+import pytest
+from app.repository import ContainerRepository
+from app.storage.local_cosmos import LocalCosmosClient
+
+
+class CountingContainer:
+    """Container proxy that counts fan-out queries"""
+
+    def __init__(self, container):
+        self._container = container
+        self.queries = 0
+
+    def query_items(self, *args, **kwargs):
+        self.queries += 1
+        return self._container.query_items(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._container, name)
+
+
+@pytest.fixture(params=['/type', '/base_name'])
+def container(request):
+    client = LocalCosmosClient(':memory:', partition_keys={'metadata': request.param})
+    return CountingContainer(client.get_database_client('catalog').get_container_client('metadata'))
+
+
+def test_get_uses_point_reads_after_first_lookup(container):
+    container.create_item({'id': 'd1', 'name': 'Sales', 'base_name': 'Sales'})
+    repository = ContainerRepository(container)
+
+    for _ in range(3):
+        assert repository.get('d1')['name'] == 'Sales'
+    assert container.queries == 1
+
+
+def test_created_documents_are_read_without_queries(container):
+    repository = ContainerRepository(container)
+    repository.create({'id': 'f1', 'doc_type': 'file', 'base_name': 'Sales'})
+
+    assert repository.get('f1')['doc_type'] == 'file'
+    assert container.queries == 0
+
+
+def test_patch_with_partial_document(container):
+    container.create_item({'id': 'f1', 'doc_type': 'file', 'base_name': 'Sales'})
+    repository = ContainerRepository(container)
+
+    patched = repository.patch({'id': 'f1', 'base_name': 'Sales'}, [{'op': 'set', 'path': '/profile', 'value': {}}])
+    assert patched['profile'] == {}
+    assert repository.get('f1')['profile'] == {}
+
+
+def test_unreadable_container_is_not_read_again():
+    class Unreadable:
+        id = 'metadata'
+        reads = 0
+
+        def read(self):
+            Unreadable.reads += 1
+            raise RuntimeError('no access')
+
+    repository = ContainerRepository(Unreadable())
+    assert repository.partition_key_path is None
+    assert repository.partition_key_path is None
+    assert Unreadable.reads == 1
+    with pytest.raises(ValueError):
+        repository.patch({'id': 'x'}, [])
@@ -0,0 +1,65 @@
+"""SearchIndex builds racing searches and dataset writes"""
+import threading
+import pytest
+from app.datasets.search_index import SearchIndex
+from app.storage.local_cosmos import LocalCosmosClient
+
+
+@pytest.fixture
+def container():
+    database = LocalCosmosClient(':memory:', partition_keys={'metadata': '/type'}).get_database_client('catalog')
+    container = database.get_container_client('metadata')
+    container.create_item({'id': 'd1', 'name': 'Sales', 'description': 'quarterly sales', 'tags': []})
+    return container
+
+
+class SlowSearchIndex(SearchIndex):
+    """Counts container reads and runs during() while the first one is under way"""
+
+    def __init__(self, container, during=None):
+        super().__init__(container)
+        self.during = during
+        self.reads = 0
+        self.reading = threading.Event()
+        self.proceed = threading.Event()
+
+    def _query(self, since):
+        self.reads += 1
+        documents = list(super()._query(since))
+        self.reading.set()
+        if self.during:
+            self.during()
+            self.during = None
+        self.proceed.wait(5)
+        return documents
+
+
+def test_first_build_runs_once(container):
+    index = SlowSearchIndex(container)
+    warmup = threading.Thread(target=index.refresh)
+    warmup.start()
+    index.reading.wait(5)
+    results = []
+    search = threading.Thread(target=lambda: results.append(index.search(['sales'])))
+    search.start()
+
+    index.proceed.set()
+    warmup.join()
+    search.join()
+
+    assert index.reads == 1
+    assert results == [['d1']]
+
+
+def test_writes_during_the_build_are_kept(container):
+    dataset = {'id': 'd2', 'name': 'Churn', 'description': 'monthly churn', 'tags': []}
+
+    def write():
+        container.create_item(dataset)
+        index.apply(dataset)
+
+    index = SlowSearchIndex(container, during=write)
+    index.proceed.set()
+    index.refresh()
+
+    assert index.search(['churn']) == ['d2']
@@ -0,0 +1,66 @@
+"""TagIndex rebuilds racing dataset writes from other workers"""
+import pytest
+from app.datasets.tags import TagIndex
+from app.storage.local_cosmos import LocalCosmosClient
+
+
+@pytest.fixture
+def containers():
+    database = LocalCosmosClient(':memory:', partition_keys={'metadata': '/type'}).get_database_client('catalog')
+    return database.get_container_client('catalog_state'), database.get_container_client('metadata')
+
+
+def same_shard_ids(count):
+    """Dataset ids that hash to one tag shard"""
+    ids = {}
+    for number in range(1000):
+        dataset_id = f'd{number}'
+        ids.setdefault(TagIndex._shard(dataset_id), []).append(dataset_id)
+        if len(ids[TagIndex._shard(dataset_id)]) == count:
+            return ids[TagIndex._shard(dataset_id)]
+
+
+class RacingTagIndex(TagIndex):
+    """Another worker tags a dataset between the rebuild's scan and its writes"""
+
+    def __init__(self, container, source_container, dataset_id):
+        super().__init__(container, source_container)
+        self.dataset_id = dataset_id
+
+    def _scan(self, tag=None):
+        shards = super()._scan(tag)
+        if tag is None and self.dataset_id:
+            dataset = {'id': self.dataset_id, 'name': 'Late', 'tags': ['finance'], 'tags_norm': ['finance']}
+            self.source_container.create_item(dataset)
+            TagIndex(self.container, self.source_container).apply(dataset)
+            self.dataset_id = None
+        return shards
+
+
+@pytest.mark.parametrize('existing', [False, True])
+def test_rebuild_keeps_concurrent_updates(containers, existing):
+    state, metadata = containers
+    first, late = same_shard_ids(2)
+    metadata.create_item({'id': first, 'name': 'Early', 'tags': ['finance'], 'tags_norm': ['finance']})
+    if existing:
+        # A shard document left over from before, without the marker
+        TagIndex(state, metadata)._write(TagIndex._doc_id('finance', TagIndex._shard(first)), 'finance', {first}, None)
+
+    index = RacingTagIndex(state, metadata, late)
+    index.rebuild()
+
+    assert index.datasets('finance') == sorted([first, late])
+    assert TagIndex(state, metadata).datasets('finance') == sorted([first, late])
+
+
+def test_apply_updates_counts(containers):
+    state, metadata = containers
+    index = TagIndex(state, metadata)
+    dataset = {'id': 'd1', 'tags': ['finance', 'q1']}
+    metadata.create_item(dataset)
+    index.apply(dataset)
+
+    index.apply(dict(dataset, tags=['q1']))
+
+    assert index.counts() == {'q1': 1}
+    assert TagIndex(state, metadata).counts() == {'q1': 1}
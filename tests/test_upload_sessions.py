@@ -0,0 +1,74 @@
+"""Resumable uploads on the local backend"""
+import hashlib
+import io
+import uuid
+import pytest
+from app.cosmos_client import state_container
+from app.datasets import upload_sessions
+from app.datasets.models import DatasetModel
+from app.datasets.upload_sessions import UploadSessionManager
+from app.storage.local_blob import LocalBlobClient
+from app.utils import AZURE_BLOB_CONTAINER, blob_service_client
+
+
+@pytest.fixture
+def dataset():
+    _, dataset = DatasetModel.create(f'Uploads {uuid.uuid4().hex[:8]}', 'resumable uploads', [], 'alice')
+    return dataset
+
+
+def upload(dataset, filename, body, chunk_size=1000, **kwargs):
+    session = UploadSessionManager.create(dataset, filename, 'alice', size_bytes=len(body),
+                                          chunk_size=chunk_size, **kwargs)
+    for index in range(UploadSessionManager.total_chunks(session)):
+        chunk = body[index * chunk_size:(index + 1) * chunk_size]
+        UploadSessionManager.put_chunk(session, index, io.BytesIO(chunk))
+    return UploadSessionManager.commit(UploadSessionManager.get(session['upload_id']), dataset)
+
+
+def test_commit_without_declared_hash_is_hashed_and_deduplicated(dataset):
+    body = uuid.uuid4().hex.encode() * 100
+    sha256 = hashlib.sha256(body).hexdigest()
+
+    first = upload(dataset, 'one.bin', body)
+    second = upload(dataset, 'two.bin', body)
+
+    assert first['sha256'] == second['sha256'] == sha256
+    assert second['blob_path'] == first['blob_path']
+    assert second['deduplicated'] is True
+    assert state_container.read_item(f'blob:{sha256}', f'blob:{sha256}')['refcount'] == 2
+
+
+def test_commit_rejects_a_mismatched_declared_hash(dataset):
+    with pytest.raises(ValueError):
+        upload(dataset, 'one.bin', b'x' * 2500, sha256='0' * 64)
+
+
+def test_chunks_are_staged_in_blocks(dataset, monkeypatch):
+    monkeypatch.setattr(upload_sessions, 'UPLOAD_BLOCK_SIZE', 256)
+    staged = []
+    stage_block = LocalBlobClient.stage_block
+
+    def record(self, block_id, data, **kwargs):
+        staged.append(len(data))
+        return stage_block(self, block_id, data, **kwargs)
+
+    monkeypatch.setattr(LocalBlobClient, 'stage_block', record)
+    body = bytes(range(256)) * 15
+
+    file_info = upload(dataset, 'blocks.bin', body, chunk_size=1000)
+
+    assert max(staged) == 256 and sum(staged) == len(body)
+    blob_client = blob_service_client.get_blob_client(container=AZURE_BLOB_CONTAINER, blob=file_info['blob_path'])
+    assert blob_client.download_blob().readall() == body
+    assert file_info['sha256'] == hashlib.sha256(body).hexdigest()
+
+
+def test_oversized_chunks_are_rejected(dataset, monkeypatch):
+    monkeypatch.setattr(upload_sessions, 'UPLOAD_BLOCK_SIZE', 256)
+    session = UploadSessionManager.create(dataset, 'big.bin', 'alice', chunk_size=1000)
+
+    with pytest.raises(ValueError):
+        UploadSessionManager.put_chunk(session, 0, io.BytesIO(b'x' * 1001))
+    assert UploadSessionManager.get(session['upload_id'])['chunks'] == {}
+    assert session['ttl'] > 0
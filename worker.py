@@ -0,0 +1,25 @@
+"""
+Background job worker for the Data Catalog application.
+This script will:
+1. Claim queued jobs (file profiling etc.) from the jobs container, highest priority first
+2. Run them on a pool of JOB_WORKER_PROCESSES processes, each limited to its job's timeout
+3. Retry failed jobs with exponential backoff, up to their max_attempts
+
+Run it next to the web app (python run.py); uploads are processed once it picks them up.
+"""
+import sys
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.jobs.worker import Worker
+
+
+def main():
+    """Run the worker (pass --until-idle to exit once no jobs are due)."""
+    Worker().run(until_idle='--until-idle' in sys.argv[1:])
+
+
+if __name__ == "__main__":
+    main()